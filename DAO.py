@@ -1,16 +1,211 @@
+import os
 import sqlite3
+import threading
+import zlib
 from urllib.parse import urlparse
 
+import numpy as np
+
+from postings import PostingList
+
+# Максимальное число параметров в одном запросе (SQLITE_MAX_VARIABLE_NUMBER в старых сборках = 999)
+SQL_CHUNK_SIZE = 500
+
+
+def chunks(values, size=SQL_CHUNK_SIZE):
+    """ Делит последовательность на части не длиннее size для запросов вида IN (?, ?, ...) """
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+# Журнал изменений таблицы link для инкрементального PageRank: обе вершины каждой добавленной или удаленной связи
+LINK_CHANGE_LOG_SQL = [
+    'CREATE TABLE IF NOT EXISTS linkchanges (from_url_id INTEGER, to_url_id INTEGER)',
+    '''CREATE TRIGGER IF NOT EXISTS link_insert_log AFTER INSERT ON link BEGIN
+           INSERT INTO linkchanges (from_url_id, to_url_id) VALUES (new.from_url_id, new.to_url_id);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS link_delete_log AFTER DELETE ON link BEGIN
+           INSERT INTO linkchanges (from_url_id, to_url_id) VALUES (old.from_url_id, old.to_url_id);
+       END''',
+]
+
+
+def is_without_rowid(conn, table):
+    """ True, если таблица создана как WITHOUT ROWID (схема v2, см. DBcreate.create_tables_v2) """
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    return bool(row) and 'WITHOUT ROWID' in row[0].upper()
+
+
+def has_table(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+
+def insert_returning_ids(conn, sql, rows):
+    """
+    Пакетная вставка новых строк (executemany, без commit) с получением их rowid без повторного SELECT.
+    Строки одного executemany вставляются одним соединением внутри одной транзакции и получают
+    последовательные rowid, последний из которых возвращает last_insert_rowid().
+    Запрос не должен пропускать строки (INSERT OR IGNORE) - иначе диапазон id будет неверным.
+    :return: список id в порядке rows
+    """
+    if not rows:
+        return []
+    conn.executemany(sql, rows)
+    last = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+    return list(range(last - len(rows) + 1, last + 1))
+
+
+class ConnectionManager:
+    """
+    Выдает DAO соединения с файлом БД: одно на поток и владельца (owner) и настраивает их прагмами.
+    Владелец - роль, от имени которой работают DAO (например, 'crawler' и 'searcher'): DAO одного владельца
+    в потоке видят общую транзакцию (пакетная запись краулера), а commit другого владельца в том же потоке
+    ее не затрагивает. По умолчанию включен WAL: читатели (Searcher) не блокируются пишущим краулером и наоборот.
+    Соединения владельца закрываются, когда закрыт последний использующий их DAO (acquire/release).
+    """
+
+    DEFAULT_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",     # в режиме WAL безопасно и избавляет от fsync на каждый commit
+        "cache_size": -64000,        # отрицательное значение - в КиБ (64 МБ)
+        "mmap_size": 268435456,      # 256 МБ файла БД читаются через mmap
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,        # мс ожидания блокировки вместо немедленной ошибки
+    }
+
+    def __init__(self, **pragmas):
+        self.pragmas = dict(self.DEFAULT_PRAGMAS, **pragmas)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.opened = {}       # {(путь, владелец): [соединения всех потоков]} - для release и close_all
+        self.refs = {}         # {(путь, владелец): число открытых DAO}
+        self.generations = {}  # {(путь, владелец): номер}; растет при закрытии - соединения потоков устаревают
+
+    def configure(self, **pragmas):
+        """ Меняет прагмы для новых соединений и соединений текущего потока """
+        self.pragmas.update(pragmas)
+        for conn, _ in getattr(self.local, 'connections', {}).values():
+            self._applyPragmas(conn, pragmas)
+
+    def _applyPragmas(self, conn, pragmas):
+        for name, value in pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+
+    def connection(self, db_path, owner=None):
+        """ Соединение текущего потока и владельца owner с db_path (создается при первом обращении) """
+        key = (self._key(db_path), owner)
+        connections = getattr(self.local, 'connections', None)
+        if connections is None:
+            connections = self.local.connections = {}
+        generation = self.generations.get(key, 0)
+        entry = connections.get(key)
+        if entry is not None and entry[1] == generation:
+            return entry[0]
+        # check_same_thread=False нужен только для закрытия из другого потока (release, close_all):
+        # запросы через соединение выполняет лишь создавший его поток
+        conn = sqlite3.connect(key[0], check_same_thread=False)
+        self._applyPragmas(conn, self.pragmas)
+        connections[key] = (conn, generation)
+        with self.lock:
+            self.opened.setdefault(key, []).append(conn)
+        return conn
+
+    def acquire(self, db_path, owner=None):
+        """ Учитывает DAO, использующий соединения владельца (вызывается при создании DAO) """
+        key = (self._key(db_path), owner)
+        with self.lock:
+            self.refs[key] = self.refs.get(key, 0) + 1
+
+    def release(self, db_path, owner=None):
+        """ Освобождает ссылку DAO; соединения владельца во всех потоках закрываются вместе с последней """
+        key = (self._key(db_path), owner)
+        with self.lock:
+            count = self.refs.get(key, 0) - 1
+            if count > 0:
+                self.refs[key] = count
+                return
+            self.refs.pop(key, None)
+            self.generations[key] = self.generations.get(key, 0) + 1
+            connections = self.opened.pop(key, [])
+        for conn in connections:
+            conn.close()
+
+    @staticmethod
+    def _key(db_path):
+        # Один и тот же файл под разными относительными путями - одно соединение
+        return db_path if db_path == ':memory:' else os.path.abspath(db_path)
+
+    def close(self, db_path, owner=None):
+        """ Закрывает соединение текущего потока и владельца owner """
+        entry = getattr(self.local, 'connections', {}).pop((self._key(db_path), owner), None)
+        if entry is not None:
+            with self.lock:
+                connections = self.opened.get((self._key(db_path), owner), [])
+                if entry[0] in connections:
+                    connections.remove(entry[0])
+            entry[0].close()
+
+    def close_all(self):
+        """ Закрывает соединения всех потоков и владельцев (при завершении работы) """
+        with self.lock:
+            for connections in self.opened.values():
+                for conn in connections:
+                    conn.close()
+            self.opened = {}
+        self.local = threading.local()
+
+
+# Менеджер соединений, используемый DAO по умолчанию
+connection_manager = ConnectionManager()
+
+
 class Database:
-    def __init__(self, db_path='search_engine.db'):
-        self.conn = sqlite3.connect(db_path)
-        self.cursor = self.conn.cursor()
+    def __init__(self, db_path='search_engine.db', conn=None, manager=None, owner=None):
+        """
+        :param conn: явно заданное соединение; по умолчанию соединение текущего потока берется из manager
+        :param manager: ConnectionManager (по умолчанию общий connection_manager)
+        :param owner: владелец соединения (ConnectionManager): DAO одного владельца в потоке
+                      работают в общей транзакции; None - общее соединение DAO без владельца
+        """
+        # Путь фиксируется при создании DAO, как и раньше при sqlite3.connect в конструкторе
+        self.db_path = ConnectionManager._key(db_path)
+        self.manager = manager if manager is not None else connection_manager
+        self.owner = owner
+        self._conn = conn
+        self._local = threading.local()
+        self.released = conn is not None
+        if conn is None:
+            self.manager.acquire(self.db_path, owner)
+
+    @property
+    def conn(self):
+        if self._conn is not None:
+            return self._conn
+        return self.manager.connection(self.db_path, self.owner)
+
+    @property
+    def cursor(self):
+        """ Курсор DAO в текущем потоке (пересоздается, если соединение сменилось) """
+        conn = self.conn
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None or cursor.connection is not conn:
+            cursor = self._local.cursor = conn.cursor()
+        return cursor
 
     def commit(self):
         self.conn.commit()
 
     def close(self):
-        self.conn.close()
+        """
+        Явно заданное соединение закрывается; соединение из manager - освобождается:
+        оно закроется, когда его перестанут использовать все DAO того же владельца
+        """
+        if self._conn is not None:
+            self._conn.close()
+        elif not self.released:
+            self.released = True
+            self.manager.release(self.db_path, self.owner)
 
 class PageRankDAO(Database):
     def clear_page_rank(self):
@@ -23,18 +218,11 @@ class PageRankDAO(Database):
         self.commit()
 
     def create_indexes(self):
-        self.conn.execute("DROP INDEX IF EXISTS wordidx;")
-        self.conn.execute("DROP INDEX IF EXISTS urlidx;")
-        self.conn.execute("DROP INDEX IF EXISTS wordurlidx;")
-        self.conn.execute("DROP INDEX IF EXISTS urltoidx;")
-        self.conn.execute("DROP INDEX IF EXISTS urlfromidx;")
-        self.conn.execute('CREATE INDEX IF NOT EXISTS wordidx ON wordlist(word)')
-        self.conn.execute('CREATE INDEX IF NOT EXISTS urlidx ON urllist(url)')
-        self.conn.execute('CREATE INDEX IF NOT EXISTS wordurlidx ON wordlocation(word_id)')
-        self.conn.execute('CREATE INDEX IF NOT EXISTS urltoidx ON link (to_url_id)')
-        self.conn.execute('CREATE INDEX IF NOT EXISTS urlfromidx ON link (from_url_id)')
-        self.conn.execute("DROP INDEX IF EXISTS rankurlididx;")
-        self.conn.execute('CREATE INDEX IF NOT EXISTS rankurlididx ON pagerank(url_id)')
+        """
+        Индекс таблицы pagerank (пересоздается вместе с таблицей в clear_page_rank).
+        Индексы остальных таблиц строит create_db или Crawler.endBulkLoad - здесь они не перестраиваются.
+        """
+        self.conn.execute(SECONDARY_INDEXES['rankurlididx'])
         self.commit()
 
     def initialize_page_rank(self):
@@ -58,6 +246,16 @@ class PageRankDAO(Database):
         self.cursor.execute("SELECT score FROM pagerank WHERE url_id = ?", (fromid,))
         return self.cursor.fetchone()
 
+    def get_page_ranks(self, url_ids):
+        """ Словарь {url_id: score} для набора url_id """
+        result = {}
+        cursor = self.conn.cursor()
+        for part in chunks(set(url_ids)):
+            placeholders = ', '.join('?' * len(part))
+            cursor.execute(f'SELECT url_id, score FROM pagerank WHERE url_id IN ({placeholders})', part)
+            result.update(cursor.fetchall())
+        return result
+
     def get_link_count(self, fromid):
         return self.conn.execute("""
             SELECT COUNT(*) FROM link WHERE from_url_id = ?
@@ -67,16 +265,134 @@ class PageRankDAO(Database):
         self.conn.execute('UPDATE pagerank SET score = ? WHERE url_id = ?', (pr, urlid))
         self.commit()
 
+    def ensure_link_change_log(self):
+        """ Создает журнал изменений link и триггеры, если их еще нет (для БД, созданных раньше) """
+        for sql in LINK_CHANGE_LOG_SQL:
+            self.conn.execute(sql)
+        self.commit()
+
+    def get_changed_link_urls(self):
+        """ url_id, у которых с прошлого расчета PageRank появились или пропали входящие/исходящие ссылки """
+        return [row[0] for row in self.conn.execute(
+            'SELECT from_url_id FROM linkchanges UNION SELECT to_url_id FROM linkchanges').fetchall()]
+
+    def clear_link_changes(self):
+        """ Очищает журнал изменений link (без commit) """
+        self.conn.execute('DELETE FROM linkchanges')
+
+    def update_page_ranks(self, updates, inserts):
+        """ Обновляет ранги (url_id, score) существующих строк и добавляет новые - одной транзакцией """
+        with self.conn:
+            self.conn.executemany('UPDATE pagerank SET score = ? WHERE url_id = ?',
+                                  [(score, url_id) for url_id, score in updates])
+            self.conn.executemany('INSERT INTO pagerank (url_id, score) VALUES (?, ?)', inserts)
+
+    def get_all_links(self):
+        """
+        Курсор по всем ребрам графа (from_url_id, to_url_id).
+        Ссылки на почти-дубликаты и с них относятся к каноническим страницам (url_alias, см. FingerprintDAO).
+        """
+        if not has_table(self.conn, 'url_alias'):
+            return self.conn.execute('SELECT from_url_id, to_url_id FROM link')
+        return self.conn.execute('''
+            SELECT from_id, to_id FROM (
+                SELECT COALESCE(f.canonical_id, l.from_url_id) AS from_id,
+                       COALESCE(t.canonical_id, l.to_url_id) AS to_id
+                FROM link l
+                LEFT JOIN url_alias f ON f.url_id = l.from_url_id
+                LEFT JOIN url_alias t ON t.url_id = l.to_url_id
+            ) WHERE from_id != to_id
+        ''')
+
+    def replace_page_rank(self, rows):
+        """ Заменяет содержимое pagerank строками (url_id, score) в одной транзакции """
+        with self.conn:
+            self.conn.execute('DELETE FROM pagerank')
+            self.conn.executemany('INSERT INTO pagerank (url_id, score) VALUES (?, ?)', rows)
+
+# Индексы, нужные краулеру для поиска id по значению - не удаляются даже при массовой загрузке
+LOOKUP_INDEXES = {
+    'wordidx': 'CREATE INDEX IF NOT EXISTS wordidx ON wordlist(word)',
+    'urlidx': 'CREATE INDEX IF NOT EXISTS urlidx ON urllist(url)',
+}
+
+# Вторичные индексы для поиска и PageRank - строятся один раз после массовой загрузки
+SECONDARY_INDEXES = {
+    'wordlocidx': 'CREATE INDEX IF NOT EXISTS wordlocidx ON wordlocation(word_id, url_id, location)',
+    'urltoidx': 'CREATE INDEX IF NOT EXISTS urltoidx ON link (to_url_id)',
+    'urlfromidx': 'CREATE INDEX IF NOT EXISTS urlfromidx ON link (from_url_id)',
+    # Вхождения слов в тексты ссылок по word_id (LinkWordsDAO.get_anchor_postings)
+    'linkwordidx': 'CREATE INDEX IF NOT EXISTS linkwordidx ON linkwords(word_id, link_id)',
+    'rankurlididx': 'CREATE INDEX IF NOT EXISTS rankurlididx ON pagerank(url_id)',
+}
+
+
+# DAO для управления индексами (массовая загрузка)
+class IndexDAO(Database):
+    def create_lookup_indexes(self):
+        for sql in LOOKUP_INDEXES.values():
+            self.conn.execute(sql)
+        self.commit()
+
+    def drop_secondary_indexes(self):
+        # wordurlidx - устаревший индекс по одному word_id, его покрывает wordlocidx
+        for name in list(SECONDARY_INDEXES) + ['wordurlidx']:
+            self.conn.execute(f'DROP INDEX IF EXISTS {name}')
+        self.commit()
+
+    def create_all_indexes(self):
+        clustered = is_without_rowid(self.conn, 'wordlocation')
+        for name, sql in list(LOOKUP_INDEXES.items()) + list(SECONDARY_INDEXES.items()):
+            if name == 'wordlocidx' and clustered:
+                continue  # схема v2: таблица уже упорядочена по (word_id, url_id, location)
+            self.conn.execute(sql)
+        self.commit()
+
+    def analyze(self):
+        """ Обновляет статистику планировщика запросов """
+        self.conn.execute('ANALYZE')
+        self.commit()
+
+    def set_synchronous(self, mode):
+        self.conn.execute(f'PRAGMA synchronous = {mode}')
+
+    def get_synchronous(self):
+        return self.conn.execute('PRAGMA synchronous').fetchone()[0]
+
 # DAO для таблицы urllist
 class UrlListDAO(Database):
     def add_url(self, url):
         self.cursor.execute('INSERT INTO urllist (url) VALUES (?)', (url,))
         self.commit()
 
+    def add_urls(self, urls):
+        """ Пакетная вставка новых URL без commit; возвращает их id в порядке urls """
+        return insert_returning_ids(self.conn, 'INSERT INTO urllist (url) VALUES (?)', [(url,) for url in urls])
+
+    def get_url_ids(self, urls):
+        """ Словарь {url: id} только для найденных URL """
+        result = {}
+        cursor = self.conn.cursor()
+        for part in chunks(set(urls)):
+            placeholders = ', '.join('?' * len(part))
+            cursor.execute(f'SELECT url, id FROM urllist WHERE url IN ({placeholders})', part)
+            result.update(cursor.fetchall())
+        return result
+
     def get_url(self, url_id):
         self.cursor.execute('SELECT * FROM urllist WHERE id = ?', (url_id,))
         return self.cursor.fetchone()
 
+    def get_urls(self, url_ids):
+        """ Словарь {id: (id, url)} для набора id """
+        result = {}
+        cursor = self.conn.cursor()
+        for part in chunks(set(url_ids)):
+            placeholders = ', '.join('?' * len(part))
+            cursor.execute(f'SELECT * FROM urllist WHERE id IN ({placeholders})', part)
+            result.update((row[0], row) for row in cursor.fetchall())
+        return result
+
     def get_all_urls(self):
         self.cursor.execute('SELECT * FROM urllist')
         return self.cursor.fetchall()
@@ -114,6 +430,12 @@ class UrlListDAO(Database):
             return result[0]  # Возвращаем id, если URL найден
         return None  # Возвращаем None, если URL не найден
 
+    def get_urls_with_ids(self, limit):
+        """ Возвращает до limit пар (url, id) для прогрева кэша """
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT url, id FROM urllist ORDER BY id LIMIT ?", (limit,))
+        return cursor.fetchall()
+
 # DAO для таблицы wordlist
 class WordListDAO(Database):
     def add_word(self, word, is_filtered=False):
@@ -121,6 +443,42 @@ class WordListDAO(Database):
         self.commit()
         return self.cursor.lastrowid
 
+    def add_words(self, words, is_filtered=False):
+        """
+        Пакетная вставка новых слов без commit (commit выполняет вызывающий код).
+        :return: id добавленных слов в порядке words
+        """
+        return insert_returning_ids(self.conn, 'INSERT INTO wordlist (word, isFiltered) VALUES (?, ?)',
+                                    [(word, is_filtered) for word in words])
+
+    def get_word_ids(self, words):
+        """
+        Получение идентификаторов сразу для набора слов.
+        :param words: итерируемый набор слов
+        :return: словарь {слово: id} только для найденных слов
+        """
+        result = {}
+        for part in chunks(set(words)):
+            placeholders = ', '.join('?' * len(part))
+            self.cursor.execute(f'SELECT word, id FROM wordlist WHERE word IN ({placeholders})', part)
+            result.update(self.cursor.fetchall())
+        return result
+
+    def get_words_with_ids(self, limit):
+        """ Возвращает до limit пар (word, id) для прогрева кэша """
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT word, id FROM wordlist ORDER BY id LIMIT ?", (limit,))
+        return cursor.fetchall()
+
+    def get_words(self, word_ids):
+        """ Словарь {id: слово} для набора id """
+        result = {}
+        for part in chunks(set(word_ids)):
+            placeholders = ', '.join('?' * len(part))
+            result.update(self.conn.execute(
+                f'SELECT id, word FROM wordlist WHERE id IN ({placeholders})', part).fetchall())
+        return result
+
     def get_word(self, word_id):
         self.cursor.execute('SELECT * FROM wordlist WHERE id = ?', (word_id,))
         return self.cursor.fetchone()
@@ -165,14 +523,28 @@ class WordListDAO(Database):
 # DAO для таблицы wordlocation
 class WordLocationDAO(Database):
     def add_word_location(self, word_id, url_id, location):
-        self.cursor.execute('INSERT INTO wordlocation (word_id, url_id, location) VALUES (?, ?, ?)',
+        self.cursor.execute('INSERT OR IGNORE INTO wordlocation (word_id, url_id, location) VALUES (?, ?, ?)',
                             (word_id, url_id, location))
         self.commit()
 
+    def add_word_locations(self, rows):
+        """ Пакетная вставка строк (word_id, url_id, location) без commit """
+        self.cursor.executemany('INSERT OR IGNORE INTO wordlocation (word_id, url_id, location) VALUES (?, ?, ?)',
+                                rows)
+
     def get_word_locations(self, word_id, url_id):
         self.cursor.execute('SELECT * FROM wordlocation WHERE word_id = ? AND url_id = ?', (word_id, url_id))
         return self.cursor.fetchall()
 
+    def get_positions(self, word_id, url_id):
+        """ Отсортированные позиции слова на странице """
+        return [row[0] for row in self.conn.execute(
+            'SELECT location FROM wordlocation WHERE word_id = ? AND url_id = ? ORDER BY location', (word_id, url_id))]
+
+    def delete_url_locations(self, url_id):
+        """ Удаляет вхождения слов страницы без commit (перед повторной индексацией); возвращает число строк """
+        return self.conn.execute('DELETE FROM wordlocation WHERE url_id = ?', (url_id,)).rowcount
+
     def get_word_locations_by_url(self, url_id):
         cursor = self.conn.cursor()
         cursor.execute('''
@@ -181,12 +553,13 @@ class WordLocationDAO(Database):
         return cursor.fetchall()
 
     def get_words_by_url(self, url_id):
-        # Получаем все слова, связанные с данным url_id
+        # Получаем все слова, связанные с данным url_id, в порядке следования на странице
         self.cursor.execute('''
-               SELECT w.word 
+               SELECT w.word
                FROM wordlist w
                JOIN wordlocation wl ON w.id = wl.word_id
                WHERE wl.url_id = ?
+               ORDER BY wl.location
            ''', (url_id,))
         return [row[0] for row in self.cursor.fetchall()]  # Возвращаем список слов
 
@@ -238,6 +611,25 @@ class WordLocationDAO(Database):
         # Выполнение SQL-запроса с передачей идентификаторов слов в качестве параметров
         return self.execute_sql(sqlFullQuery, tuple(wordsidList))
 
+    def get_postings(self, word_id):
+        """ Список вхождений слова (PostingList), отсортированный по url_id и позиции """
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT url_id, location FROM wordlocation WHERE word_id = ? ORDER BY url_id, location',
+                       (word_id,))
+        return PostingList.from_rows(cursor)
+
+    def iter_all_locations(self):
+        """ Курсор по всем строкам (word_id, url_id, location), отсортированным для построения индекса """
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT word_id, url_id, location FROM wordlocation ORDER BY word_id, url_id, location')
+        return cursor
+
+    def iter_locations_by_url(self):
+        """ Курсор по всем строкам (url_id, word_id, location), сгруппированным по документам """
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT url_id, word_id, location FROM wordlocation ORDER BY url_id, word_id, location')
+        return cursor
+
     def execute_sql(self, sql_query, params=()):
         """ Выполняет SQL-запрос с параметрами и возвращает все результаты """
         cursor = self.conn.cursor()
@@ -246,9 +638,28 @@ class WordLocationDAO(Database):
 
 # DAO для таблицы link
 class LinkDAO(Database):
+    def delete_links_from(self, from_url_id):
+        """ Удаляет исходящие ссылки страницы и слова их текста без commit; возвращает число удаленных ссылок """
+        self.conn.execute('DELETE FROM linkwords WHERE link_id IN (SELECT id FROM link WHERE from_url_id = ?)',
+                          (from_url_id,))
+        return self.conn.execute('DELETE FROM link WHERE from_url_id = ?', (from_url_id,)).rowcount
+
     def add_link(self, from_url_id, to_url_id):
-        self.cursor.execute('INSERT INTO link (from_url_id, to_url_id) VALUES (?, ?)', (from_url_id, to_url_id))
+        # OR IGNORE: в схеме v2 пара (from_url_id, to_url_id) уникальна
+        self.cursor.execute('INSERT OR IGNORE INTO link (from_url_id, to_url_id) VALUES (?, ?)',
+                            (from_url_id, to_url_id))
         self.commit()
+        return self.cursor.rowcount
+
+    def add_links(self, from_url_id, to_url_ids):
+        """ Пакетная вставка новых связей страницы без commit; возвращает их id в порядке to_url_ids """
+        return insert_returning_ids(self.conn, 'INSERT INTO link (from_url_id, to_url_id) VALUES (?, ?)',
+                                    [(from_url_id, to_url_id) for to_url_id in to_url_ids])
+
+    def get_link_ids(self, from_url_id):
+        """ Словарь {to_url_id: id связи} для исходящих ссылок страницы """
+        return dict(self.conn.execute('SELECT to_url_id, id FROM link WHERE from_url_id = ?',
+                                      (from_url_id,)).fetchall())
 
     def get_links(self):
         self.cursor.execute('SELECT * FROM link')
@@ -272,9 +683,442 @@ class LinkDAO(Database):
 # DAO для таблицы linkwords
 class LinkWordsDAO(Database):
     def add_link_word(self, word_id, link_id):
-        self.cursor.execute('INSERT INTO linkwords (word_id, link_id) VALUES (?, ?)', (word_id, link_id))
+        self.cursor.execute('INSERT OR IGNORE INTO linkwords (word_id, link_id) VALUES (?, ?)', (word_id, link_id))
         self.commit()
 
+    def add_link_words(self, rows):
+        """ Пакетная вставка строк (word_id, link_id) без commit """
+        self.conn.executemany('INSERT OR IGNORE INTO linkwords (word_id, link_id) VALUES (?, ?)', rows)
+
+    def get_anchor_postings(self, word_id):
+        """
+        Вхождения слова в тексты ссылок - отдельное от текста страниц поле индекса.
+        :return: словарь {to_url_id: число ссылок на страницу, в тексте которых есть слово}
+        """
+        return dict(self.conn.execute('''
+            SELECT l.to_url_id, COUNT(*) FROM linkwords lw
+            JOIN link l ON l.id = lw.link_id
+            WHERE lw.word_id = ?
+            GROUP BY l.to_url_id
+        ''', (word_id,)).fetchall())
+
     def get_link_words(self):
         self.cursor.execute('SELECT * FROM linkwords')
         return self.cursor.fetchall()
+
+
+# DAO для служебной таблицы meta
+class MetaDAO(Database):
+    def __init__(self, db_path='search_engine.db', conn=None, manager=None, owner=None):
+        super().__init__(db_path, conn, manager, owner)
+        # Таблица может отсутствовать в БД, созданных до ее появления
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)')
+        self.commit()
+
+    def get_value(self, key, default=None):
+        cursor = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,))
+        result = cursor.fetchone()
+        return result[0] if result else default
+
+    def set_value(self, key, value):
+        """ Записывает значение без commit """
+        self.conn.execute('INSERT INTO meta (key, value) VALUES (?, ?) '
+                          'ON CONFLICT(key) DO UPDATE SET value = excluded.value', (key, value))
+
+    def get_generation(self):
+        """ Поколение индекса: увеличивается при каждом изменении проиндексированных данных или PageRank """
+        return self.get_value('index_generation', 0)
+
+    def bump_generation(self):
+        """ Увеличивает поколение индекса без commit (фиксируется вместе с изменениями данных) """
+        self.conn.execute("INSERT INTO meta (key, value) VALUES ('index_generation', 1) "
+                          "ON CONFLICT(key) DO UPDATE SET value = value + 1")
+
+
+# SQL таблиц отпечатков страниц и псевдонимов почти-дубликатов
+FINGERPRINT_SQL = [
+    'CREATE TABLE IF NOT EXISTS fingerprint (url_id INTEGER PRIMARY KEY, simhash INTEGER)',
+    'CREATE TABLE IF NOT EXISTS url_alias (url_id INTEGER PRIMARY KEY, canonical_id INTEGER, distance INTEGER)',
+]
+
+
+# DAO для отпечатков SimHash и псевдонимов почти-дубликатов
+class FingerprintDAO(Database):
+    def __init__(self, db_path='search_engine.db', conn=None, manager=None, owner=None):
+        super().__init__(db_path, conn, manager, owner)
+        # Таблицы могут отсутствовать в БД, созданных до их появления
+        for sql in FINGERPRINT_SQL:
+            self.conn.execute(sql)
+        self.commit()
+
+    def add_fingerprint(self, url_id, simhash):
+        """ Сохраняет отпечаток (знаковое 64-битное, см. simhash.to_signed) без commit """
+        self.conn.execute('INSERT OR REPLACE INTO fingerprint (url_id, simhash) VALUES (?, ?)', (url_id, simhash))
+
+    def get_all_fingerprints(self):
+        return self.conn.execute('SELECT url_id, simhash FROM fingerprint').fetchall()
+
+    def add_alias(self, url_id, canonical_id, distance):
+        """
+        Помечает url_id как почти-дубликат canonical_id (без commit).
+        Обе страницы попадают в журнал linkchanges: ссылки на дубликат теперь учитываются у канонической страницы.
+        """
+        self.conn.execute('INSERT OR REPLACE INTO url_alias (url_id, canonical_id, distance) VALUES (?, ?, ?)',
+                          (url_id, canonical_id, distance))
+        if has_table(self.conn, 'linkchanges'):
+            self.conn.execute('INSERT INTO linkchanges (from_url_id, to_url_id) VALUES (?, ?)', (url_id, canonical_id))
+
+    def remove_alias(self, url_id):
+        """ Снимает пометку почти-дубликата (без commit); как и в add_alias, обе страницы попадают в linkchanges """
+        row = self.conn.execute('SELECT canonical_id FROM url_alias WHERE url_id = ?', (url_id,)).fetchone()
+        if row is None:
+            return
+        self.conn.execute('DELETE FROM url_alias WHERE url_id = ?', (url_id,))
+        if has_table(self.conn, 'linkchanges'):
+            self.conn.execute('INSERT INTO linkchanges (from_url_id, to_url_id) VALUES (?, ?)', (url_id, row[0]))
+
+    def get_aliases(self):
+        """ Словарь {url_id дубликата: url_id канонической страницы} """
+        return dict(self.conn.execute('SELECT url_id, canonical_id FROM url_alias').fetchall())
+
+    def get_canonical(self, url_id):
+        row = self.conn.execute('SELECT canonical_id FROM url_alias WHERE url_id = ?', (url_id,)).fetchone()
+        return row[0] if row else url_id
+
+
+# SQL таблицы состояния загрузки страниц (повторный обход, Crawler.recrawl)
+FETCH_STATE_SQL = [
+    '''CREATE TABLE IF NOT EXISTS fetchstate (
+           url_id INTEGER PRIMARY KEY,
+           etag TEXT,
+           last_modified TEXT,
+           content_hash TEXT,
+           fetched_at REAL,
+           next_due REAL,
+           interval REAL,
+           checks INTEGER DEFAULT 0,
+           changes INTEGER DEFAULT 0
+       )''',
+    'CREATE INDEX IF NOT EXISTS fetchdueidx ON fetchstate (next_due)',
+]
+
+
+# DAO для состояния загрузки страниц: валидаторы HTTP, хэш содержимого и расписание повторного обхода
+class FetchStateDAO(Database):
+    def __init__(self, db_path='search_engine.db', conn=None, manager=None, owner=None):
+        super().__init__(db_path, conn, manager, owner)
+        # Таблица может отсутствовать в БД, созданных до ее появления
+        for sql in FETCH_STATE_SQL:
+            self.conn.execute(sql)
+        self.commit()
+
+    def record_fetch(self, url_id, etag, last_modified, content_hash, fetched_at, interval):
+        """
+        Первая загрузка страницы обычным обходом (без commit). Если состояние уже есть, оно не меняется:
+        дальше его ведет повторный обход, иначе новый хэш скрыл бы от него неучтенные изменения.
+        """
+        self.conn.execute('''
+            INSERT OR IGNORE INTO fetchstate (url_id, etag, last_modified, content_hash, fetched_at, next_due, interval)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (url_id, etag, last_modified, content_hash, fetched_at, fetched_at + interval, interval))
+
+    def get_state(self, url_id):
+        cursor = self.conn.execute('''
+            SELECT etag, last_modified, content_hash, fetched_at, next_due, interval, checks, changes
+            FROM fetchstate WHERE url_id = ?
+        ''', (url_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip(('etag', 'last_modified', 'content_hash', 'fetched_at', 'next_due', 'interval',
+                         'checks', 'changes'), row))
+
+    def save_state(self, url_id, state):
+        """ Сохраняет состояние из get_state (словарь) без commit """
+        self.conn.execute('''
+            INSERT OR REPLACE INTO fetchstate
+                (url_id, etag, last_modified, content_hash, fetched_at, next_due, interval, checks, changes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (url_id, state['etag'], state['last_modified'], state['content_hash'], state['fetched_at'],
+              state['next_due'], state['interval'], state['checks'], state['changes']))
+
+    def get_due_urls(self, now, limit=None):
+        """ Страницы, срок проверки которых наступил: [(url_id, url), ...] в порядке next_due """
+        return self.conn.execute('''
+            SELECT f.url_id, u.url FROM fetchstate f JOIN urllist u ON u.id = f.url_id
+            WHERE f.next_due <= ? ORDER BY f.next_due LIMIT ?
+        ''', (now, -1 if limit is None else limit)).fetchall()
+
+
+# Состояния URL в очереди обхода (frontier.state)
+FRONTIER_QUEUED, FRONTIER_ACTIVE, FRONTIER_DONE, FRONTIER_FAILED = range(4)
+
+# SQL таблицы очереди обхода (frontier.Frontier)
+FRONTIER_SQL = [
+    '''CREATE TABLE IF NOT EXISTS frontier (
+           url TEXT PRIMARY KEY,
+           host TEXT,
+           depth INTEGER,
+           priority REAL DEFAULT 0,
+           state INTEGER DEFAULT 0
+       )''',
+    'CREATE INDEX IF NOT EXISTS frontierstateidx ON frontier (state, host, depth, priority)',
+]
+
+
+# DAO для очереди обхода: множество встреченных URL и их состояние
+class FrontierDAO(Database):
+    def __init__(self, db_path='search_engine.db', conn=None, manager=None, owner=None):
+        super().__init__(db_path, conn, manager, owner)
+        # Таблица может отсутствовать в БД, созданных до ее появления
+        for sql in FRONTIER_SQL:
+            self.conn.execute(sql)
+        self.commit()
+
+    def add_urls(self, rows):
+        """ Добавляет новые URL (url, host, depth, priority) без commit; уже встреченные игнорируются """
+        self.conn.executemany('''
+            INSERT OR IGNORE INTO frontier (url, host, depth, priority, state) VALUES (?, ?, ?, ?, 0)
+        ''', rows)
+
+    def get_seen(self, urls):
+        """ Какие из urls уже есть в очереди (в любом состоянии) """
+        seen = set()
+        for chunk in chunks(list(urls), SQL_CHUNK_SIZE):
+            placeholders = ', '.join('?' * len(chunk))
+            seen.update(row[0] for row in self.conn.execute(
+                f'SELECT url FROM frontier WHERE url IN ({placeholders})', chunk))
+        return seen
+
+    def iter_urls(self):
+        """ Курсор по всем встреченным URL (для восстановления фильтра Блума) """
+        return self.conn.execute('SELECT url FROM frontier')
+
+    def take_batch(self, limit, maxDepth=None):
+        """
+        Выбирает до limit URL из очереди и помечает их как обрабатываемые (без commit).
+        Хосты чередуются: сначала по одному лучшему URL каждого хоста, затем по второму и т.д.;
+        внутри хоста - меньшая глубина, затем больший приоритет.
+        :return: [(url, depth), ...]
+        """
+        rows = self.conn.execute('''
+            SELECT url, depth FROM (
+                SELECT url, depth, priority,
+                       ROW_NUMBER() OVER (PARTITION BY host ORDER BY depth, priority DESC, rowid) AS turn
+                FROM frontier WHERE state = ? AND (? IS NULL OR depth < ?)
+            ) ORDER BY turn, depth, priority DESC LIMIT ?
+        ''', (FRONTIER_QUEUED, maxDepth, maxDepth, limit)).fetchall()
+        self.set_state([url for url, _ in rows], FRONTIER_ACTIVE)
+        return rows
+
+    def set_state(self, urls, state):
+        """ Меняет состояние URL без commit """
+        self.conn.executemany('UPDATE frontier SET state = ? WHERE url = ?', [(state, url) for url in urls])
+
+    def requeue_active(self):
+        """ Возвращает в очередь URL, обработка которых прервалась (без commit); возвращает их число """
+        return self.conn.execute('UPDATE frontier SET state = ? WHERE state = ?',
+                                 (FRONTIER_QUEUED, FRONTIER_ACTIVE)).rowcount
+
+    def get_counts(self):
+        """ Число URL в каждом состоянии: {состояние: число} """
+        return dict(self.conn.execute('SELECT state, COUNT(*) FROM frontier GROUP BY state').fetchall())
+
+    def clear(self):
+        self.conn.execute('DELETE FROM frontier')
+        self.commit()
+
+
+# SQL таблиц статистики корпуса для BM25/tf-idf: длина документа, документная частота слова (df)
+# и частота слова в документе (tf). Число документов и их суммарная длина хранятся в meta
+TERM_STATS_SQL = [
+    'CREATE TABLE IF NOT EXISTS doclength (url_id INTEGER PRIMARY KEY, length INTEGER)',
+    'CREATE TABLE IF NOT EXISTS termstats (word_id INTEGER PRIMARY KEY, df INTEGER)',
+    '''CREATE TABLE IF NOT EXISTS termfreq (
+           word_id INTEGER,
+           url_id INTEGER,
+           tf INTEGER,
+           PRIMARY KEY (word_id, url_id)
+       ) WITHOUT ROWID''',
+    'CREATE INDEX IF NOT EXISTS termfrequrlidx ON termfreq (url_id)',
+]
+
+
+# DAO для статистики корпуса: ведется при индексации, при поиске читаются только строки слов запроса
+class TermStatsDAO(Database):
+    def __init__(self, db_path='search_engine.db', conn=None, manager=None, owner=None):
+        super().__init__(db_path, conn, manager, owner)
+        # Таблицы могут отсутствовать в БД, созданных до их появления (заполнить их можно через rebuild)
+        for sql in TERM_STATS_SQL:
+            self.conn.execute(sql)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)')
+        self.commit()
+
+    def add_document(self, url_id, length, term_freqs):
+        """
+        Статистика новой страницы без commit.
+        :param length: число слов страницы
+        :param term_freqs: словарь {word_id: число вхождений на странице}
+        """
+        self.conn.execute('INSERT INTO doclength (url_id, length) VALUES (?, ?)', (url_id, length))
+        word_ids = sorted(term_freqs)
+        self.conn.executemany('INSERT INTO termfreq (word_id, url_id, tf) VALUES (?, ?, ?)',
+                              [(word_id, url_id, term_freqs[word_id]) for word_id in word_ids])
+        self.conn.executemany('INSERT INTO termstats (word_id, df) VALUES (?, 1) '
+                              'ON CONFLICT(word_id) DO UPDATE SET df = df + 1', [(word_id,) for word_id in word_ids])
+        self._add_totals(1, length)
+
+    def has_document(self, url_id):
+        """
+        Проиндексирована ли страница (есть ли у нее строка doclength) - запрос по первичному ключу.
+        В БД, проиндексированных до появления doclength, таблицу нужно сначала заполнить (rebuild).
+        """
+        return self.conn.execute('SELECT 1 FROM doclength WHERE url_id = ?', (url_id,)).fetchone() is not None
+
+    def delete_document(self, url_id):
+        """ Удаляет статистику страницы без commit (перед повторной индексацией) """
+        row = self.conn.execute('SELECT length FROM doclength WHERE url_id = ?', (url_id,)).fetchone()
+        if row is None:
+            return
+        self.conn.execute('UPDATE termstats SET df = df - 1 '
+                          'WHERE word_id IN (SELECT word_id FROM termfreq WHERE url_id = ?)', (url_id,))
+        self.conn.execute('DELETE FROM termstats WHERE df <= 0 '
+                          'AND word_id IN (SELECT word_id FROM termfreq WHERE url_id = ?)', (url_id,))
+        self.conn.execute('DELETE FROM termfreq WHERE url_id = ?', (url_id,))
+        self.conn.execute('DELETE FROM doclength WHERE url_id = ?', (url_id,))
+        self._add_totals(-1, -row[0])
+
+    def _add_totals(self, docs, length):
+        self.conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?) "
+                              "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+                              [('doc_count', docs), ('total_length', length)])
+
+    def get_corpus_stats(self):
+        """ (число документов, средняя длина документа) """
+        totals = dict(self.conn.execute("SELECT key, value FROM meta WHERE key IN ('doc_count', 'total_length')"))
+        doc_count = totals.get('doc_count', 0)
+        return doc_count, totals.get('total_length', 0) / doc_count if doc_count else 0.0
+
+    def get_doc_freqs(self, word_ids):
+        """ Словарь {word_id: df} для набора слов """
+        result = {}
+        for part in chunks(set(word_ids)):
+            placeholders = ', '.join('?' * len(part))
+            result.update(self.conn.execute(
+                f'SELECT word_id, df FROM termstats WHERE word_id IN ({placeholders})', part).fetchall())
+        return result
+
+    def get_term_postings(self, word_id):
+        """ Частоты слова по документам: {url_id: tf} """
+        return dict(self.conn.execute('SELECT url_id, tf FROM termfreq WHERE word_id = ?', (word_id,)).fetchall())
+
+    def get_doc_lengths(self, url_ids):
+        """ Словарь {url_id: длина} для набора документов """
+        result = {}
+        for part in chunks(set(url_ids)):
+            placeholders = ', '.join('?' * len(part))
+            result.update(self.conn.execute(
+                f'SELECT url_id, length FROM doclength WHERE url_id IN ({placeholders})', part).fetchall())
+        return result
+
+    def rebuild(self):
+        """
+        Пересчитывает статистику по wordlocation - для БД, проиндексированных до появления этих таблиц.
+        Страницы, у которых нет строк в wordlocation (пустые или записанные только в сегменты), не учитываются.
+        """
+        with self.conn:
+            for table in ('termfreq', 'doclength', 'termstats'):
+                self.conn.execute(f'DELETE FROM {table}')
+            self.conn.execute('INSERT INTO termfreq (word_id, url_id, tf) '
+                              'SELECT word_id, url_id, COUNT(*) FROM wordlocation GROUP BY word_id, url_id')
+            self.conn.execute('INSERT INTO doclength (url_id, length) '
+                              'SELECT url_id, SUM(tf) FROM termfreq GROUP BY url_id')
+            self.conn.execute('INSERT INTO termstats (word_id, df) '
+                              'SELECT word_id, COUNT(*) FROM termfreq GROUP BY word_id')
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) "
+                              "SELECT 'doc_count', COUNT(*) FROM doclength UNION ALL "
+                              "SELECT 'total_length', COALESCE(SUM(length), 0) FROM doclength")
+
+
+# SQL прямого индекса: последовательность id слов каждой страницы (массив uint32, при compressed = 1 - сжатый zlib)
+FORWARD_INDEX_SQL = [
+    '''CREATE TABLE IF NOT EXISTS forwardindex (
+           url_id INTEGER PRIMARY KEY,
+           length INTEGER,
+           compressed INTEGER,
+           tokens BLOB
+       )''',
+]
+# Формат элемента массива id слов в forwardindex.tokens
+TOKEN_DTYPE = np.dtype('<u4')
+
+
+# DAO для прямого индекса: текст страницы в виде id слов, для фрагментов (сниппетов) результатов поиска
+class ForwardIndexDAO(Database):
+    def __init__(self, db_path='search_engine.db', conn=None, manager=None, owner=None):
+        super().__init__(db_path, conn, manager, owner)
+        # Таблица может отсутствовать в БД, созданных до ее появления (заполнить ее можно через rebuild)
+        for sql in FORWARD_INDEX_SQL:
+            self.conn.execute(sql)
+        self.commit()
+
+    def add_document(self, url_id, word_ids, compress=False):
+        """
+        Записывает id слов страницы в порядке следования без commit (прежняя запись заменяется).
+        :param compress: сжать zlib - меньше места, но чтение участка требует распаковки всей страницы
+        """
+        data = np.asarray(word_ids, dtype=TOKEN_DTYPE).tobytes()
+        if compress:
+            data = zlib.compress(data)
+        self.conn.execute('INSERT OR REPLACE INTO forwardindex (url_id, length, compressed, tokens) '
+                          'VALUES (?, ?, ?, ?)', (url_id, len(word_ids), int(compress), data))
+
+    def delete_document(self, url_id):
+        self.conn.execute('DELETE FROM forwardindex WHERE url_id = ?', (url_id,))
+
+    def get_length(self, url_id):
+        """ Число слов страницы или None, если ее нет в прямом индексе """
+        row = self.conn.execute('SELECT length FROM forwardindex WHERE url_id = ?', (url_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_tokens(self, url_id, start=0, end=None):
+        """
+        id слов страницы с позиции start до end (не включая).
+        Несжатая запись читается по частям (blobopen): с диска берется только нужный участок.
+        :return: список id или None, если страницы нет в прямом индексе
+        """
+        row = self.conn.execute('SELECT length, compressed FROM forwardindex WHERE url_id = ?', (url_id,)).fetchone()
+        if row is None:
+            return None
+        length, compressed = row
+        start = max(0, start)
+        end = length if end is None else min(end, length)
+        if end <= start:
+            return []
+        if compressed:
+            data = self.conn.execute('SELECT tokens FROM forwardindex WHERE url_id = ?', (url_id,)).fetchone()[0]
+            return np.frombuffer(zlib.decompress(data), dtype=TOKEN_DTYPE)[start:end].tolist()
+        with self.conn.blobopen('forwardindex', 'tokens', url_id, readonly=True) as blob:
+            blob.seek(start * TOKEN_DTYPE.itemsize)
+            data = blob.read((end - start) * TOKEN_DTYPE.itemsize)
+        return np.frombuffer(data, dtype=TOKEN_DTYPE).tolist()
+
+    def get_size(self):
+        """ (число страниц, байт в прямом индексе) """
+        return self.conn.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(tokens)), 0) FROM forwardindex').fetchone()
+
+    def rebuild(self, compress=False):
+        """ Заполняет прямой индекс по wordlocation - для БД, проиндексированных до его появления """
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT url_id, word_id FROM wordlocation ORDER BY url_id, location')
+        with self.conn:
+            self.conn.execute('DELETE FROM forwardindex')
+            url_id, word_ids = None, []
+            for row_url_id, word_id in cursor:
+                if row_url_id != url_id:
+                    if word_ids:
+                        self.add_document(url_id, word_ids, compress)
+                    url_id, word_ids = row_url_id, []
+                word_ids.append(word_id)
+            if word_ids:
+                self.add_document(url_id, word_ids, compress)
@@ -1,9 +1,87 @@
 import sqlite3
+from DAO import LINK_CHANGE_LOG_SQL, FINGERPRINT_SQL, FETCH_STATE_SQL, FRONTIER_SQL, TERM_STATS_SQL, \
+    FORWARD_INDEX_SQL, LOOKUP_INDEXES, SECONDARY_INDEXES, is_without_rowid
 
-def create_db():
-    conn = sqlite3.connect('search_engine.db')
+def create_tables_v2(cursor, suffix=''):
+    """
+    Компактная схема v2: без суррогатных AUTOINCREMENT-ключей, wordlocation и linkwords хранятся
+    кластеризованно по первичному ключу (WITHOUT ROWID), слова и URL уникальны, связи не повторяются.
+    :param suffix: суффикс имен таблиц (используется при миграции, см. migrate.py)
+    """
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS urllist{suffix} (
+        id INTEGER PRIMARY KEY,
+        url TEXT UNIQUE
+    )
+    ''')
+
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS wordlist{suffix} (
+        id INTEGER PRIMARY KEY,
+        word TEXT UNIQUE,
+        isFiltered BOOLEAN
+    )
+    ''')
+
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS wordlocation{suffix} (
+        word_id INTEGER,
+        url_id INTEGER,
+        location INTEGER,
+        PRIMARY KEY (word_id, url_id, location)
+    ) WITHOUT ROWID
+    ''')
+
+    # id связи остается: на него ссылается linkwords
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS link{suffix} (
+        id INTEGER PRIMARY KEY,
+        from_url_id INTEGER,
+        to_url_id INTEGER,
+        UNIQUE (from_url_id, to_url_id)
+    )
+    ''')
+
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS linkwords{suffix} (
+        word_id INTEGER,
+        link_id INTEGER,
+        PRIMARY KEY (link_id, word_id)
+    ) WITHOUT ROWID
+    ''')
+
+
+def create_db(db_path='search_engine.db', version=1):
+    """
+    Создает таблицы БД.
+    :param version: 1 - исходная схема, 2 - компактная схема (create_tables_v2)
+    """
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
+    if version == 2:
+        create_tables_v2(cursor)
+    else:
+        create_tables_v1(cursor)
+
+    create_service_tables(cursor)
+
+    # Индексы строятся сразу, пока таблицы пусты: обычный обход поддерживает их по мере вставки,
+    # массовая загрузка (Crawler.bulkLoad) удаляет вторичные индексы и строит их один раз в конце
+    # Схема определяется по самой таблице, а не по version: create_db вызывается с version=1 и для БД,
+    # уже переведенных на v2 (migrate.py)
+    clustered = is_without_rowid(conn, 'wordlocation')
+    for name, sql in list(LOOKUP_INDEXES.items()) + list(SECONDARY_INDEXES.items()):
+        if name == 'wordlocidx' and clustered:
+            continue  # схема v2: wordlocation уже упорядочена по (word_id, url_id, location)
+        cursor.execute(sql)
+    cursor.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('schema_version', ?)", (version,))
+
+    conn.commit()
+    conn.close()
+
+
+def create_tables_v1(cursor):
     # Таблица URL
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS urllist (
@@ -55,7 +133,47 @@ def create_db():
     )
     ''')
 
-    conn.commit()
-    conn.close()
+
+def create_service_tables(cursor):
+    # Таблица PageRank (пересоздается в PageRankDAO.clear_page_rank)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS pagerank (
+        row_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        url_id INTEGER,
+        score REAL
+    )
+    ''')
+
+    # Журнал изменений link для инкрементального PageRank
+    for sql in LINK_CHANGE_LOG_SQL:
+        cursor.execute(sql)
+
+    # Отпечатки SimHash и псевдонимы почти-дубликатов (Crawler(dedupe=True))
+    for sql in FINGERPRINT_SQL:
+        cursor.execute(sql)
+
+    # Состояние загрузки страниц для повторного обхода (Crawler.recrawl)
+    for sql in FETCH_STATE_SQL:
+        cursor.execute(sql)
+
+    # Сохраняемая очередь обхода (frontier.Frontier, Crawler.crawlFrontier)
+    for sql in FRONTIER_SQL:
+        cursor.execute(sql)
+
+    # Статистика корпуса для BM25/tf-idf (Searcher, scoring='bm25')
+    for sql in TERM_STATS_SQL:
+        cursor.execute(sql)
+
+    # Прямой индекс: id слов каждой страницы по порядку (фрагменты результатов, Searcher.getSnippet)
+    for sql in FORWARD_INDEX_SQL:
+        cursor.execute(sql)
+
+    # Служебные значения (поколение индекса и т.п.)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value
+    )
+    ''')
 
 create_db()
\ No newline at end of file
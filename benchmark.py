@@ -0,0 +1,401 @@
+import argparse
+import contextlib
+import http.server
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+import DAO
+from DBcreate import create_db
+from crawler import Crawler
+from page_parser import parse_page_timed
+from searcher import Searcher
+
+# Метрики, для которых меньшее значение лучше (остальные числовые метрики в compare считаются "больше - лучше")
+LOWER_IS_BETTER = ('ms', 'seconds', 'bytes')
+# Метрики, которые compare не проверяет: счетчики и единичные выбросы
+NOT_COMPARED = ('count', 'max_ms', 'queries_with_results', 'pages', 'rows', 'urls', 'links')
+
+
+def generate_corpus(pages=500, vocabulary=5000, zipf=1.1, wordsPerPage=(100, 600), linkExponent=2.0,
+                    maxLinks=40, prefix='', seed=1):
+    """
+    Синтетический корпус HTML-страниц.
+    Слова выбираются из словаря размера vocabulary с вероятностями по закону Ципфа (вес слова ранга r - 1 / r^zipf).
+    Число исходящих ссылок страницы - степенное распределение с показателем linkExponent (не больше maxLinks),
+    цели ссылок выбираются с предпочтением "популярных" страниц. Кроме того, страница i ссылается на 2i+1 и 2i+2,
+    поэтому при обходе от корня все страницы достижимы за log2(pages) уровней.
+    :param prefix: префикс путей страниц - чтобы несколько корпусов можно было раздавать одним сервером
+    :return: ({путь: html}, словарь - список слов по убыванию частоты)
+    """
+    rng = np.random.default_rng(seed)
+    words = [f"w{rank}" for rank in range(1, vocabulary + 1)]
+    word_weights = 1.0 / np.arange(1, vocabulary + 1) ** zipf
+    word_weights /= word_weights.sum()
+
+    page_weights = 1.0 / np.arange(1, pages + 1) ** 0.8
+    page_weights /= page_weights.sum()
+    popularity = rng.permutation(pages)  # какая страница получает какой вес популярности
+
+    def path(i):
+        return f"{prefix}/p{i}.html"
+
+    def text(count):
+        return ' '.join(words[i] for i in rng.choice(vocabulary, size=count, p=word_weights))
+
+    corpus = {}
+    for i in range(pages):
+        targets = [child for child in (2 * i + 1, 2 * i + 2) if child < pages]
+        out_degree = min(int(rng.zipf(linkExponent)), maxLinks)
+        targets += popularity[rng.choice(pages, size=out_degree, p=page_weights)].tolist()
+        links = ' '.join(f'<a href="{path(target)}">{text(int(rng.integers(1, 4)))}</a>' for target in targets)
+        body = text(int(rng.integers(wordsPerPage[0], wordsPerPage[1] + 1)))
+        corpus[path(i)] = (f"<html><head><title>{path(i)}</title><script>var page = {i};</script></head>"
+                           f"<body><p>{body}</p><div>{links}</div></body></html>")
+    return corpus, words
+
+
+def serve_corpus(corpus):
+    """
+    Раздает корпус по HTTP на свободном локальном порту в фоновом потоке.
+    :return: (сервер - для shutdown(), базовый URL)
+    """
+    pages = {path: html.encode('utf-8') for path, html in corpus.items()}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = pages.get(self.path)
+            if body is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def percentiles(samples):
+    """ Сводка задержек в миллисекундах """
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples) * 1000
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {"count": len(values), "mean_ms": float(values.mean()), "p50_ms": float(p50), "p90_ms": float(p90),
+            "p99_ms": float(p99), "max_ms": float(values.max())}
+
+
+def crawl_depth(pages):
+    """ Глубина обхода, за которую достижимы все страницы корпуса (см. generate_corpus) """
+    return int(np.ceil(np.log2(pages + 1))) + 1
+
+
+def bench_crawl(db_path, base, pages, mode='concurrent', extractor='soup', **crawlOptions):
+    """
+    Производительность обхода и индексации корпуса.
+    :param mode: 'sequential' - Crawler.crawl, 'concurrent' - crawlConcurrent, 'bulk' - crawlConcurrent в bulkLoad
+    :param extractor: способ разбора страниц ('soup' или 'stream')
+    """
+    crawler = Crawler(db_path, extractor=extractor)
+    start = time.perf_counter()
+    if mode == 'sequential':
+        crawler.crawl([base + '/p0.html'], crawl_depth(pages), maxUrls=pages)
+    elif mode == 'bulk':
+        with crawler.bulkLoad():
+            crawler.crawlConcurrent([base + '/p0.html'], crawl_depth(pages), maxUrls=pages, **crawlOptions)
+    else:
+        crawler.crawlConcurrent([base + '/p0.html'], crawl_depth(pages), maxUrls=pages, **crawlOptions)
+    elapsed = time.perf_counter() - start
+
+    result = crawler.getIndexStats()
+    result.update(mode=mode, extractor=extractor, wall_seconds=elapsed, wall_pages_per_sec=result['pages'] / elapsed,
+                  db_bytes=os.path.getsize(db_path), stages=crawler.metrics.snapshot()['timers'])
+    return result
+
+
+def bench_extractors(corpus, largePageBytes=4 * 2 ** 20, extractors=('soup', 'stream')):
+    """
+    Сравнение способов разбора страниц (page_parser.parse_page_timed): время на страницах корпуса,
+    а также время и пик памяти (tracemalloc) на одной большой странице размером около largePageBytes.
+    """
+    documents = list(corpus.items())
+    bodies = [html.split('<body>', 1)[1].rsplit('</body>', 1)[0] for _, html in documents]
+    repeat = max(1, largePageBytes // max(sum(len(body) for body in bodies), 1) + 1)
+    large = '<html><body>' + ''.join(bodies * repeat)[:largePageBytes] + '</body></html>'
+
+    result = {}
+    outputs = {}
+    for extractor in extractors:
+        start = time.perf_counter()
+        parsed = [parse_page_timed('http://bench' + path, html, extractor)[0] for path, html in documents]
+        elapsed = time.perf_counter() - start
+        outputs[extractor] = parsed
+
+        start = time.perf_counter()
+        parse_page_timed('http://bench/large.html', large, extractor)
+        large_seconds = time.perf_counter() - start
+        tracemalloc.start()
+        try:
+            parse_page_timed('http://bench/large.html', large, extractor)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result[extractor] = {"pages": len(documents), "seconds": elapsed, "pages_per_sec": len(documents) / elapsed,
+                             "large_page_bytes": len(large), "large_page_seconds": large_seconds,
+                             "large_page_peak_bytes": peak}
+    # Способы разбора должны давать одинаковые слова и ссылки
+    result["same_output"] = len({repr(parsed) for parsed in outputs.values()}) == 1
+    return result
+
+
+def make_queries(words, known, count, wordCount, zipf, rng):
+    """
+    count запросов из wordCount слов; слова выбираются по закону Ципфа среди проиндексированных.
+    Если проиндексированных слов меньше wordCount, запрос состоит из всех таких слов.
+    """
+    candidates = [word for word in words if word in known]
+    if not candidates:
+        return []
+    size = min(wordCount, len(candidates))
+    weights = 1.0 / np.arange(1, len(candidates) + 1) ** zipf
+    weights /= weights.sum()
+    return [' '.join(candidates[i] for i in rng.choice(len(candidates), size=size, replace=False, p=weights))
+            for _ in range(count)]
+
+
+def bench_queries(db_path, words, queries=200, maxWords=5, zipf=1.1, seed=1, **searcherOptions):
+    """ Задержки getMatchRows и getSortedList для запросов из 1..maxWords слов """
+    searcher = Searcher(db_path, **searcherOptions)
+    searcher.verbose = False
+    searcher.loadPageRank()
+    known = {word for word, _ in searcher.word_dao.get_words_with_ids(-1)}
+    rng = np.random.default_rng(seed)
+
+    result = {}
+    for wordCount in range(1, maxWords + 1):
+        match_times, sorted_times, hits = [], [], 0
+        for query in make_queries(words, known, queries, wordCount, zipf, rng):
+            start = time.perf_counter()
+            rows, _ = searcher.getMatchRows(query)
+            match_times.append(time.perf_counter() - start)
+            hits += bool(rows)
+
+            start = time.perf_counter()
+            searcher.getSortedList(query)
+            sorted_times.append(time.perf_counter() - start)
+        result[f"{wordCount}_words"] = {"getMatchRows": percentiles(match_times),
+                                        "getSortedList": percentiles(sorted_times),
+                                        "queries_with_results": hits}
+    return result
+
+
+def bench_page_rank(db_path, **pageRankOptions):
+    """ Время calculatePageRank и пик памяти Python (tracemalloc) - вторым отдельным прогоном """
+    searcher = Searcher(db_path)
+    start = time.perf_counter()
+    searcher.calculatePageRank(**pageRankOptions)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        searcher.calculatePageRank(**pageRankOptions)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": elapsed, "peak_bytes": peak, "urls": len(searcher.page_rank_dao.get_all_urlids()),
+            "links": sum(1 for _ in searcher.page_rank_dao.get_all_links())}
+
+
+def bench_search_during_crawl(db_path, words, pages=200, vocabulary=5000, zipf=1.1, seed=2, wordCount=2):
+    """
+    Задержка поиска во время записи: второй корпус обходится в ту же БД,
+    а отдельный поток непрерывно выполняет getSortedList.
+    """
+    corpus, _ = generate_corpus(pages, vocabulary, zipf, prefix='/live', seed=seed)
+    server, base = serve_corpus(corpus)
+    searcher = Searcher(db_path)
+    searcher.verbose = False
+    known = {word for word, _ in searcher.word_dao.get_words_with_ids(-1)}
+    queries = make_queries(words, known, 1000, wordCount, zipf, np.random.default_rng(seed))
+    times = []
+    stop = threading.Event()
+
+    def search():
+        i = 0
+        while queries and not stop.is_set():
+            start = time.perf_counter()
+            searcher.getSortedList(queries[i % len(queries)])
+            times.append(time.perf_counter() - start)
+            i += 1
+
+    thread = threading.Thread(target=search)
+    thread.start()
+    try:
+        crawler = Crawler(db_path)
+        crawler.crawlConcurrent([base + '/live/p0.html'], crawl_depth(pages), maxUrls=pages)
+    finally:
+        stop.set()
+        thread.join()
+        server.shutdown()
+    return {"pages": pages, "getSortedList": percentiles(times)}
+
+
+def environment():
+    """ Версии окружения и коммит - чтобы результаты разных версий можно было сопоставить """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+            "numpy": np.__version__, "platform": platform.platform(), "cpus": os.cpu_count(),
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def run(pages=500, vocabulary=5000, zipf=1.1, queries=200, maxWords=5, crawlMode='concurrent',
+        searchDuringCrawl=True, seed=1, directory=None, quiet=True, extractor='soup'):
+    """
+    Полный прогон: генерация корпуса, обход, запросы, PageRank, поиск во время обхода.
+    :param directory: каталог для БД (по умолчанию временный, удаляется после прогона)
+    :param quiet: подавлять печать краулера и поисковика
+    :return: словарь результатов (см. write_results)
+    """
+    config = {"pages": pages, "vocabulary": vocabulary, "zipf": zipf, "queries": queries, "max_words": maxWords,
+              "crawl_mode": crawlMode, "extractor": extractor, "seed": seed}
+    workdir = directory or tempfile.mkdtemp(prefix='search_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    db_path = os.path.join(workdir, 'bench.db')
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    create_db(db_path)
+
+    corpus, words = generate_corpus(pages, vocabulary, zipf, seed=seed)
+    config["corpus_bytes"] = sum(len(html.encode('utf-8')) for html in corpus.values())
+    server, base = serve_corpus(corpus)
+    results = {"config": config, "environment": environment()}
+    output = open(os.devnull, 'w') if quiet else None
+    try:
+        with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+            results["extract"] = bench_extractors(corpus)
+            results["crawl"] = bench_crawl(db_path, base, pages, crawlMode, extractor)
+            results["page_rank"] = bench_page_rank(db_path)
+            results["queries"] = bench_queries(db_path, words, queries, maxWords, zipf, seed)
+            if searchDuringCrawl:
+                results["search_during_crawl"] = bench_search_during_crawl(
+                    db_path, words, max(pages // 2, 1), vocabulary, zipf, seed + 1)
+    finally:
+        server.shutdown()
+        if output is not None:
+            output.close()
+        DAO.connection_manager.close_all()
+        if directory is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def write_results(results, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+
+
+def flatten(results, prefix=''):
+    """ {'a': {'b': 1}} -> {'a.b': 1} для числовых метрик """
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Сравнивает два прогона (результаты run или загруженный JSON).
+    :param threshold: относительное ухудшение, начиная с которого метрика считается регрессией
+    :return: список (метрика, было, стало, относительное изменение) для ухудшившихся метрик
+    """
+    old, new = flatten(baseline), flatten(current)
+    regressions = []
+    for name in sorted(old.keys() & new.keys()):
+        metric = name.rsplit('.', 1)[-1]
+        if name.startswith(('config.', 'environment.')) or metric in NOT_COMPARED or not old[name]:
+            continue
+        change = (new[name] - old[name]) / abs(old[name])
+        lower_is_better = any(unit in metric for unit in LOWER_IS_BETTER)
+        worse = change > threshold if lower_is_better else change < -threshold
+        if worse:
+            regressions.append((name, old[name], new[name], change))
+    return regressions
+
+
+def print_summary(results):
+    for extractor, stats in results['extract'].items():
+        if extractor != 'same_output':
+            print(f"Разбор ({extractor}): {stats['pages_per_sec']:.0f} стр/с, страница "
+                  f"{stats['large_page_bytes'] / 2 ** 20:.1f} МБ за {stats['large_page_seconds']:.2f} с, "
+                  f"пик памяти {stats['large_page_peak_bytes'] / 2 ** 20:.1f} МБ")
+    crawl = results['crawl']
+    print(f"Обход ({crawl['mode']}, {crawl['extractor']}): {crawl['pages']} стр за {crawl['wall_seconds']:.2f} с "
+          f"({crawl['wall_pages_per_sec']:.1f} стр/с), индексация {crawl['rows_per_sec']:.0f} строк/с")
+    rank = results['page_rank']
+    print(f"PageRank: {rank['urls']} URL, {rank['links']} связей за {rank['seconds'] * 1000:.1f} мс, "
+          f"пик памяти {rank['peak_bytes'] / 2 ** 20:.1f} МБ")
+    for name, stats in results['queries'].items():
+        match, ranked = stats['getMatchRows'], stats['getSortedList']
+        print(f"{name}: getMatchRows p50 {match['p50_ms']:.2f} / p99 {match['p99_ms']:.2f} мс, "
+              f"getSortedList p50 {ranked['p50_ms']:.2f} / p99 {ranked['p99_ms']:.2f} мс")
+    if 'search_during_crawl' in results:
+        live = results['search_during_crawl']['getSortedList']
+        print(f"Поиск во время обхода: p50 {live.get('p50_ms', 0):.2f} / p99 {live.get('p99_ms', 0):.2f} мс "
+              f"({live['count']} запросов)")
+
+
+if __name__ == '__main__':
+    # python benchmark.py --pages 1000 --output results.json --compare baseline.json
+    parser = argparse.ArgumentParser(description='Нагрузочные замеры краулера и поисковика на синтетическом корпусе')
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--vocabulary', type=int, default=5000)
+    parser.add_argument('--zipf', type=float, default=1.1)
+    parser.add_argument('--queries', type=int, default=200, help='запросов на каждую длину запроса')
+    parser.add_argument('--max-words', type=int, default=5)
+    parser.add_argument('--crawl-mode', choices=('sequential', 'concurrent', 'bulk'), default='concurrent')
+    parser.add_argument('--extractor', choices=('soup', 'stream'), default='soup')
+    parser.add_argument('--no-live-search', action='store_true', help='не замерять поиск во время обхода')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--dir', help='каталог для БД (сохраняется после прогона)')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='JSON предыдущего прогона для поиска регрессий')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = run(args.pages, args.vocabulary, args.zipf, args.queries, args.max_words, args.crawl_mode,
+                  not args.no_live_search, args.seed, args.dir, extractor=args.extractor)
+    write_results(results, args.output)
+    print_summary(results)
+    print(f"Результаты записаны в {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            regressions = compare(json.load(file), results, args.threshold)
+        for name, old, new, change in regressions:
+            print(f"Регрессия {name}: {old:.4g} -> {new:.4g} ({change:+.0%})")
+        if not regressions:
+            print("Регрессий нет")
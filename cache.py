@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import OrderedDict
+
+from DAO import has_table
+
+
+class LRUCache:
+    """ Ограниченный по размеру словарь с вытеснением давно неиспользуемых записей (LRU) и счетчиками попаданий """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return self.data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)  # вытесняем самую давнюю запись
+
+    def pop(self, key, default=None):
+        with self.lock:
+            return self.data.pop(key, default)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self.data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+class IdCache:
+    """
+    Кэш соответствий слово -> id (wordlist) и url -> id (urllist), общий для Crawler и Searcher.
+    Хранит только найденные значения: отсутствие слова в БД не кэшируется, т.к. краулер может его добавить.
+    """
+
+    def __init__(self, maxWords=200000, maxUrls=100000):
+        self.words = LRUCache(maxWords)
+        self.urls = LRUCache(maxUrls)
+        self.warmed = False
+
+    def warm(self, word_dao, url_dao):
+        """
+        Первоначальное заполнение кэша из БД (не больше maxsize записей каждого вида).
+        В БД без таблиц wordlist/urllist (до create_db) ничего не делает, и кэш остается непрогретым.
+        """
+        if not (has_table(word_dao.conn, 'wordlist') and has_table(url_dao.conn, 'urllist')):
+            return
+        for word, word_id in word_dao.get_words_with_ids(self.words.maxsize):
+            self.words.put(word, word_id)
+        for url, url_id in url_dao.get_urls_with_ids(self.urls.maxsize):
+            self.urls.put(url, url_id)
+        self.warmed = True
+
+    def stats(self):
+        return {"words": self.words.stats(), "urls": self.urls.stats()}
+
+
+class QueryCache:
+    """
+    Кэш результатов поиска с ограничением по размеру (LRU) и времени жизни записей (TTL).
+    Каждое обращение передает текущее поколение индекса (MetaDAO.get_generation):
+    при его росте кэш целиком сбрасывается. Обращения с поколением старше текущего (поток прочитал его
+    до фиксации новых данных) считаются промахами и не записываются - кэш не сбрасывается ими
+    и не получает результатов, вычисленных по устаревшему индексу. Методы потокобезопасны.
+    """
+
+    def __init__(self, maxsize=1000, ttl=300):
+        self.entries = LRUCache(maxsize)
+        self.ttl = ttl
+        self.generation = None
+        self.expired = 0
+        self.invalidations = 0
+        self.stale = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def normalize(queryString):
+        """ Ключ запроса: нижний регистр, слова через один пробел """
+        return ' '.join(queryString.lower().split())
+
+    def _checkGeneration(self, generation):
+        """ Вызывается под self.lock; :return: False, если поколение обращения устарело """
+        if self.generation is not None and generation < self.generation:
+            self.stale += 1
+            return False
+        if generation != self.generation:
+            if self.generation is not None and len(self.entries):
+                self.invalidations += 1
+            self.entries.clear()
+            self.generation = generation
+        return True
+
+    def get(self, key, generation):
+        with self.lock:
+            if not self._checkGeneration(generation):
+                self.entries.misses += 1
+                return None
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            storedAt, value = entry
+            if time.monotonic() - storedAt > self.ttl:
+                # Устаревшая запись считается промахом
+                self.entries.pop(key)
+                self.entries.hits -= 1
+                self.entries.misses += 1
+                self.expired += 1
+                return None
+            return value
+
+    def put(self, key, value, generation):
+        with self.lock:
+            if self._checkGeneration(generation):
+                self.entries.put(key, (time.monotonic(), value))
+
+    def stats(self):
+        with self.lock:
+            stats = self.entries.stats()
+            stats.update(ttl=self.ttl, expired=self.expired, invalidations=self.invalidations, stale=self.stale,
+                         generation=self.generation)
+        return stats
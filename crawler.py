@@ -1,66 +1,384 @@
+import hashlib
 import sqlite3
+import time
+import queue
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import requests
 from bs4 import BeautifulSoup
-from DAO import UrlListDAO, WordListDAO, WordLocationDAO, LinkDAO, LinkWordsDAO
+from DAO import UrlListDAO, WordListDAO, WordLocationDAO, LinkDAO, LinkWordsDAO, MetaDAO, IndexDAO, FingerprintDAO, \
+    FetchStateDAO, TermStatsDAO, ForwardIndexDAO, has_table
 from DBcreate import create_db
+from cache import IdCache
+from fetcher import AsyncFetcher
+from frontier import Frontier, canonicalize, canonicalize_links
+from metrics import Metrics
+from page_parser import parse_page_timed, separate_words
+from simhash import SimHashIndex, simhash, to_signed
 import matplotlib.pyplot as plt
 import numpy as np
 
+def content_hash(html_doc):
+    """ Хэш содержимого страницы для обнаружения изменений при повторном обходе """
+    return hashlib.sha1(html_doc.encode('utf-8')).hexdigest()
+
+
 class Crawler:
-    def __init__(self, dbFileName):
+    fetchTimeout = 10  # таймаут запроса страницы в crawl(), сек
+    connectionOwner = 'crawler'  # владелец соединений DAO (DAO.ConnectionManager)
+    # Интервалы повторного обхода (recrawl), сек: начальный и границы адаптивного интервала
+    recrawlInterval = 24 * 3600
+    minRecrawlInterval = 3600
+    maxRecrawlInterval = 30 * 24 * 3600
+    # Изменение интервала: после обнаруженного изменения страницы он делится, иначе умножается на этот коэффициент
+    recrawlBackoff = 2.0
+
+    def __init__(self, dbFileName, bulkIndex=False, commitEvery=1, idCache=None, segmentIndex=None, metrics=None,
+                 dedupe=False, dedupeDistance=3, extractor='soup', compressForward=False, mergeInterval=5.0):
+        """
+        :param dbFileName: путь к файлу БД
+        :param bulkIndex: пакетная индексация страницы (executemany, один commit на commitEvery страниц)
+        :param commitEvery: через сколько проиндексированных страниц выполнять commit в пакетном режиме
+                            (в режиме сегментов - сколько страниц попадает в один сегмент)
+        :param idCache: общий с Searcher кэш слово/url -> id (IdCache); по умолчанию создается собственный
+        :param segmentIndex: SegmentIndex - вхождения слов пишутся в сегменты вместо таблицы wordlocation
+        :param metrics: Metrics для счетчиков и времени стадий; по умолчанию создается собственный
+        :param dedupe: не индексировать почти-дубликаты уже проиндексированных страниц (SimHash)
+        :param dedupeDistance: максимальное число различающихся битов 64-битных отпечатков у дубликатов
+        :param extractor: разбор страниц по умолчанию: 'soup' (BeautifulSoup) или 'stream' (потоковый,
+                          см. page_parser.StreamingExtractor); можно переопределить для отдельного обхода
+        :param compressForward: сжимать записи прямого индекса (ForwardIndexDAO) zlib
+        :param mergeInterval: период фонового слияния сегментов, сек (SegmentIndex.start_background_merge);
+                              None - сегменты объединяются только вызовом segmentIndex.maybe_merge()
+        """
         self.dbFileName = dbFileName
-        self.url_dao = UrlListDAO(dbFileName)
-        self.word_dao = WordListDAO(dbFileName)
-        self.word_location_dao = WordLocationDAO(dbFileName)
-        self.link_dao = LinkDAO(dbFileName)
-        self.link_words_dao = LinkWordsDAO(dbFileName)
-        self.page_counts = []
-        self.url_counts = []
-        self.word_counts = []
-        self.link_counts = []
+        # Все DAO краулера в потоке получают одно соединение владельца connectionOwner от connection_manager
+        # (DAO.py): иначе открытая пакетная транзакция одного DAO блокировала бы запись через остальные.
+        # Searcher в том же потоке работает через свое соединение и не фиксирует незавершенный пакет
+        self.url_dao = UrlListDAO(dbFileName, owner=self.connectionOwner)
+        self.word_dao = WordListDAO(dbFileName, owner=self.connectionOwner)
+        self.word_location_dao = WordLocationDAO(dbFileName, owner=self.connectionOwner)
+        self.link_dao = LinkDAO(dbFileName, owner=self.connectionOwner)
+        self.link_words_dao = LinkWordsDAO(dbFileName, owner=self.connectionOwner)
+        self.meta_dao = MetaDAO(dbFileName, owner=self.connectionOwner)
+        self.index_dao = IndexDAO(dbFileName, owner=self.connectionOwner)
+        self.fetch_state_dao = FetchStateDAO(dbFileName, owner=self.connectionOwner)
+        self.term_stats_dao = TermStatsDAO(dbFileName, owner=self.connectionOwner)
+        self.forward_index_dao = ForwardIndexDAO(dbFileName, owner=self.connectionOwner)
+        self.compressForward = compressForward
+        self.idCache = idCache if idCache is not None else IdCache()
+        if not self.idCache.warmed:
+            self.idCache.warm(self.word_dao, self.url_dao)
+        self.bulkIndex = bulkIndex
+        self.commitEvery = max(1, commitEvery)
+        self.pendingPages = 0
+        self.segmentIndex = segmentIndex
+        if segmentIndex is not None and mergeInterval is not None:
+            # Сегменты пишет только краулер - он же и объединяет мелкие (остановка - в close())
+            segmentIndex.start_background_merge(mergeInterval)
+        self.segmentTerms = {}   # {word_id: [(url_id, [позиции]), ...]} - еще не записанный сегмент
+        self.segmentDocs = []
+        # Массовая загрузка (beginBulkLoad): строки wordlocation копятся в памяти и вставляются отсортированными
+        self.bulkLoading = False
+        self.savedMode = None
+        self.locationBuffer = []
+        # Статистика индексации
+        self.indexedPages = 0
+        self.indexedRows = 0
+        self.indexTime = 0.0
+        # Счетчики строк ведутся инкрементально; COUNT(*) по таблицам выполняется только здесь
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.loadCounters()
+        # Поиск почти-дубликатов: индекс отпечатков и псевдонимы загружаются из БД один раз
+        self.extractor = extractor
+        self.dedupe = dedupe
+        self.aliases = {}
+        if dedupe:
+            self.fingerprint_dao = FingerprintDAO(dbFileName, owner=self.connectionOwner)
+            self.simhashIndex = SimHashIndex.load(self.fingerprint_dao, maxDistance=dedupeDistance)
+            self.aliases = self.fingerprint_dao.get_aliases()
 
     def __del__(self):
         print("Crawler завершает работу.")
 
+    def loadCounters(self):
+        """ Начальные значения счетчиков строк; в БД без таблиц (до initDB) - нули """
+        for name, dao, table in (('urls', self.url_dao, 'urllist'), ('words', self.word_dao, 'wordlist'),
+                                 ('links', self.link_dao, 'link')):
+            self.metrics.set(name, dao.get_count() if has_table(dao.conn, table) else 0)
+
     def addIndex(self, soup, url):
+        # Извлекаем текст страницы
+        text = self.getTextOnly(soup)
+        self.addIndexWords(url, self.separateWords(text))
+
+    def addIndexWords(self, url, words):
+        """ Индексация уже разобранной страницы: words - слова в порядке следования """
         self.monitor_db()
         if self.isIndexed(url):
             return
 
-        # Извлекаем текст страницы
-        text = self.getTextOnly(soup)
-        words = self.separateWords(text)
+        # Получаем идентификатор URL (без commit: в пакетном режиме фиксируется только flushIndex)
+        url_id = self.resolveUrlIds([url])[url]
 
-        # Получаем идентификатор URL
-        url_id = self.getEntryId("urllist", "url", url, createNew=True)
+        if self.dedupe and words and self.checkDuplicate(url_id, words):
+            return
 
-        # Индексируем каждое слово
+        start = time.perf_counter()
+        if self.segmentIndex is not None:
+            self.addIndexSegment(url_id, words)
+        elif self.bulkIndex:
+            self.addIndexBulk(url_id, words)
+        else:
+            # Индексируем каждое слово
+            tokens = []
+            for i, word in enumerate(words):
+
+                word_id = self.getEntryId("wordlist", "word", word, createNew=True)  # Всегда создаем новое слово
+                self.word_location_dao.add_word_location(word_id, url_id, i)
+                tokens.append(word_id)
+            self.addDocumentData(url_id, tokens)
+
+            # Новое поколение индекса сбрасывает кэш результатов поиска
+            self.meta_dao.bump_generation()
+            with self.metrics.timer('commit'):
+                self.meta_dao.commit()
+
+        elapsed = time.perf_counter() - start
+        self.metrics.observe('db_write', elapsed)
+        self.metrics.incr('pages_indexed')
+        self.metrics.incr('word_locations', len(words))
+        self.indexTime += elapsed
+        self.indexedPages += 1
+        self.indexedRows += len(words)
+
+    def addDocumentData(self, url_id, tokens):
+        """
+        Данные страницы помимо вхождений слов (без commit): статистика корпуса для BM25 (TermStatsDAO)
+        и прямой индекс для фрагментов результатов поиска (ForwardIndexDAO).
+        :param tokens: id слов страницы в порядке следования
+        """
+        term_freqs = {}
+        for word_id in tokens:
+            term_freqs[word_id] = term_freqs.get(word_id, 0) + 1
+        self.term_stats_dao.add_document(url_id, len(tokens), term_freqs)
+        self.forward_index_dao.add_document(url_id, tokens, self.compressForward)
+
+    def checkDuplicate(self, url_id, words):
+        """
+        Стадия отпечатков: SimHash страницы ищется среди отпечатков проиндексированных страниц.
+        Почти-дубликат не индексируется, а записывается псевдонимом канонической страницы (url_alias).
+        :return: True, если страница - дубликат
+        """
+        start = time.perf_counter()
+        fingerprint = simhash(words)
+        match = self.simhashIndex.find(fingerprint)
+        duplicate = match is not None and match[0] != url_id
+        if duplicate:
+            canonical_id, distance = match
+            self.fingerprint_dao.add_alias(url_id, canonical_id, distance)
+            self.aliases[url_id] = canonical_id
+            self.metrics.incr('duplicates')
+            self.metrics.incr('duplicate_rows_saved', len(words))
+            self.metrics.incr('duplicate_bytes_saved', sum(len(word.encode('utf-8')) for word in words))
+        else:
+            self.simhashIndex.add(fingerprint, url_id)
+            self.fingerprint_dao.add_fingerprint(url_id, to_signed(fingerprint))
+        self.metrics.observe('fingerprint', time.perf_counter() - start)
+        return duplicate
+
+    def addIndexBulk(self, url_id, words):
+        """
+        Пакетная индексация страницы: словарь страницы сопоставляется с wordlist несколькими
+        запросами IN (...), новые слова и все строки wordlocation вставляются через executemany.
+        Commit выполняется раз в commitEvery страниц (см. flushIndex).
+        """
+        word_ids = self.resolveWordIds(words)
+        rows = [(word_ids[word], url_id, i) for i, word in enumerate(words)]
+        self.addDocumentData(url_id, [row[0] for row in rows])
+        if self.bulkLoading:
+            self.locationBuffer.extend(rows)
+        else:
+            self.word_location_dao.add_word_locations(rows)
+
+        self.pendingPages += 1
+        if self.pendingPages >= self.commitEvery:
+            self.flushIndex()
+
+    def addIndexSegment(self, url_id, words):
+        """ Индексация страницы в буфер сегмента; буфер сбрасывается в новый сегмент раз в commitEvery страниц """
+        word_ids = self.resolveWordIds(words)
+        positions = {}
         for i, word in enumerate(words):
-
-            word_id = self.getEntryId("wordlist", "word", word, createNew=True)  # Всегда создаем новое слово
-            self.word_location_dao.add_word_location(word_id, url_id, i)
-
+            positions.setdefault(word_ids[word], []).append(i)
+        for word_id, locations in positions.items():
+            self.segmentTerms.setdefault(word_id, []).append((url_id, locations))
+        self.segmentDocs.append(url_id)
+        self.addDocumentData(url_id, [word_ids[word] for word in words])
+
+        self.pendingPages += 1
+        if self.pendingPages >= self.commitEvery:
+            self.flushIndex()
+
+    def resolveWordIds(self, words):
+        """
+        Сопоставляет словарь страницы с wordlist: сначала через кэш, затем несколькими запросами IN (...);
+        отсутствующие слова добавляются через executemany (без commit).
+        :return: словарь {слово: id}
+        """
+        # Уникальные слова страницы в порядке первого появления
+        vocabulary = list(dict.fromkeys(words))
+        word_ids = {}
+        for word in vocabulary:
+            word_id = self.idCache.words.get(word)
+            if word_id is not None:
+                word_ids[word] = word_id
+
+        # В БД ищем только слова, которых нет в кэше
+        missing = [word for word in vocabulary if word not in word_ids]
+        found = self.word_dao.get_word_ids(missing) if missing else {}
+
+        new_words = [word for word in missing if word not in found]
+        if new_words:
+            found.update(zip(new_words, self.word_dao.add_words(new_words)))
+            self.metrics.incr('words', len(new_words))
+
+        for word, word_id in found.items():
+            self.idCache.words.put(word, word_id)
+        word_ids.update(found)
+        return word_ids
+
+    def resolveUrlIds(self, urls):
+        """
+        Сопоставляет набор URL с urllist так же, как resolveWordIds слова: кэш, запросы IN (...),
+        вставка отсутствующих через executemany (без commit).
+        :return: словарь {url: id}
+        """
+        url_ids = {}
+        missing = []
+        for url in dict.fromkeys(urls):
+            url_id = self.idCache.urls.get(url)
+            if url_id is not None:
+                url_ids[url] = url_id
+            else:
+                missing.append(url)
+
+        found = self.url_dao.get_url_ids(missing) if missing else {}
+        new_urls = [url for url in missing if url not in found]
+        if new_urls:
+            found.update(zip(new_urls, self.url_dao.add_urls(new_urls)))
+            self.metrics.incr('urls', len(new_urls))
+
+        for url, url_id in found.items():
+            self.idCache.urls.put(url, url_id)
+        url_ids.update(found)
+        return url_ids
+
+    def flushIndex(self):
+        """
+        Фиксирует накопленные в пакетном режиме страницы одной транзакцией (и записывает сегмент).
+        Новое поколение индекса фиксируется последним: читатель, увидевший его, уже видит и новый сегмент,
+        иначе он закэшировал бы под новым поколением результаты без этих страниц.
+        """
+        start = time.perf_counter()
+        if self.locationBuffer:
+            # Вставка в порядке (word_id, url_id, location) - в порядке будущего индекса wordlocidx
+            self.locationBuffer.sort()
+            self.word_location_dao.add_word_locations(self.locationBuffer)
+            self.locationBuffer = []
+        if self.segmentIndex is not None and self.segmentDocs:
+            # Слова фиксируются в wordlist раньше, чем на них сошлется сегмент
+            with self.metrics.timer('commit'):
+                self.word_location_dao.commit()
+            self.segmentIndex.add_segment(self.segmentTerms, self.segmentDocs)
+            self.segmentTerms = {}
+            self.segmentDocs = []
+        if self.pendingPages:
+            self.meta_dao.bump_generation()
+        with self.metrics.timer('commit'):
+            self.word_location_dao.commit()
+        self.indexTime += time.perf_counter() - start
+        self.pendingPages = 0
+
+    def close(self):
+        """ Фиксирует незаписанный пакет и останавливает фоновое слияние сегментов """
+        self.flushIndex()
+        if self.segmentIndex is not None:
+            self.segmentIndex.stop_background_merge()
+
+    def beginBulkLoad(self, batchPages=500):
+        """
+        Режим массовой загрузки для первичного обхода: вторичные индексы удаляются (индексы wordlist.word
+        и urllist.url, нужные самому краулеру, остаются), строки wordlocation копятся в памяти
+        и раз в batchPages страниц вставляются одной отсортированной пачкой, synchronous = OFF.
+        Индексы строятся заново в endBulkLoad().
+        """
+        self.savedMode = (self.bulkIndex, self.commitEvery, self.index_dao.get_synchronous())
+        self.index_dao.create_lookup_indexes()
+        self.index_dao.drop_secondary_indexes()
+        self.index_dao.set_synchronous('OFF')
+        self.bulkIndex = True
+        self.commitEvery = max(1, batchPages)
+        self.bulkLoading = True
+
+    def endBulkLoad(self):
+        """ Завершает массовую загрузку: сбрасывает буфер, строит все индексы и выполняет ANALYZE """
+        self.flushIndex()
+        self.bulkLoading = False
+        start = time.perf_counter()
+        self.index_dao.create_all_indexes()
+        self.index_dao.analyze()
+        print(f"Индексы построены за {time.perf_counter() - start:.2f} с")
+        self.bulkIndex, self.commitEvery, synchronous = self.savedMode
+        self.index_dao.set_synchronous(synchronous)
+
+    @contextmanager
+    def bulkLoad(self, batchPages=500):
+        """ with crawler.bulkLoad(): crawler.crawl(...) - массовая загрузка с построением индексов в конце """
+        self.beginBulkLoad(batchPages)
+        try:
+            yield self
+        finally:
+            self.endBulkLoad()
+
+    def getIndexStats(self):
+        """ Возвращает производительность индексации: страниц/сек и строк wordlocation/сек """
+        elapsed = self.indexTime or 1e-9
+        return {
+            "pages": self.indexedPages,
+            "rows": self.indexedRows,
+            "seconds": self.indexTime,
+            "pages_per_sec": self.indexedPages / elapsed,
+            "rows_per_sec": self.indexedRows / elapsed,
+        }
+
+    def printIndexStats(self):
+        stats = self.getIndexStats()
+        print(f"Проиндексировано страниц: {stats['pages']}, строк: {stats['rows']} за {stats['seconds']:.2f} с "
+              f"({stats['pages_per_sec']:.1f} стр/с, {stats['rows_per_sec']:.0f} строк/с)")
 
 
     def plot_graphs(self):
-        x = np.array(self.page_counts)
+        # Графики строятся по снимкам счетчиков (см. monitor_db)
+        self.metrics.maybe_sample(force=True)
+        x = np.array(self.metrics.series('pages_seen'))
 
         plt.figure(figsize=(15, 5))
 
         plt.subplot(1, 3, 1)
-        plt.plot(x, self.url_counts, marker='')
+        plt.plot(x, self.metrics.series('urls'), marker='')
         plt.title('URL Count')
         plt.xlabel('Pages Visited')
         plt.ylabel('URL Count')
 
         plt.subplot(1, 3, 2)
-        plt.plot(x, self.word_counts, marker='')
+        plt.plot(x, self.metrics.series('words'), marker='')
         plt.title('Word Count')
         plt.xlabel('Pages Visited')
         plt.ylabel('Word Count')
 
         plt.subplot(1, 3, 3)
-        plt.plot(x, self.link_counts, marker='')
+        plt.plot(x, self.metrics.series('links'), marker='')
         plt.title('Link Count')
         plt.xlabel('Pages Visited')
         plt.ylabel('Link Count')
@@ -70,17 +388,11 @@ class Crawler:
 
 
     def monitor_db(self):
-        url_count = self.url_dao.get_count()
-        word_count = self.word_dao.get_count()
-        link_count = self.link_dao.get_count()
-
-        self.url_counts.append(url_count)
-        self.word_counts.append(word_count)
-        self.link_counts.append(link_count)
-        self.page_counts.append(len(self.page_counts) + 1)  # или текущее количество посещённых страниц
-
-
-        print(f"URL count: {url_count}, Word count: {word_count}, Link count: {link_count}")
+        # Счетчики ведутся при вставке; снимок для plot_graphs - не чаще metrics.sampleInterval
+        self.metrics.incr('pages_seen')
+        sample = self.metrics.maybe_sample()
+        if sample is not None:
+            print(f"URL count: {sample['urls']}, Word count: {sample['words']}, Link count: {sample['links']}")
 
     def analyze_indexing(self):
         # Количество записей в каждой таблице
@@ -109,72 +421,253 @@ class Crawler:
         return not url.endswith('.apk')
 
     def separateWords(self, text):
-        # Разделение на слова по пробелам и знакам препинания
-        russian_conjunctions = ['и', 'а', 'но', 'или', 'да', 'же', 'что', 'как', 'когда', 'если', 'то', 'ли', 'не',
-                                'ни', 'либо', 'чтобы', 'хотя', 'зато']
-
-        import re
-        words = re.findall(r'\w+', text.lower())
-        words = [word for word in words if word not in russian_conjunctions]
-        return words
+        # Разделение на слова по пробелам и знакам препинания (см. page_parser.separate_words)
+        return separate_words(text)
 
     def isIndexed(self, url):
         # Проверяем, есть ли URL в таблице urllist и связаны ли с ним слова
-        url_id = self.url_dao.get_url_by_value(url)
+        url_id = self.getUrlId(url)
         if not url_id:
             return False
 
-        # Проверяем наличие слов в wordlocation
-        word_locations = self.word_location_dao.get_word_locations_by_url(url_id)
-        return len(word_locations) > 0
+        if url_id in self.aliases:
+            return True  # почти-дубликат уже проиндексированной страницы
 
-    def addLinkRef(self, urlFrom, urlTo, linkText):
-        from_id = self.getEntryId("urllist", "url", urlFrom, createNew=True)
-        to_id = self.getEntryId("urllist", "url", urlTo, createNew=True)
-        self.link_dao.add_link(from_id, to_id)
+        # Каждая проиндексированная страница получает строку doclength (addDocumentData) во всех режимах -
+        # и в буфере массовой загрузки, и в сегментах; поиск по первичному ключу, без просмотра wordlocation
+        return self.term_stats_dao.has_document(url_id)
 
-        # Сохраняем слова из текста ссылки
-        words = self.separateWords(linkText)
-        for word in words:
-            word_id = self.getEntryId("wordlist", "word", word, createNew=True)
-            link_id = self.link_dao.get_link_by_urls(from_id, to_id)
-            self.link_words_dao.add_link_word(word_id, link_id)
+    def addLinkRef(self, urlFrom, urlTo, linkText):
+        self.addLinkRefs(urlFrom, [(urlTo, linkText)])
+
+    def addLinkRefs(self, urlFrom, links):
+        """
+        Пакетная запись ссылок страницы: повторяющиеся пары (urlFrom, urlTo) объединяются в одну связь
+        со словами текстов всех таких ссылок; id адресов и слов определяются пакетными запросами,
+        связи и linkwords вставляются через executemany, id новых связей берутся из диапазона rowid вставки.
+        Слова текста записываются только для новых связей: у существующих они уже сохранены.
+        В режиме индексации по одной странице выполняется commit, в пакетном - фиксируется вместе с пакетом.
+        :param links: [(urlTo, текст ссылки), ...]
+        :return: число новых связей
+        """
+        anchors = {}
+        for urlTo, linkText in links:
+            anchors.setdefault(urlTo, []).extend(self.separateWords(linkText))
+        if not anchors:
+            return 0
+
+        url_ids = self.resolveUrlIds([urlFrom, *anchors])
+        from_id = url_ids[urlFrom]
+        word_ids = self.resolveWordIds([word for words in anchors.values() for word in words])
+
+        # Слова текстов ссылок по id адреса назначения
+        targets = {}
+        for urlTo, words in anchors.items():
+            targets.setdefault(url_ids[urlTo], set()).update(word_ids[word] for word in words)
+
+        existing = self.link_dao.get_link_ids(from_id)
+        new_targets = [to_id for to_id in targets if to_id not in existing]
+        link_ids = self.link_dao.add_links(from_id, new_targets)
+        self.link_words_dao.add_link_words([(word_id, link_id)
+                                            for to_id, link_id in zip(new_targets, link_ids)
+                                            for word_id in sorted(targets[to_id])])
+        self.metrics.incr('links', len(new_targets))
+
+        if not self.bulkIndex and self.segmentIndex is None:
+            self.link_dao.commit()
+        return len(new_targets)
+
+    def getUrlId(self, url):
+        """ id URL через кэш; при промахе - запрос к urllist """
+        url_id = self.idCache.urls.get(url)
+        if url_id is None:
+            url_id = self.url_dao.get_url_by_value(url)
+            if url_id:
+                self.idCache.urls.put(url, url_id)
+        return url_id
 
     def getEntryId(self, tableName, fieldName, value, createNew=True):
         # Проверка наличия записи только для urllist (чтобы не добавлять один и тот же URL несколько раз)
         if tableName == "urllist":
-            result = self.url_dao.get_url_by_value(value)
+            result = self.getUrlId(value)
             if result:
                 return result  # Возвращаем существующий ID
 
             if createNew:
                 # Создаем новую запись для URL
                 self.url_dao.add_url(value)
-                return self.url_dao.get_url_by_value(value)  # Получаем id вновь добавленного URL
+                self.metrics.incr('urls')
+                url_id = self.url_dao.get_url_by_value(value)  # Получаем id вновь добавленного URL
+                self.idCache.urls.put(value, url_id)
+                return url_id
 
         # Для wordlist добавляем уникальные слова
         if tableName == "wordlist":
-            # Проверяем, существует ли слово в таблице
-            existing_word = self.word_dao.get_word_by_value(value)
+            # Проверяем, существует ли слово в кэше или в таблице
+            existing_word = self.idCache.words.get(value)
+            if existing_word is None:
+                existing_word = self.word_dao.get_word_by_value(value)
             if existing_word:
+                self.idCache.words.put(value, existing_word)
                 return existing_word  # Возвращаем существующий ID слова
 
             if createNew:
                 # Добавляем новое слово в таблицу и возвращаем его ID
                 word_id = self.word_dao.add_word(value)
+                self.metrics.incr('words')
+                self.idCache.words.put(value, word_id)
                 return word_id
         return None
 
-    def crawl(self, urlList, maxDepth, maxUrls=100):
+    def recordFetch(self, url, response):
+        """
+        Сохраняет хэш содержимого и валидаторы HTTP (ETag, Last-Modified) первой загрузки страницы для recrawl.
+        Ответы с кодом не 2xx (404, 5xx) не сохраняются: проверять условным запросом нечего.
+        :param response: ответ requests.Response
+        """
+        if not 200 <= response.status_code < 300:
+            return
+        url_id = self.resolveUrlIds([url])[url]
+        self.fetch_state_dao.record_fetch(url_id, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                                          content_hash(response.text), time.time(), self.recrawlInterval)
+
+    def recrawl(self, limit=None, now=None):
+        """
+        Повторный обход страниц, срок проверки которых наступил (fetchstate.next_due).
+        Запрос условный (If-None-Match / If-Modified-Since); при ответе 304 или совпадении хэша содержимого
+        страница не разбирается. Измененная страница переиндексируется (reindexPage).
+        Интервал проверки адаптивный: после изменения уменьшается в recrawlBackoff раз, иначе во столько же
+        раз растет, в пределах [minRecrawlInterval, maxRecrawlInterval].
+        :param limit: максимум страниц за вызов
+        :param now: текущее время (time.time()), для тестов и планирования
+        :return: словарь {'not_modified', 'unchanged', 'changed', 'errors'} - число страниц каждого исхода
+        """
+        if self.segmentIndex is not None:
+            raise ValueError("Повторная индексация в режиме сегментов не поддерживается: сегменты неизменяемы")
+        now = time.time() if now is None else now
+        result = {"not_modified": 0, "unchanged": 0, "changed": 0, "errors": 0}
+        for url_id, url in self.fetch_state_dao.get_due_urls(now, limit):
+            state = self.fetch_state_dao.get_state(url_id)
+            headers = {}
+            if state['etag']:
+                headers['If-None-Match'] = state['etag']
+            if state['last_modified']:
+                headers['If-Modified-Since'] = state['last_modified']
+
+            try:
+                with self.metrics.timer('fetch'):
+                    response = requests.get(url, headers=headers, timeout=self.fetchTimeout)
+            except requests.RequestException as e:
+                print(f"Ошибка при запросе URL {url}: {e}")
+                response = None
+
+            if response is None or response.status_code not in (200, 304):
+                outcome = "errors"
+            elif response.status_code == 304:
+                outcome = "not_modified"
+            else:
+                digest = content_hash(response.text)
+                if digest == state['content_hash']:
+                    outcome = "unchanged"
+                else:
+                    self.reindexPage(url_id, url, response.text)
+                    state['content_hash'] = digest
+                    state['changes'] += 1
+                    outcome = "changed"
+                state['etag'] = response.headers.get('ETag')
+                state['last_modified'] = response.headers.get('Last-Modified')
+
+            if outcome == "changed":
+                state['interval'] = max(state['interval'] / self.recrawlBackoff, self.minRecrawlInterval)
+            elif outcome != "errors":
+                state['interval'] = min(state['interval'] * self.recrawlBackoff, self.maxRecrawlInterval)
+            # При ошибке интервал не меняется: страница будет проверена в следующий срок
+            state['checks'] += 1
+            state['fetched_at'] = now
+            state['next_due'] = now + state['interval']
+            self.fetch_state_dao.save_state(url_id, state)
+            self.fetch_state_dao.commit()
+
+            result[outcome] += 1
+            self.metrics.incr(f"recrawl_{outcome}")
+        return result
+
+    def reindexPage(self, url_id, url, html_doc):
+        """
+        Заменяет проиндексированное содержимое измененной страницы: ее строки wordlocation и исходящие ссылки
+        (вместе со словами ссылок) удаляются и записываются заново; остальные страницы не затрагиваются.
+        При dedupe отпечаток проверяется заново: псевдоним (url_alias), переставший совпадать с канонической
+        страницей, индексируется, а страница, ставшая почти-дубликатом, остается в индексе только ссылками.
+        """
+        (url, words, links), parseTime, tokenizeTime = parse_page_timed(url, html_doc, self.extractor)
+        self.metrics.observe('parse', parseTime)
+        self.metrics.observe('tokenize', tokenizeTime)
+
+        start = time.perf_counter()
+        removedRows = self.word_location_dao.delete_url_locations(url_id)
+        removedLinks = self.link_dao.delete_links_from(url_id)
+        self.term_stats_dao.delete_document(url_id)
+        if self.dedupe and url_id in self.aliases:
+            self.fingerprint_dao.remove_alias(url_id)
+            del self.aliases[url_id]
+        if self.dedupe and words and self.checkDuplicate(url_id, words):
+            self.forward_index_dao.delete_document(url_id)
+            words = []
+        else:
+            word_ids = self.resolveWordIds(words)
+            self.word_location_dao.add_word_locations([(word_ids[word], url_id, i) for i, word in enumerate(words)])
+            self.addDocumentData(url_id, [word_ids[word] for word in words])
+        self.meta_dao.bump_generation()
+        with self.metrics.timer('commit'):
+            self.word_location_dao.commit()
+
+        # Ссылки - как при первой индексации: по одной на каждый адрес
+        self.addLinkRefs(url, canonicalize_links(links))
+
+        self.metrics.observe('db_write', time.perf_counter() - start)
+        self.metrics.incr('word_locations', len(words) - removedRows)
+        self.metrics.incr('links', -removedLinks)
+        self.metrics.incr('pages_reindexed')
+
+    def processPage(self, url, html_doc, visited_urls, next_depth_urls):
+        """
+        Разбор загруженной страницы: индексация текста и сохранение ссылок.
+        Новые ссылки добавляются в next_depth_urls (dict как упорядоченное множество) для следующего уровня глубины.
+        """
+        parsed, parseTime, tokenizeTime = parse_page_timed(url, html_doc, self.extractor)
+        self.indexParsedPage(*parsed, visited_urls, next_depth_urls)
+        self.metrics.observe('parse', parseTime)
+        self.metrics.observe('tokenize', tokenizeTime)
+
+    def indexParsedPage(self, url, words, links, visited_urls, next_depth_urls):
+        """ Запись в БД результата parse_page: слов страницы и ссылок [(full_url, текст ссылки), ...] """
+        # Добавляем текущую страницу в индекс
+        self.addIndexWords(url, words)
+
+        # Обрабатываем ссылки на странице
+        with self.metrics.timer('link_write'):
+            new_links = []
+            for full_url, link_text in canonicalize_links(links):
+                if full_url not in visited_urls and full_url not in next_depth_urls:
+                    next_depth_urls[full_url] = None
+                    new_links.append((full_url, link_text))
+
+            # Добавляем ссылки между страницами одним пакетом
+            self.addLinkRefs(url, new_links)
+
+    def crawl(self, urlList, maxDepth, maxUrls=100, extractor=None):
+        if extractor is not None:
+            self.extractor = extractor
         visited_urls = set()  # Множество для отслеживания уникальных URL
         total_urls_processed = 0  # Счетчик обработанных URL
+        urlList = [url for url in map(canonicalize, urlList) if url is not None]
 
         for currDepth in range(maxDepth):
             if total_urls_processed >= maxUrls:
                 print("Достигнут лимит обработанных URL.")
                 break
 
-            next_depth_urls = []
+            next_depth_urls = {}
             for url in urlList:
 
                 if total_urls_processed >= maxUrls:
@@ -188,37 +681,207 @@ class Crawler:
                 total_urls_processed += 1
 
                 try:
-                    html_doc = requests.get(url).text
+                    with self.metrics.timer('fetch'):
+                        response = requests.get(url, timeout=self.fetchTimeout)
                 except requests.RequestException as e:
                     print(f"Ошибка при запросе URL {url}: {e}")
+                    self.metrics.incr('fetch_errors')
                     continue
 
-                soup = BeautifulSoup(html_doc, "html.parser")
                 print(total_urls_processed)
                 print(url)
-                # Добавляем текущую страницу в индекс
-                self.addIndex(soup, url)
-
-                # Обрабатываем ссылки на странице
-                for link in soup.find_all('a', href=True):
-                    href = link.get('href')
-                    if href and not href.startswith('#') and not href.startswith('mailto:') and not href.endswith('.apk'):
-                        full_url = requests.compat.urljoin(url, href)
-                        if full_url not in visited_urls and full_url not in next_depth_urls:
-                            next_depth_urls.append(full_url)
+                self.recordFetch(url, response)
+                self.processPage(url, response.text, visited_urls, next_depth_urls)
 
-                            # Добавляем ссылку между страницами
-                            self.addLinkRef(url, full_url, link.get_text())
-
-            urlList = next_depth_urls  # Переход на следующий уровень глубины
+            urlList = list(next_depth_urls)  # Переход на следующий уровень глубины
 
             if total_urls_processed >= maxUrls:
                 print("Достигнут лимит обработанных URL.")
                 break
 
+        # Фиксируем страницы, оставшиеся в незавершенном пакете
+        self.flushIndex()
+        self.metrics.maybe_sample(force=True)
+        self.printIndexStats()
+
+    def crawlConcurrent(self, urlList, maxDepth, maxUrls=100, concurrency=10, perHost=2, timeout=10,
+                        retries=2, queueSize=50, parseWorkers=0, parseQueueSize=None, extractor=None):
+        """
+        Обход с параллельной загрузкой страниц. Семантика maxDepth/maxUrls та же, что у crawl().
+        Загрузка идет в фоновом цикле asyncio (AsyncFetcher), разбор и запись в БД - в текущем потоке;
+        стадии связаны ограниченной очередью размера queueSize, поэтому запись в SQLite не останавливает сеть.
+        :param concurrency: максимальное число одновременных запросов
+        :param perHost: максимальное число одновременных запросов к одному хосту
+        :param timeout: таймаут запроса, сек
+        :param retries: число повторов при сетевой ошибке или ответе 5xx/429
+        :param parseWorkers: если > 0, HTML разбирается в пуле из parseWorkers процессов,
+                             запись в БД остается в текущем потоке
+        :param parseQueueSize: максимум страниц, одновременно находящихся в пуле разбора (по умолчанию 2 * parseWorkers)
+        :param extractor: 'soup' или 'stream' - способ разбора страниц для этого и следующих обходов
+        """
+        if extractor is not None:
+            self.extractor = extractor
+        visited_urls = set()
+        total_urls_processed = 0
+        urlList = [url for url in map(canonicalize, urlList) if url is not None]
+        pages = queue.Queue(maxsize=queueSize)
+        fetcher = AsyncFetcher(concurrency=concurrency, perHost=perHost, timeout=timeout, retries=retries,
+                               metrics=self.metrics)
+        fetcher.start()
+        parsePool = ProcessPoolExecutor(max_workers=parseWorkers) if parseWorkers > 0 else None
+        parseLimit = parseQueueSize or 2 * parseWorkers
+        try:
+            for currDepth in range(maxDepth):
+                if total_urls_processed >= maxUrls:
+                    print("Достигнут лимит обработанных URL.")
+                    break
+
+                # Отбираем URL текущего уровня с учетом лимита
+                level_urls = []
+                for url in urlList:
+                    if total_urls_processed + len(level_urls) >= maxUrls:
+                        break
+                    if url in visited_urls:
+                        continue
+                    visited_urls.add(url)
+                    level_urls.append(url)
+
+                future = fetcher.submit(level_urls, pages)
+                next_depth_urls = {}
+                if parsePool is None:
+                    for _ in range(len(level_urls)):
+                        url, response = pages.get()
+                        total_urls_processed += 1
+                        if response is None:
+                            continue
+                        print(total_urls_processed)
+                        print(url)
+                        self.recordFetch(url, response)
+                        self.processPage(url, response.text, visited_urls, next_depth_urls)
+                else:
+                    self.parseLevel(parsePool, parseLimit, pages, len(level_urls), visited_urls, next_depth_urls)
+                    total_urls_processed += len(level_urls)
+                future.result()
+
+                urlList = list(next_depth_urls)  # Переход на следующий уровень глубины
+        finally:
+            fetcher.close()
+            if parsePool is not None:
+                parsePool.shutdown()
+
+        self.flushIndex()
+        self.metrics.maybe_sample(force=True)
+        self.printIndexStats()
+
+    def crawlFrontier(self, urlList, maxDepth, maxUrls=100, batchSize=50, concurrency=10, perHost=2, timeout=10,
+                      retries=2, frontier=None, extractor=None):
+        """
+        Обход с очередью, сохраняемой в БД (frontier.Frontier). В отличие от crawl()/crawlConcurrent(),
+        множество встреченных URL не держится в памяти целиком, а обход, прерванный на любом месте,
+        продолжается повторным вызовом с теми же параметрами: уже загруженные URL не загружаются снова.
+        URL выдаются пакетами по batchSize с чередованием хостов, в пределах хоста - по глубине (обход в ширину).
+        :param urlList: начальные URL (глубина 0); уже встреченные раньше пропускаются
+        :param maxUrls: максимум URL, загружаемых за этот вызов
+        :param frontier: очередь обхода; по умолчанию - Frontier в той же БД
+        :return: состояние очереди (Frontier.stats)
+        """
+        if extractor is not None:
+            self.extractor = extractor
+        if frontier is None:
+            frontier = Frontier(self.dbFileName, owner=self.connectionOwner)
+        if frontier.resumed:
+            print(f"Продолжение обхода: {frontier.resumed} URL возвращены в очередь")
+        frontier.add(urlList, 0)
+        frontier.commit()
+
+        total_urls_processed = 0
+        pages = queue.Queue(maxsize=batchSize)
+        fetcher = AsyncFetcher(concurrency=concurrency, perHost=perHost, timeout=timeout, retries=retries,
+                               metrics=self.metrics)
+        fetcher.start()
+        try:
+            while total_urls_processed < maxUrls:
+                batch = dict(frontier.take(min(batchSize, maxUrls - total_urls_processed), maxDepth))
+                frontier.commit()
+                if not batch:
+                    break
+
+                future = fetcher.submit(list(batch), pages)
+                for _ in range(len(batch)):
+                    url, response = pages.get()
+                    total_urls_processed += 1
+                    if response is None:
+                        frontier.failed([url])
+                        continue
+                    print(total_urls_processed)
+                    print(url)
+                    self.recordFetch(url, response)
+                    (url, words, links), parseTime, tokenizeTime = parse_page_timed(url, response.text, self.extractor)
+                    self.metrics.observe('parse', parseTime)
+                    self.metrics.observe('tokenize', tokenizeTime)
+                    self.addIndexWords(url, words)
+                    self.addFrontierLinks(frontier, url, links, batch[url] + 1, maxDepth)
+                    frontier.done([url])
+                future.result()
+
+                # Состояние очереди фиксируется вместе с проиндексированным пакетом
+                self.flushIndex()
+                frontier.commit()
+        finally:
+            fetcher.close()
+
+        self.flushIndex()
+        frontier.commit()
+        self.metrics.maybe_sample(force=True)
+        self.printIndexStats()
+        return frontier.stats()
+
+    def addFrontierLinks(self, frontier, url, links, depth, maxDepth):
+        """ Сохраняет ссылки страницы и ставит новые URL в очередь обхода, если depth < maxDepth """
+        links = canonicalize_links(links)
+        with self.metrics.timer('link_write'):
+            self.addLinkRefs(url, links)
+            if depth < maxDepth:
+                frontier.add([full_url for full_url, _ in links], depth)
+
+    def parseLevel(self, parsePool, parseLimit, pages, pageCount, visited_urls, next_depth_urls):
+        """
+        Разбор страниц уровня в пуле процессов: из очереди загрузки берутся pageCount страниц,
+        в пуле одновременно не больше parseLimit страниц, готовые результаты сразу записываются в БД.
+        """
+        received = 0
+        inflight = set()
+        while received < pageCount or inflight:
+            # Записываем то, что уже разобрано
+            done = {task for task in inflight if task.done()}
+            inflight -= done
+            for task in done:
+                (url, words, links), parseTime, tokenizeTime = task.result()
+                print(url)
+                self.indexParsedPage(url, words, links, visited_urls, next_depth_urls)
+                self.metrics.observe('parse', parseTime)
+                self.metrics.observe('tokenize', tokenizeTime)
+
+            if received < pageCount and len(inflight) < parseLimit:
+                # Пока в пуле есть задачи, не блокируемся на очереди загрузки надолго
+                try:
+                    url, response = pages.get(timeout=0.05 if inflight else None)
+                except queue.Empty:
+                    continue
+                received += 1
+                if response is not None:
+                    self.recordFetch(url, response)
+                    inflight.add(parsePool.submit(parse_page_timed, url, response.text, self.extractor))
+            elif inflight:
+                wait(inflight, return_when=FIRST_COMPLETED)
+
     def initDB(self):
         # Инициализация таблиц в БД
-        create_db()
+        create_db(self.dbFileName)
+        # Кэш и счетчики, не загруженные в конструкторе из-за отсутствия таблиц
+        if not self.idCache.warmed:
+            self.idCache.warm(self.word_dao, self.url_dao)
+        self.loadCounters()
         # self.url_dao.init_db()
         # self.word_dao.init_db()
         # self.word_location_dao.init_db()
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+
+# Ответы, после которых имеет смысл повторить запрос
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class AsyncFetcher:
+    """
+    Параллельная загрузка страниц в отдельном потоке с циклом asyncio.
+    Ограничивает общее число запросов в работе и число запросов к одному хосту,
+    повторяет неудачные запросы с экспоненциальной задержкой.
+    Сами HTTP-запросы выполняются через requests в пуле потоков.
+    """
+
+    def __init__(self, concurrency=10, perHost=2, timeout=10, retries=2, backoff=0.5, metrics=None):
+        """ :param metrics: Metrics для времени загрузки (стадия fetch) и счетчиков ошибок и повторов """
+        self.metrics = metrics
+        self.concurrency = concurrency
+        self.perHost = perHost
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.loop = None
+        self.thread = None
+        self.limit = None
+        self.hostLimits = {}
+
+    def start(self):
+        """ Запускает фоновый поток с циклом событий """
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.limit = asyncio.run_coroutine_threadsafe(self._makeSemaphore(self.concurrency), self.loop).result()
+
+    def close(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+            self.loop = None
+        self.executor.shutdown(wait=False)
+
+    async def _makeSemaphore(self, value):
+        return asyncio.Semaphore(value)
+
+    def submit(self, urls, pages):
+        """
+        Ставит загрузку списка URL в фоновый цикл.
+        Результаты (url, ответ requests.Response или None при ошибке) помещаются в потокобезопасную очередь pages
+        в порядке завершения загрузки.
+        :return: concurrent.futures.Future, завершающийся после загрузки всех URL
+        """
+        return asyncio.run_coroutine_threadsafe(self.fetchAll(urls, pages), self.loop)
+
+    async def fetchAll(self, urls, pages):
+        await asyncio.gather(*(self._fetchInto(url, pages) for url in urls))
+
+    async def _fetchInto(self, url, pages):
+        try:
+            response = await self.fetch(url)
+        except Exception as e:
+            # Любая ошибка загрузки должна дать (url, None): потребитель ждет по одному результату на URL
+            print(f"Ошибка при запросе URL {url}: {e}")
+            response = None
+            if self.metrics is not None:
+                self.metrics.incr('fetch_errors')
+        # Очередь ограничена: ждем места в ней, не занимая потоки загрузки
+        await asyncio.get_running_loop().run_in_executor(None, pages.put, (url, response))
+
+    async def fetch(self, url):
+        """
+        Загружает страницу с учетом лимитов, таймаута и повторов.
+        :return: ответ requests.Response - код, заголовки (ETag, Last-Modified) и текст страницы
+        """
+        host = urlparse(url).netloc
+        hostLimit = self.hostLimits.get(host)
+        if hostLimit is None:
+            hostLimit = self.hostLimits[host] = asyncio.Semaphore(self.perHost)
+
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            # Сначала место у хоста, потом общее: запросы, ждущие занятый хост, не занимают общие места
+            async with hostLimit, self.limit:
+                try:
+                    start = time.perf_counter()
+                    response = await loop.run_in_executor(
+                        self.executor, lambda: requests.get(url, timeout=self.timeout))
+                    if self.metrics is not None:
+                        self.metrics.observe('fetch', time.perf_counter() - start)
+                    if response.status_code not in RETRY_STATUSES:
+                        return response
+                    error = requests.HTTPError(f"HTTP {response.status_code}", response=response)
+                except requests.RequestException as e:
+                    error = e
+
+            if attempt < self.retries:
+                if self.metrics is not None:
+                    self.metrics.incr('fetch_retries')
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+        raise error
@@ -0,0 +1,144 @@
+import hashlib
+import math
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from DAO import FrontierDAO, FRONTIER_QUEUED, FRONTIER_ACTIVE, FRONTIER_DONE, FRONTIER_FAILED
+
+# Параметры запроса, которые не меняют содержимое страницы (метки рекламных кампаний и счетчиков)
+TRACKING_PARAMS = {'fbclid', 'gclid', 'yclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', '_openstat'}
+TRACKING_PREFIXES = ('utm_',)
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def canonicalize(url):
+    """
+    Каноническая форма URL: схема и хост в нижнем регистре, без порта по умолчанию, без фрагмента (#...),
+    без параметров отслеживания, с отсортированными параметрами запроса и путем '/' вместо пустого.
+    :return: строка или None, если URL некорректен (нечисловой порт, незакрытая скобка IPv6 и т.п.)
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if ':' in host:
+        # Адрес IPv6 записывается в квадратных скобках, иначе его не отличить от порта
+        host = f"[{host}]"
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+    if parts.username:
+        host = f"{parts.username}{':' + parts.password if parts.password else ''}@{host}"
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)]
+    return urlunsplit((scheme, host, parts.path or '/', urlencode(sorted(query)), ''))
+
+
+def canonicalize_links(links):
+    """ Ссылки [(url, текст), ...] с каноническими URL; некорректные URL пропускаются """
+    result = []
+    for url, text in links:
+        url = canonicalize(url)
+        if url is not None:
+            result.append((url, text))
+    return result
+
+
+def host_of(url):
+    return urlsplit(url).netloc
+
+
+class BloomFilter:
+    """
+    Фильтр Блума: компактное множество с ложноположительными ответами (доля около errorRate
+    при capacity элементах) и без ложноотрицательных. Память - около 1.2 байта на элемент при errorRate = 1%.
+    """
+
+    def __init__(self, capacity=1000000, errorRate=0.01):
+        self.size = max(8, int(-capacity * math.log(errorRate) / math.log(2) ** 2))
+        self.hashCount = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Двойное хэширование: h1 + i * h2 дает hashCount независимых позиций из одного хэша
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashCount)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def nbytes(self):
+        return len(self.bits)
+
+
+class Frontier:
+    """
+    Очередь обхода, сохраняемая в БД (таблица frontier, FrontierDAO).
+    Встреченные URL хранятся в таблице, в памяти - только фильтр Блума: новые URL отсеиваются им без запроса к БД,
+    а при положительном ответе фильтра наличие проверяется в таблице.
+    URL выдаются пакетами с чередованием хостов (take). После перезапуска процесса обход продолжается
+    с того же места: URL, обработка которых прервалась, возвращаются в очередь.
+    """
+
+    def __init__(self, dbFileName, capacity=1000000, errorRate=0.01, owner=None):
+        """
+        :param capacity: ожидаемое число URL (размер фильтра Блума)
+        :param errorRate: допустимая доля ложных срабатываний фильтра
+        :param owner: владелец соединения (DAO.ConnectionManager); у краулера - его connectionOwner,
+                      чтобы состояние очереди фиксировалось в одной транзакции с индексом
+        """
+        self.dao = FrontierDAO(dbFileName, owner=owner)
+        self.seen = BloomFilter(capacity, errorRate)
+        for (url,) in self.dao.iter_urls():
+            self.seen.add(url)
+        self.resumed = self.dao.requeue_active()
+        self.dao.commit()
+
+    def add(self, urls, depth, priority=0.0):
+        """
+        Добавляет URL в очередь (без commit), повторно встреченные пропускаются.
+        :param urls: URL в любой форме - в очередь попадают канонические
+        :return: список добавленных канонических URL
+        """
+        candidates = [url for url in dict.fromkeys(canonicalize(url) for url in urls) if url is not None]
+        maybeSeen = [url for url in candidates if url in self.seen]
+        known = self.dao.get_seen(maybeSeen) if maybeSeen else set()
+        added = [url for url in candidates if url not in known]
+        if added:
+            self.dao.add_urls([(url, host_of(url), depth, priority) for url in added])
+            for url in added:
+                self.seen.add(url)
+        return added
+
+    def take(self, limit, maxDepth=None):
+        """ Следующие limit URL (url, depth) с глубиной меньше maxDepth; они помечаются как обрабатываемые """
+        return self.dao.take_batch(limit, maxDepth)
+
+    def done(self, urls):
+        self.dao.set_state(urls, FRONTIER_DONE)
+
+    def failed(self, urls):
+        self.dao.set_state(urls, FRONTIER_FAILED)
+
+    def commit(self):
+        self.dao.commit()
+
+    def stats(self):
+        counts = self.dao.get_counts()
+        return {
+            "queued": counts.get(FRONTIER_QUEUED, 0),
+            "active": counts.get(FRONTIER_ACTIVE, 0),
+            "done": counts.get(FRONTIER_DONE, 0),
+            "failed": counts.get(FRONTIER_FAILED, 0),
+            "resumed": self.resumed,
+            "bloom_bytes": self.seen.nbytes(),
+        }
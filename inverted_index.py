@@ -0,0 +1,217 @@
+import sys
+
+import numpy as np
+
+from postings import PostingList
+
+# Сколько строк wordlocation читать из БД за один раз при построении индекса
+LOAD_CHUNK_ROWS = 200000
+# Слова с таким числом вхождений и меньше хранятся не отдельными массивами, а в общих буферах индекса:
+# у редких слов заголовки массивов NumPy заняли бы больше памяти, чем сами данные
+SHARED_TERM_POSITIONS = 64
+
+
+def pack(values):
+    """ Упаковывает неотрицательные целые числа в массив NumPy минимальной разрядности """
+    values = np.asarray(values)
+    largest = int(values.max()) if len(values) else 0
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if largest <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+    return values.astype(np.uint64)
+
+
+def encode(doc_ids, counts, positions):
+    """
+    Разностное кодирование списка вхождений одного слова.
+    :param doc_ids: отсортированные уникальные url_id
+    :param counts: число позиций для каждого url_id
+    :param positions: позиции подряд по всем документам, внутри документа отсортированы
+    :return: (doc_deltas, counts, pos_deltas) - неупакованные массивы int64
+    """
+    doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    positions = np.asarray(positions, dtype=np.int64)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    pos_deltas = np.diff(positions, prepend=0)
+    # Первая позиция документа хранится как есть, чтобы документ распаковывался независимо от соседних
+    pos_deltas[starts] = positions[starts]
+    return np.diff(doc_ids, prepend=0), counts, pos_deltas
+
+
+class DocPositions:
+    """
+    Позиции слова по документам списка вхождений. Позиции документа распаковываются только при обращении
+    к нему - при пересечении с другими словами это лишь малая часть списка.
+    """
+    __slots__ = ('pos_deltas', 'bounds')
+
+    def __init__(self, counts, pos_deltas):
+        self.pos_deltas = pos_deltas
+        self.bounds = np.concatenate(([0], np.cumsum(counts, dtype=np.int64)))
+
+    def __len__(self):
+        return len(self.bounds) - 1
+
+    def __getitem__(self, j):
+        return np.cumsum(self.pos_deltas[self.bounds[j]:self.bounds[j + 1]], dtype=np.int64).tolist()
+
+
+class TermPostings:
+    """
+    Сжатый список вхождений одного слова:
+    doc_deltas - разности соседних url_id, counts - число позиций в каждом документе,
+    pos_deltas - разности соседних позиций внутри документа (первая позиция документа хранится как есть).
+    Массивы могут быть срезами общих буферов индекса (см. SHARED_TERM_POSITIONS).
+    """
+    __slots__ = ('doc_deltas', 'counts', 'pos_deltas')
+
+    def __init__(self, doc_deltas, counts, pos_deltas):
+        self.doc_deltas = doc_deltas
+        self.counts = counts
+        self.pos_deltas = pos_deltas
+
+    @classmethod
+    def from_postings(cls, doc_ids, counts, positions):
+        """ Кодирует и упаковывает список (параметры - как у encode) """
+        return cls(*(pack(array) for array in encode(doc_ids, counts, positions)))
+
+    def decode(self):
+        """
+        Распаковывает список в PostingList: url_id - массивом NumPy (intersect пересекает такие списки
+        без перевода в списки Python), позиции - лениво, по документам (DocPositions)
+        """
+        return PostingList(np.cumsum(self.doc_deltas, dtype=np.int64), DocPositions(self.counts, self.pos_deltas))
+
+    def nbytes(self):
+        """ Память, занимаемая списком (буферы и заголовки массивов) """
+        return sum(sys.getsizeof(array) for array in (self.doc_deltas, self.counts, self.pos_deltas))
+
+
+class InMemoryIndex:
+    """
+    Инвертированный индекс в памяти, построенный из wordlocation.
+    Реализует тот же интерфейс get_postings(word_id), что и WordLocationDAO, и может использоваться
+    как Searcher.postingSource: запросы обслуживаются без обращения к диску.
+    Частые слова хранятся отдельными TermPostings в self.terms, редкие - в общих буферах shared*
+    (словарь отсортированных word_id и границы каждого слова в буферах).
+    generation - поколение индекса (MetaDAO.get_generation), по данным которого построен индекс:
+    после изменения поколения индекс устарел и должен быть построен заново (см. Searcher.getPostingSource).
+    """
+
+    def __init__(self, generation=0):
+        self.generation = generation
+        self.terms = {}
+        empty = np.zeros(0, dtype=np.uint8)
+        self.sharedWordIds = empty
+        self.sharedDocBounds = np.zeros(1, dtype=np.uint8)
+        self.sharedPosBounds = np.zeros(1, dtype=np.uint8)
+        self.sharedDocDeltas = empty
+        self.sharedCounts = empty
+        self.sharedPosDeltas = empty
+
+    @classmethod
+    def load(cls, word_location_dao, generation=0):
+        """
+        Строит индекс по всей таблице wordlocation
+        :param generation: поколение индекса, прочитанное до чтения wordlocation
+        """
+        index = cls(generation)
+        word_ids, url_ids, locations = [], [], []
+        cursor = word_location_dao.iter_all_locations()
+        while True:
+            rows = cursor.fetchmany(LOAD_CHUNK_ROWS)
+            if not rows:
+                break
+            chunk = np.array(rows, dtype=np.int64)
+            word_ids.append(chunk[:, 0])
+            url_ids.append(chunk[:, 1])
+            locations.append(chunk[:, 2])
+        if word_ids:
+            index.build(np.concatenate(word_ids), np.concatenate(url_ids), np.concatenate(locations))
+        return index
+
+    def build(self, word_ids, url_ids, locations):
+        """ Заполняет индекс из массивов, отсортированных по (word_id, url_id, location) """
+        term_bounds = np.flatnonzero(np.diff(word_ids)) + 1
+        term_starts = np.concatenate(([0], term_bounds))
+        term_ends = np.concatenate((term_bounds, [len(word_ids)]))
+
+        shared = {"word_ids": [], "doc_counts": [], "pos_counts": [], "doc_deltas": [], "counts": [], "pos_deltas": []}
+        for start, end in zip(term_starts.tolist(), term_ends.tolist()):
+            docs = url_ids[start:end]
+            doc_bounds = np.concatenate(([0], np.flatnonzero(np.diff(docs)) + 1, [end - start]))
+            word_id = int(word_ids[start])
+            if end - start > SHARED_TERM_POSITIONS:
+                self.terms[word_id] = TermPostings.from_postings(
+                    docs[doc_bounds[:-1]], np.diff(doc_bounds), locations[start:end])
+                continue
+            doc_deltas, counts, pos_deltas = encode(docs[doc_bounds[:-1]], np.diff(doc_bounds), locations[start:end])
+            shared["word_ids"].append(word_id)
+            shared["doc_counts"].append(len(doc_deltas))
+            shared["pos_counts"].append(end - start)
+            shared["doc_deltas"].append(doc_deltas)
+            shared["counts"].append(counts)
+            shared["pos_deltas"].append(pos_deltas)
+
+        if shared["word_ids"]:
+            self.sharedWordIds = pack(shared["word_ids"])
+            self.sharedDocBounds = pack(np.concatenate(([0], np.cumsum(shared["doc_counts"]))))
+            self.sharedPosBounds = pack(np.concatenate(([0], np.cumsum(shared["pos_counts"]))))
+            self.sharedDocDeltas = pack(np.concatenate(shared["doc_deltas"]))
+            self.sharedCounts = pack(np.concatenate(shared["counts"]))
+            self.sharedPosDeltas = pack(np.concatenate(shared["pos_deltas"]))
+
+    def get_term(self, word_id):
+        """ Сжатый список слова (TermPostings; для редкого слова - над срезами общих буферов) или None """
+        term = self.terms.get(word_id)
+        if term is not None:
+            return term
+        i = int(np.searchsorted(self.sharedWordIds, word_id))
+        if i == len(self.sharedWordIds) or self.sharedWordIds[i] != word_id:
+            return None
+        docs = slice(int(self.sharedDocBounds[i]), int(self.sharedDocBounds[i + 1]))
+        positions = slice(int(self.sharedPosBounds[i]), int(self.sharedPosBounds[i + 1]))
+        return TermPostings(self.sharedDocDeltas[docs], self.sharedCounts[docs], self.sharedPosDeltas[positions])
+
+    def get_postings(self, word_id):
+        term = self.get_term(word_id)
+        if term is None:
+            return PostingList([], [])
+        return term.decode()
+
+    def term_count(self):
+        return len(self.terms) + len(self.sharedWordIds)
+
+    def shared_nbytes(self):
+        """ Память общих буферов редких слов """
+        return sum(sys.getsizeof(array) for array in (
+            self.sharedWordIds, self.sharedDocBounds, self.sharedPosBounds,
+            self.sharedDocDeltas, self.sharedCounts, self.sharedPosDeltas))
+
+    def memory_usage(self, word_id=None):
+        """
+        Память индекса в байтах.
+        :param word_id: если задан - только для этого слова (для редкого слова - его доля общих буферов),
+                        иначе общий объем индекса
+        """
+        if word_id is not None:
+            term = self.terms.get(word_id)
+            if term is not None:
+                return term.nbytes()
+            term = self.get_term(word_id)
+            return sum(array.nbytes for array in (term.doc_deltas, term.counts, term.pos_deltas)) if term else 0
+        return (sys.getsizeof(self.terms) + sum(term.nbytes() + sys.getsizeof(term) for term in self.terms.values())
+                + self.shared_nbytes())
+
+    def memory_report(self, limit=20):
+        """
+        Общий объем индекса и limit самых больших слов:
+        {'total': байт, 'term_count': слов, 'shared_terms': слов в общих буферах, 'shared': байт общих буферов,
+         'terms': [(word_id, байт), ...]}
+        """
+        sizes = sorted(((word_id, term.nbytes()) for word_id, term in self.terms.items()),
+                       key=lambda pair: pair[1], reverse=True)
+        return {"total": self.memory_usage(), "term_count": self.term_count(),
+                "shared_terms": len(self.sharedWordIds), "shared": self.shared_nbytes(), "terms": sizes[:limit]}
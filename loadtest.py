@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+from urllib.parse import urlsplit, urlencode
+
+import numpy as np
+
+from DAO import WordListDAO, TermStatsDAO
+from benchmark import make_queries, percentiles
+
+
+def load_queries(db_path, count, maxWords=3, zipf=1.1, seed=1):
+    """
+    Запросы из 1..maxWords слов индекса: слова выбираются по закону Ципфа среди слов,
+    упорядоченных по числу документов (частые слова - частые запросы)
+    """
+    words = dict(WordListDAO(db_path).get_words_with_ids(-1))
+    doc_freqs = TermStatsDAO(db_path).get_doc_freqs(words.values())
+    ranked = sorted(words, key=lambda word: -doc_freqs.get(words[word], 0))
+    rng = np.random.default_rng(seed)
+    queries = []
+    for wordCount in range(1, maxWords + 1):
+        queries += make_queries(ranked, words, count // maxWords + 1, wordCount, zipf, rng)
+    rng.shuffle(queries)
+    return queries[:count]
+
+
+async def fetch(reader, writer, host, target):
+    """ GET по открытому соединению keep-alive; :return: (код ответа, тело) """
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n".encode('latin-1'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def run(url, queries, concurrency=16, page=1, size=10, scoring=None, snippets=True):
+    """
+    Отправляет все запросы queries с concurrency соединений keep-alive (каждое - запросы по очереди).
+    :return: сводка: пропускная способность, задержки на клиенте и время стадий по ответам сервера
+    """
+    parts = urlsplit(url)
+    queue = asyncio.Queue()
+    for query in queries:
+        queue.put_nowait(query)
+    latencies, server = [], {}
+    statuses, results = Counter(), Counter()
+
+    async def worker():
+        reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+        try:
+            while not queue.empty():
+                params = {"q": queue.get_nowait(), "page": page, "size": size, "snippets": int(snippets)}
+                if scoring:
+                    params["scoring"] = scoring
+                start = time.perf_counter()
+                status, body = await fetch(reader, writer, parts.netloc, f"/search?{urlencode(params)}")
+                latencies.append(time.perf_counter() - start)
+                statuses[status] += 1
+                if status == 200:
+                    response = json.loads(body)
+                    results[bool(response["results"])] += 1
+                    for name, value in response["timing"].items():
+                        server.setdefault(name, []).append(value / 1000)
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(queries)))))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "requests_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "queries_with_results": results[True],
+        "latency": percentiles(latencies),
+        "server": {name: percentiles(values) for name, values in server.items()},
+    }
+
+
+def print_summary(result):
+    latency = result["latency"]
+    print(f"{result['requests']} запросов за {result['seconds']:.2f} с, {result['requests_per_sec']:.1f} запр/с "
+          f"при {result['concurrency']} соединениях; ответы {result['statuses']}, "
+          f"с результатами {result['queries_with_results']}")
+    print(f"Задержка: p50 {latency.get('p50_ms', 0):.2f} / p90 {latency.get('p90_ms', 0):.2f} / "
+          f"p99 {latency.get('p99_ms', 0):.2f} мс")
+    for name, summary in sorted(result["server"].items()):
+        print(f"  сервер {name[:-3]}: p50 {summary['p50_ms']:.2f} / p99 {summary['p99_ms']:.2f} мс")
+
+
+if __name__ == '__main__':
+    # python server.py search_engine.db &
+    # python loadtest.py search_engine.db --requests 2000 --concurrency 32
+    parser = argparse.ArgumentParser(description='Нагрузочный тест поискового сервиса (server.py) на localhost')
+    parser.add_argument('db', nargs='?', default='search_engine.db', help='БД, из словаря которой берутся запросы')
+    parser.add_argument('--url', default='http://127.0.0.1:8080')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--max-words', type=int, default=3)
+    parser.add_argument('--page', type=int, default=1)
+    parser.add_argument('--size', type=int, default=10)
+    parser.add_argument('--scoring', help='способ ранжирования; по умолчанию - сервера')
+    parser.add_argument('--no-snippets', action='store_true')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='сохранить сводку в JSON')
+    args = parser.parse_args()
+
+    queries = load_queries(args.db, args.requests, args.max_words, seed=args.seed)
+    result = asyncio.run(run(args.url, queries, args.concurrency, args.page, args.size, args.scoring,
+                             not args.no_snippets))
+    print_summary(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
@@ -34,7 +34,7 @@ def main():
     #searcher.calculatePageRank()
 
     searcher.getMatchRows("список новостей")
-    searcher.getSortedList("список новостей")
+    searcher.getSortedList("список новостей", highlight=True)
 
 # Press the green button in the gutter to run the script.
 if __name__ == '__main__':
@@ -0,0 +1,151 @@
+import bisect
+import csv
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Верхние границы корзин гистограммы, сек: от 10 мкс до 100 с с шагом ~x1.78 (4 корзины на порядок)
+BUCKET_BOUNDS = [10 ** (exp / 4) for exp in range(-20, 9)]
+
+
+class Histogram:
+    """ Гистограмма длительностей с фиксированными логарифмическими корзинами (сами значения не хранятся) """
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)  # последняя корзина - все, что больше BUCKET_BOUNDS[-1]
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q):
+        """ Оценка перцентиля q (0..100) - верхняя граница корзины, в которую он попадает """
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(BUCKET_BOUNDS[i], self.max) if i < len(BUCKET_BOUNDS) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class Metrics:
+    """
+    Счетчики и гистограммы времени стадий обработки (fetch, parse, tokenize, db_write, commit и т.д.).
+    Счетчики ведутся инкрементально, без запросов к БД. Снимок счетчиков добавляется в историю samples
+    не чаще раза в sampleInterval секунд (maybe_sample), история ограничена maxSamples записями.
+    Все методы потокобезопасны.
+    """
+
+    def __init__(self, sampleInterval=1.0, maxSamples=10000):
+        self.sampleInterval = sampleInterval
+        self.counters = {}
+        self.histograms = {}
+        self.samples = deque(maxlen=maxSamples)
+        self.started = time.monotonic()
+        self.lastSample = None
+        self.lock = threading.Lock()
+
+    def incr(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        with self.lock:
+            self.counters[name] = value
+
+    def get(self, name, default=0):
+        return self.counters.get(name, default)
+
+    def observe(self, name, seconds):
+        """ Добавляет длительность стадии name в ее гистограмму """
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """ with metrics.timer('commit'): ... - замер длительности блока """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def maybe_sample(self, force=False):
+        """
+        Сохраняет снимок счетчиков, если с прошлого снимка прошло не меньше sampleInterval секунд.
+        :return: снимок или None
+        """
+        now = time.monotonic()
+        with self.lock:
+            if not force and self.lastSample is not None and now - self.lastSample < self.sampleInterval:
+                return None
+            self.lastSample = now
+            sample = dict(self.counters, time=round(now - self.started, 3))
+            self.samples.append(sample)
+        return sample
+
+    def snapshot(self):
+        """ Текущее состояние: счетчики и сводки гистограмм """
+        with self.lock:
+            return {
+                "uptime": time.monotonic() - self.started,
+                "counters": dict(self.counters),
+                "timers": {name: histogram.summary() for name, histogram in self.histograms.items()},
+            }
+
+    def series(self, name):
+        """ Значения счетчика name по истории снимков (0 до первого появления) """
+        return [sample.get(name, 0) for sample in list(self.samples)]
+
+    def to_json(self, path):
+        """ Сохраняет снимок и историю в JSON """
+        data = self.snapshot()
+        data["samples"] = list(self.samples)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False, indent=2)
+
+    def to_csv(self, path):
+        """ Сохраняет историю снимков в CSV: столбец time и по столбцу на счетчик """
+        samples = list(self.samples)
+        fields = ['time'] + sorted({key for sample in samples for key in sample} - {'time'})
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=fields, restval=0)
+            writer.writeheader()
+            writer.writerows(samples)
+
+    def timers_to_csv(self, path):
+        """ Сохраняет сводки гистограмм в CSV: одна строка на стадию """
+        timers = self.snapshot()["timers"]
+        fields = ['stage', 'count', 'total', 'mean', 'min', 'p50', 'p90', 'p99', 'max']
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=fields)
+            writer.writeheader()
+            for name, summary in sorted(timers.items()):
+                writer.writerow(dict(summary, stage=name))
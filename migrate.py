@@ -0,0 +1,194 @@
+import os
+import sqlite3
+import sys
+import time
+
+from DAO import LINK_CHANGE_LOG_SQL, SECONDARY_INDEXES, TermStatsDAO, ForwardIndexDAO, has_table, is_without_rowid
+from DBcreate import create_tables_v2
+
+# Сколько самых частых слов использовать для замера времени запроса
+BENCHMARK_WORDS = 20
+# Сколько раз повторять замер для каждого слова
+BENCHMARK_REPEATS = 5
+
+
+def database_size(conn, db_path):
+    """ Размер файла БД вместе с журналом WAL (журнал предварительно сбрасывается в основной файл) """
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    size = os.path.getsize(db_path)
+    if os.path.exists(db_path + '-wal'):
+        size += os.path.getsize(db_path + '-wal')
+    return size
+
+
+def benchmark_postings(conn, word_ids):
+    """ Среднее время (мс) выборки списка вхождений слова - тот же запрос, что WordLocationDAO.get_postings """
+    if not word_ids:
+        return 0.0
+    sql = 'SELECT url_id, location FROM wordlocation WHERE word_id = ? ORDER BY url_id, location'
+    for word_id in word_ids:
+        conn.execute(sql, (word_id,)).fetchall()  # прогрев страничного кэша, чтобы сравнивать одинаковые условия
+    start = time.perf_counter()
+    for _ in range(BENCHMARK_REPEATS):
+        for word_id in word_ids:
+            conn.execute(sql, (word_id,)).fetchall()
+    return (time.perf_counter() - start) * 1000 / (BENCHMARK_REPEATS * len(word_ids))
+
+
+def remap_url_column(cursor, table, column, unique=False):
+    """
+    Переназначает ссылки на удаленные дубликаты URL (временная таблица urlmap) на оставляемый id.
+    :param unique: column - первичный ключ; если у оставляемого id уже есть строка, строка дубликата удаляется
+    """
+    moved = 'SELECT old_id FROM urlmap WHERE old_id != new_id'
+    cursor.execute(f'UPDATE {"OR IGNORE " if unique else ""}{table} '
+                   f'SET {column} = (SELECT new_id FROM urlmap WHERE old_id = {table}.{column}) '
+                   f'WHERE {column} IN ({moved})')
+    if unique:
+        cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({moved})')
+
+
+def copy_to_v2(conn):
+    """
+    Переносит данные в таблицы *_v2. Повторяющиеся слова и URL объединяются под наименьшим id,
+    повторяющиеся связи - под наименьшим id связи; ссылки на удаленные id переназначаются.
+    """
+    cursor = conn.cursor()
+    create_tables_v2(cursor, suffix='_v2')
+
+    # Соответствие старый id -> оставляемый id для дубликатов
+    cursor.execute('CREATE TEMP TABLE wordmap AS '
+                   'SELECT w.id AS old_id, k.id AS new_id FROM wordlist w '
+                   'JOIN (SELECT word, MIN(id) AS id FROM wordlist GROUP BY word) k ON k.word IS w.word')
+    cursor.execute('CREATE TEMP TABLE urlmap AS '
+                   'SELECT u.id AS old_id, k.id AS new_id FROM urllist u '
+                   'JOIN (SELECT url, MIN(id) AS id FROM urllist GROUP BY url) k ON k.url IS u.url')
+    cursor.execute('CREATE UNIQUE INDEX temp.wordmapidx ON wordmap(old_id)')
+    cursor.execute('CREATE UNIQUE INDEX temp.urlmapidx ON urlmap(old_id)')
+
+    cursor.execute('INSERT INTO urllist_v2 (id, url) SELECT MIN(id), url FROM urllist GROUP BY url')
+    cursor.execute('INSERT INTO wordlist_v2 (id, word, isFiltered) '
+                   'SELECT MIN(id), word, MAX(isFiltered) FROM wordlist GROUP BY word')
+
+    # Вставка в порядке первичного ключа заполняет B-дерево последовательно
+    cursor.execute('''
+        INSERT OR IGNORE INTO wordlocation_v2 (word_id, url_id, location)
+        SELECT wm.new_id, um.new_id, l.location
+        FROM wordlocation l
+        JOIN wordmap wm ON wm.old_id = l.word_id
+        JOIN urlmap um ON um.old_id = l.url_id
+        ORDER BY 1, 2, 3
+    ''')
+
+    cursor.execute('''
+        CREATE TEMP TABLE linkmap AS
+        SELECT l.id AS old_id, f.new_id AS from_url_id, t.new_id AS to_url_id
+        FROM link l
+        JOIN urlmap f ON f.old_id = l.from_url_id
+        JOIN urlmap t ON t.old_id = l.to_url_id
+    ''')
+    cursor.execute('INSERT INTO link_v2 (id, from_url_id, to_url_id) '
+                   'SELECT MIN(old_id), from_url_id, to_url_id FROM linkmap GROUP BY from_url_id, to_url_id')
+    cursor.execute('''
+        INSERT OR IGNORE INTO linkwords_v2 (word_id, link_id)
+        SELECT wm.new_id, k.id
+        FROM linkwords lw
+        JOIN wordmap wm ON wm.old_id = lw.word_id
+        JOIN linkmap m ON m.old_id = lw.link_id
+        JOIN link_v2 k ON k.from_url_id = m.from_url_id AND k.to_url_id = m.to_url_id
+        ORDER BY 2, 1
+    ''')
+
+    # PageRank хранится по url_id: ранги удаленных дубликатов URL больше не нужны
+    cursor.execute('DELETE FROM pagerank WHERE url_id NOT IN (SELECT id FROM urllist_v2)')
+    # Служебные таблицы по url_id переназначаются в той же транзакции (frontier хранит сами URL - не меняется);
+    # doclength, termfreq и forwardindex пересчитываются после миграции
+    if has_table(conn, 'fingerprint'):
+        remap_url_column(cursor, 'fingerprint', 'url_id', unique=True)
+    if has_table(conn, 'url_alias'):
+        remap_url_column(cursor, 'url_alias', 'url_id', unique=True)
+        remap_url_column(cursor, 'url_alias', 'canonical_id')
+        # Дубликат и его каноническая страница могли оказаться одним URL
+        cursor.execute('DELETE FROM url_alias WHERE url_id = canonical_id')
+    if has_table(conn, 'fetchstate'):
+        remap_url_column(cursor, 'fetchstate', 'url_id', unique=True)
+    if has_table(conn, 'linkchanges'):
+        remap_url_column(cursor, 'linkchanges', 'from_url_id')
+        remap_url_column(cursor, 'linkchanges', 'to_url_id')
+    for table in ('wordmap', 'urlmap', 'linkmap'):
+        cursor.execute(f'DROP TABLE temp.{table}')
+
+
+def swap_tables(conn):
+    """ Заменяет таблицы v1 на *_v2 и восстанавливает триггеры журнала связей и вторичные индексы """
+    cursor = conn.cursor()
+    for table in ('wordlocation', 'linkwords', 'link', 'wordlist', 'urllist'):
+        cursor.execute(f'DROP TABLE {table}')
+        cursor.execute(f'ALTER TABLE {table}_v2 RENAME TO {table}')
+    # Триггеры удалены вместе со старой таблицей link
+    for sql in LINK_CHANGE_LOG_SQL:
+        cursor.execute(sql)
+    # Индексы удалены вместе со старыми таблицами; wordlocation в v2 сама упорядочена по (word_id, url_id, location)
+    for name, sql in SECONDARY_INDEXES.items():
+        if name != 'wordlocidx':
+            cursor.execute(sql)
+    cursor.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', 2)")
+
+
+def migrate(db_path='search_engine.db'):
+    """
+    Переводит существующую БД на компактную схему v2 (DBcreate.create_tables_v2) на месте.
+    Перед запуском краулер и поисковик должны быть остановлены.
+    :return: словарь с размером БД и средним временем выборки вхождений до и после миграции
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        if is_without_rowid(conn, 'wordlocation'):
+            print(f"{db_path}: схема уже v2")
+            return None
+        # Счетчики в meta появились позже схемы v1 - создаем служебные таблицы, если их нет
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)')
+        conn.execute('CREATE TABLE IF NOT EXISTS pagerank (row_id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                     'url_id INTEGER, score REAL)')
+
+        word_ids = [row[0] for row in conn.execute(
+            'SELECT word_id FROM wordlocation GROUP BY word_id ORDER BY COUNT(*) DESC LIMIT ?', (BENCHMARK_WORDS,))]
+        before = {"bytes": database_size(conn, db_path), "postings_ms": benchmark_postings(conn, word_ids)}
+
+        start = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            copy_to_v2(conn)
+            swap_tables(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        # id слов и URL изменились - статистику корпуса для BM25 и прямой индекс пересчитываем по новым таблицам
+        # (через соединение с обычными транзакциями: conn работает в режиме autocommit)
+        rebuild_conn = sqlite3.connect(db_path)
+        try:
+            TermStatsDAO(db_path, conn=rebuild_conn).rebuild()
+            ForwardIndexDAO(db_path, conn=rebuild_conn).rebuild()
+        finally:
+            rebuild_conn.close()
+        conn.execute('VACUUM')
+        conn.execute('ANALYZE')
+        elapsed = time.perf_counter() - start
+
+        after = {"bytes": database_size(conn, db_path), "postings_ms": benchmark_postings(conn, word_ids)}
+    finally:
+        conn.close()
+
+    report = {"before": before, "after": after, "seconds": elapsed}
+    print(f"Миграция {db_path} на схему v2 за {elapsed:.1f} с")
+    print(f"Размер БД: {before['bytes'] / 2 ** 20:.2f} МБ -> {after['bytes'] / 2 ** 20:.2f} МБ "
+          f"({after['bytes'] / max(before['bytes'], 1):.0%})")
+    print(f"Выборка вхождений ({len(word_ids)} частых слов): "
+          f"{before['postings_ms']:.3f} мс -> {after['postings_ms']:.3f} мс")
+    return report
+
+
+if __name__ == '__main__':
+    # python migrate.py [search_engine.db]
+    migrate(sys.argv[1] if len(sys.argv) > 1 else 'search_engine.db')
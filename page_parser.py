@@ -0,0 +1,145 @@
+import re
+import time
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+# Союзы и частицы, которые не индексируются
+RUSSIAN_CONJUNCTIONS = {'и', 'а', 'но', 'или', 'да', 'же', 'что', 'как', 'когда', 'если', 'то', 'ли', 'не',
+                        'ни', 'либо', 'чтобы', 'хотя', 'зато'}
+
+WORD_RE = re.compile(r'\w+')
+
+# Теги, содержимое которых не является текстом страницы
+SKIPPED_TAGS = {'script', 'style'}
+# По сколько символов подавать HTML потоковому разборщику
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def separate_words(text):
+    """ Разделение на слова по пробелам и знакам препинания, без союзов """
+    return [word for word in WORD_RE.findall(text.lower()) if word not in RUSSIAN_CONJUNCTIONS]
+
+
+def is_followable(href):
+    """ Ссылки, которые краулер обходит: без якорей, mailto и файлов .apk """
+    return bool(href) and not href.startswith('#') and not href.startswith('mailto:') and not href.endswith('.apk')
+
+
+def absolute_url(base, href):
+    """ Абсолютный URL ссылки или None, если href некорректен (например, незакрытая скобка адреса IPv6) """
+    try:
+        return urljoin(base, href)
+    except ValueError:
+        return None
+
+
+class StreamingExtractor(HTMLParser):
+    """
+    Однопроходное извлечение слов и ссылок на html.parser без построения дерева.
+    Текст - как у BeautifulSoup.get_text(): текстовые узлы подряд, но без содержимого <script> и <style>.
+    Слова выделяются по мере поступления текста; слово, разрезанное границей фрагмента или тега,
+    дописывается следующим фрагментом.
+    """
+
+    def __init__(self, url):
+        super().__init__(convert_charrefs=True)
+        self.url = url
+        self.words = []
+        self.links = []
+        self.tail = ''      # незавершенное слово в конце последнего текстового фрагмента
+        self.skipDepth = 0  # вложенность пропускаемых тегов
+        self.anchors = []   # открытые <a>: [href, [части текста]]
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skipDepth += 1
+        elif tag == 'a':
+            self.anchors.append((dict(attrs).get('href'), []))
+
+    def handle_startendtag(self, tag, attrs):
+        if tag == 'a':
+            href = dict(attrs).get('href')
+            self.addLink(href, '')
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skipDepth = max(self.skipDepth - 1, 0)
+        elif tag == 'a' and self.anchors:
+            href, parts = self.anchors.pop()
+            self.addLink(href, ''.join(parts))
+
+    def addLink(self, href, text):
+        full_url = absolute_url(self.url, href) if is_followable(href) else None
+        if full_url is not None:
+            self.links.append((full_url, text))
+
+    def handle_data(self, data):
+        if self.skipDepth:
+            return
+        for _, parts in self.anchors:
+            parts.append(data)
+
+        text = self.tail + data.lower()
+        matches = WORD_RE.findall(text)
+        # Слово, доходящее до конца фрагмента, может продолжиться в следующем
+        if matches and WORD_RE.match(text[-1:]):
+            self.tail = matches.pop()
+        else:
+            self.tail = ''
+        self.words.extend(word for word in matches if word not in RUSSIAN_CONJUNCTIONS)
+
+    def close(self):
+        super().close()
+        # Незакрытые <a> в конце документа - как у BeautifulSoup, текст до конца страницы
+        while self.anchors:
+            self.handle_endtag('a')
+        if self.tail and self.tail not in RUSSIAN_CONJUNCTIONS:
+            self.words.append(self.tail)
+        self.tail = ''
+
+
+def extract_stream(url, chunks):
+    """
+    Потоковый разбор страницы, поступающей фрагментами (например, response.iter_content(decode_unicode=True)).
+    :return: (url, слова страницы, [(абсолютный url ссылки, текст ссылки), ...])
+    """
+    extractor = StreamingExtractor(url)
+    for chunk in chunks:
+        extractor.feed(chunk)
+    extractor.close()
+    return url, extractor.words, extractor.links
+
+
+def parse_page(url, html_doc, extractor='soup'):
+    """
+    Разбор HTML-страницы. Функция уровня модуля, чтобы ее можно было выполнять в пуле процессов.
+    :param extractor: 'soup' - дерево BeautifulSoup, 'stream' - однопроходный StreamingExtractor
+    :return: (url, слова страницы, [(абсолютный url ссылки, текст ссылки), ...])
+    """
+    return parse_page_timed(url, html_doc, extractor)[0]
+
+
+def parse_page_timed(url, html_doc, extractor='soup'):
+    """
+    То же, что parse_page, с замером стадий (для Metrics краулера, в том числе из пула процессов).
+    У потокового разбора стадии не разделяются: все время относится к разбору HTML.
+    :return: (результат parse_page, время разбора HTML, время разбиения на слова), сек
+    """
+    start = time.perf_counter()
+    if extractor == 'stream':
+        chunks = (html_doc[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(html_doc), STREAM_CHUNK_SIZE))
+        return extract_stream(url, chunks), time.perf_counter() - start, 0.0
+    if extractor != 'soup':
+        raise ValueError(f"Неизвестный способ разбора страницы: {extractor}")
+    soup = BeautifulSoup(html_doc, "html.parser")
+    text = soup.get_text()
+    links = []
+    for link in soup.find_all('a', href=True):
+        full_url = absolute_url(url, link.get('href')) if is_followable(link.get('href')) else None
+        if full_url is not None:
+            links.append((full_url, link.get_text()))
+    parsed = time.perf_counter()
+    words = separate_words(text)
+    return (url, words, links), parsed - start, time.perf_counter() - parsed
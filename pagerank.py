@@ -0,0 +1,140 @@
+import numpy as np
+
+
+class LinkGraph:
+    """
+    Граф ссылок в разреженном формате CSR по входящим ссылкам:
+    входящие в вершину i ребра - indices[indptr[i]:indptr[i + 1]] (индексы ссылающихся вершин).
+    Вершины - позиции url_id в отсортированном массиве url_ids, повторяющиеся ребра (from, to) учитываются один раз.
+    """
+
+    def __init__(self, url_ids, edges):
+        """
+        :param url_ids: все id из urllist
+        :param edges: итерируемый набор пар (from_url_id, to_url_id)
+        """
+        self.url_ids = np.unique(np.asarray(url_ids, dtype=np.int64))
+        n = len(self.url_ids)
+
+        pairs = np.fromiter((value for edge in edges for value in edge), dtype=np.int64).reshape(-1, 2)
+        src = np.searchsorted(self.url_ids, pairs[:, 0])
+        dst = np.searchsorted(self.url_ids, pairs[:, 1])
+        # Отбрасываем ребра на url_id, которых нет в urllist
+        known = (src < n) & (dst < n)
+        known[known] &= (self.url_ids[src[known]] == pairs[known, 0]) & (self.url_ids[dst[known]] == pairs[known, 1])
+        src, dst = src[known], dst[known]
+
+        # Удаляем повторяющиеся ребра
+        keys = np.unique(dst * n + src)
+        dst, src = keys // n, keys % n
+
+        self.size = n
+        self.out_degree = np.bincount(src, minlength=n)
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(dst, minlength=n))))
+        self.indices = src  # ключи отсортированы по dst, т.е. ребра уже сгруппированы по строкам CSR
+        self.rows = dst     # номер строки для каждого ребра - для векторного умножения через bincount
+
+        # Исходящие ссылки в том же формате - для инкрементального пересчета
+        order = np.argsort(src, kind='stable')
+        self.out_indptr = np.concatenate(([0], np.cumsum(self.out_degree)))
+        self.out_indices = dst[order]
+
+    def in_links(self, nodes):
+        """ Входящие ребра вершин nodes: (номер вершины в nodes для каждого ребра, ссылающаяся вершина) """
+        return gather(self.indptr, self.indices, nodes)
+
+    def out_neighbors(self, nodes):
+        """ Вершины, на которые ссылаются nodes (без повторов) """
+        return np.unique(gather(self.out_indptr, self.out_indices, nodes)[1])
+
+    def index_of(self, url_ids):
+        """ Позиции url_id в массивах графа """
+        return np.searchsorted(self.url_ids, np.asarray(url_ids, dtype=np.int64))
+
+
+def gather(indptr, indices, nodes):
+    """
+    Соседи набора вершин в CSR без цикла по вершинам.
+    :return: (номер вершины в nodes для каждого соседа, массив соседей)
+    """
+    nodes = np.asarray(nodes, dtype=np.int64)
+    starts = indptr[nodes]
+    lengths = indptr[nodes + 1] - starts
+    owners = np.repeat(np.arange(len(nodes)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return owners, indices[np.repeat(starts, lengths) + offsets]
+
+
+def page_rank_residual(graph, scores, damping=0.85):
+    """ Невязка: максимальное изменение ранга за одну полную итерацию из состояния scores """
+    if graph.size == 0:
+        return 0.0
+    dangling = graph.out_degree == 0
+    contrib = np.where(dangling, 0.0, scores / np.maximum(graph.out_degree, 1))
+    incoming = np.bincount(graph.rows, weights=contrib[graph.indices], minlength=graph.size)
+    new_scores = (1 - damping) + damping * (incoming + scores[dangling].sum() / graph.size)
+    return float(np.abs(new_scores - scores).max())
+
+
+def update_page_rank(graph, scores, seeds, damping=0.85, tolerance=1e-6, max_iterations=100):
+    """
+    Инкрементальный пересчет PageRank от готового приближения scores.
+    Пересчитываются только вершины seeds и их исходящие соседи; дальше изменения распространяются
+    по исходящим ссылкам, пока изменение ранга больше tolerance.
+    :param seeds: вершины, у которых изменились входящие или исходящие ссылки
+    :return: (ранги, маска пересчитанных вершин, число итераций)
+    """
+    n = graph.size
+    scores = np.asarray(scores, dtype=np.float64).copy()
+    touched = np.zeros(n, dtype=bool)
+    if n == 0:
+        return scores, touched, 0
+
+    dangling = graph.out_degree == 0
+    inv_out = np.zeros(n)
+    inv_out[~dangling] = 1.0 / graph.out_degree[~dangling]
+
+    seeds = np.unique(np.asarray(seeds, dtype=np.int64))
+    active = np.union1d(seeds, graph.out_neighbors(seeds))
+    iteration = 0
+    while len(active) and iteration < max_iterations:
+        iteration += 1
+        touched[active] = True
+        owners, sources = graph.in_links(active)
+        incoming = np.bincount(owners, weights=scores[sources] * inv_out[sources], minlength=len(active))
+        new_values = (1 - damping) + damping * (incoming + scores[dangling].sum() / n)
+        changed = active[np.abs(new_values - scores[active]) >= tolerance]
+        scores[active] = new_values
+        # Изменение ранга вершины влияет на тех, на кого она ссылается
+        active = np.union1d(changed, graph.out_neighbors(changed))
+    return scores, touched, iteration
+
+
+def compute_page_rank(graph, damping=0.85, tolerance=1e-6, max_iterations=100, initial=None):
+    """
+    Итеративный расчет PageRank в масштабе исходной формулы (PR = 0.15 + 0.85 * sum(PR(v) / L(v))),
+    сумма рангов равна числу страниц. Ранг страниц без исходящих ссылок распределяется равномерно.
+    :param initial: начальное приближение (по умолчанию все ранги равны 1)
+    :return: (массив рангов в порядке graph.url_ids, число итераций, невязка - макс. изменение ранга)
+    """
+    n = graph.size
+    if n == 0:
+        return np.zeros(0), 0, 0.0
+
+    scores = np.ones(n) if initial is None else np.asarray(initial, dtype=np.float64).copy()
+    dangling = graph.out_degree == 0
+    inv_out = np.zeros(n)
+    inv_out[~dangling] = 1.0 / graph.out_degree[~dangling]
+
+    residual = np.inf
+    iteration = 0
+    for iteration in range(1, max_iterations + 1):
+        contrib = scores * inv_out
+        incoming = np.bincount(graph.rows, weights=contrib[graph.indices], minlength=n)
+        dangling_share = scores[dangling].sum() / n
+        new_scores = (1 - damping) + damping * (incoming + dangling_share)
+        residual = float(np.abs(new_scores - scores).max())
+        scores = new_scores
+        if residual < tolerance:
+            break
+    return scores, iteration, residual
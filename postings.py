@@ -0,0 +1,238 @@
+import heapq
+from bisect import bisect_left
+
+import numpy as np
+
+
+class PostingList:
+    """ Список вхождений слова: отсортированные url_id и отсортированные позиции слова в каждом из них """
+    __slots__ = ('doc_ids', 'positions')
+
+    def __init__(self, doc_ids, positions):
+        self.doc_ids = doc_ids
+        self.positions = positions
+
+    @classmethod
+    def from_rows(cls, rows):
+        """ Строит список из строк (url_id, location), отсортированных по url_id, location """
+        doc_ids = []
+        positions = []
+        last = None
+        for url_id, location in rows:
+            if url_id != last:
+                doc_ids.append(url_id)
+                positions.append([])
+                last = url_id
+            positions[-1].append(location)
+        return cls(doc_ids, positions)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+
+class ArrayPositions:
+    """
+    Позиции слова по документам поверх одного массива NumPy (например, отображенного в память сегмента):
+    позиции документа j - positions[starts[j]:ends[j]]; в список Python переводится только запрошенный документ.
+    """
+    __slots__ = ('positions', 'starts', 'ends')
+
+    def __init__(self, positions, starts, ends):
+        self.positions = positions
+        self.starts = starts
+        self.ends = ends
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, j):
+        return self.positions[self.starts[j]:self.ends[j]].tolist()
+
+
+def gallop(values, target, lo=0):
+    """
+    Экспоненциальный (galloping) поиск: первый индекс i >= lo, для которого values[i] >= target.
+    Работает за O(log d), где d - расстояние до найденного элемента, поэтому проход по длинному
+    списку короткими шагами стоит меньше, чем бинарный поиск по всему списку на каждом шаге.
+    """
+    size = len(values)
+    step = 1
+    hi = lo
+    while hi < size and values[hi] < target:
+        lo = hi + 1
+        hi += step
+        step *= 2
+    return bisect_left(values, target, lo, min(hi, size))
+
+
+def intersect(postings):
+    """
+    Пересечение списков вхождений по url_id. Проходит по самому короткому списку,
+    в остальных продвигается галопирующим поиском.
+    :param postings: список PostingList, по одному на слово запроса
+    :return: генератор (url_id, [индекс документа в каждом из postings])
+    """
+    if not postings or any(len(posting) == 0 for posting in postings):
+        return
+    if all(isinstance(posting.doc_ids, np.ndarray) for posting in postings):
+        yield from intersect_arrays(postings)
+        return
+    order = sorted(range(len(postings)), key=lambda i: len(postings[i]))
+    first = order[0]
+    cursors = [0] * len(postings)
+
+    for k, doc in enumerate(postings[first].doc_ids):
+        indexes = [0] * len(postings)
+        indexes[first] = k
+        for i in order[1:]:
+            doc_ids = postings[i].doc_ids
+            pos = gallop(doc_ids, doc, cursors[i])
+            cursors[i] = pos
+            if pos == len(doc_ids):
+                return  # один из списков исчерпан - совпадений больше не будет
+            if doc_ids[pos] != doc:
+                break
+            indexes[i] = pos
+        else:
+            yield doc, indexes
+
+
+def intersect_arrays(postings):
+    """
+    intersect для списков, у которых url_id - отсортированные массивы NumPy (InMemoryIndex):
+    документы самого короткого списка ищутся в каждом следующем одним вызовом searchsorted,
+    в списки Python переводятся только общие документы.
+    """
+    order = sorted(range(len(postings)), key=lambda i: len(postings[i]))
+    docs = postings[order[0]].doc_ids
+    for i in order[1:]:
+        doc_ids = postings[i].doc_ids
+        found = np.searchsorted(doc_ids, docs)
+        hit = found < len(doc_ids)
+        hit[hit] = doc_ids[found[hit]] == docs[hit]
+        docs = docs[hit]
+    indexes = [np.searchsorted(posting.doc_ids, docs).tolist() for posting in postings]
+    for doc, row in zip(docs.tolist(), zip(*indexes)):
+        yield doc, list(row)
+
+
+def min_location_rows(postings):
+    """
+    Для каждого документа, содержащего все слова, возвращает строку (url_id, loc_0, loc_1, ...)
+    с первой позицией каждого слова. Минимальная сумма позиций по всем комбинациям равна сумме
+    первых позиций, поэтому комбинации не перебираются, а locationScore дает тот же результат.
+    """
+    for doc, indexes in intersect(postings):
+        yield (doc,) + tuple(posting.positions[j][0] for posting, j in zip(postings, indexes))
+
+
+def phrase_positions(positionLists):
+    """
+    Позиции начала фразы: p, для которых p + i есть в positionLists[i] для каждого слова i фразы.
+    Списки сливаются попарно двумя указателями - время линейно по числу позиций.
+    :param positionLists: отсортированные позиции слов фразы в документе, в порядке слов
+    """
+    result = positionLists[0]
+    for shift, positions in enumerate(positionLists[1:], 1):
+        merged = []
+        i = j = 0
+        while i < len(result) and j < len(positions):
+            target = positions[j] - shift
+            if result[i] == target:
+                merged.append(target)
+                i += 1
+                j += 1
+            elif result[i] < target:
+                i += 1
+            else:
+                j += 1
+        result = merged
+        if not result:
+            break
+    return result
+
+
+def near_positions(left, leftLength, right, rightLength, distance):
+    """
+    Вхождения right, рядом с которыми есть вхождение left: между концом одного и началом другого
+    не больше distance позиций (в любом порядке; соседние слова - расстояние 1). Линейный проход.
+    :param left: отсортированные позиции начала вхождений длины leftLength
+    :param right: отсортированные позиции начала вхождений длины rightLength
+    :return: подходящие позиции из right
+    """
+    result = []
+    i = 0
+    for start in right:
+        # Вхождения left, закончившиеся раньше start - distance, не подойдут и следующим вхождениям right
+        while i < len(left) and left[i] + leftLength - 1 < start - distance:
+            i += 1
+        if i == len(left):
+            break
+        if left[i] <= start + rightLength - 1 + distance:
+            result.append(start)
+    return result
+
+
+def min_window(positionLists):
+    """
+    Длина наименьшего отрезка текста, содержащего хотя бы одно вхождение каждого слова.
+    Позиции всех слов сливаются (heapq.merge) и проходятся скользящим окном - O(n log m) для n позиций m слов.
+    :return: длина окна в словах или None, если какого-то слова в документе нет
+    """
+    if not positionLists or not all(positionLists):
+        return None
+    merged = heapq.merge(*[[(position, term) for position in positions]
+                           for term, positions in enumerate(positionLists)])
+    counts = [0] * len(positionLists)
+    covered = 0
+    window = []
+    head = 0
+    best = None
+    for position, term in merged:
+        window.append((position, term))
+        if not counts[term]:
+            covered += 1
+        counts[term] += 1
+        # Сужаем окно слева, пока оно содержит все слова
+        while covered == len(positionLists):
+            start, first = window[head]
+            if best is None or position - start + 1 < best:
+                best = position - start + 1
+            head += 1
+            counts[first] -= 1
+            if not counts[first]:
+                covered -= 1
+    return best
+
+
+def best_window(positionLists, width):
+    """
+    Окно из width позиций с наибольшим числом разных слов (при равенстве - с наибольшим числом вхождений).
+    Слитые позиции всех слов проходятся скользящим окном - O(n log m) для n позиций m слов.
+    :return: позиция начала окна (найденные вхождения - в его середине) или None, если вхождений нет
+    """
+    merged = list(heapq.merge(*[[(position, term) for position in positions]
+                                for term, positions in enumerate(positionLists)]))
+    if not merged:
+        return None
+    counts = [0] * len(positionLists)
+    distinct = 0
+    best = None
+    end = 0
+    for start, (position, term) in enumerate(merged):
+        # Добавляем вхождения, попадающие в окно [position, position + width)
+        while end < len(merged) and merged[end][0] < position + width:
+            added = merged[end][1]
+            if not counts[added]:
+                distinct += 1
+            counts[added] += 1
+            end += 1
+        score = (distinct, end - start)
+        if best is None or score > best[0]:
+            best = (score, position, merged[end - 1][0])
+        counts[term] -= 1
+        if not counts[term]:
+            distinct -= 1
+
+    _, first, last = best
+    return max(0, first - (width - (last - first + 1)) // 2)
@@ -0,0 +1,91 @@
+import re
+
+from page_parser import separate_words
+from postings import phrase_positions, near_positions
+
+# Фраза в кавычках (закрывающая кавычка может отсутствовать), оператор близости NEAR или NEAR/k, отдельное слово
+QUERY_TOKEN_RE = re.compile(r'"(?P<phrase>[^"]*)"?|(?P<near>\bNEAR(?:/(?P<distance>\d+))?)(?=\s|"|$)|(?P<word>[^\s"]+)')
+# Расстояние для NEAR без явного k
+NEAR_DISTANCE = 10
+
+
+class Clause:
+    """
+    Условие запроса: фразы phrases (списки слов, идущих подряд), соседние из которых стоят
+    не дальше distances[i] слов друг от друга ("a NEAR/3 b"). Условие из одной фразы - фраза
+    в кавычках или отдельное слово. Документ подходит под запрос, если выполнены все условия.
+    """
+    __slots__ = ('phrases', 'distances')
+
+    def __init__(self, phrases, distances=()):
+        self.phrases = phrases
+        self.distances = list(distances)
+
+    def is_word(self):
+        return len(self.phrases) == 1 and len(self.phrases[0]) == 1
+
+    def __repr__(self):
+        parts = [f'"{" ".join(self.phrases[0])}"']
+        for distance, phrase in zip(self.distances, self.phrases[1:]):
+            parts.append(f'NEAR/{distance} "{" ".join(phrase)}"')
+        return ' '.join(parts)
+
+
+def parse_query(queryString):
+    """
+    Разбор запроса: слова, фразы в кавычках ("список новостей") и оператор близости NEAR/k между ними
+    (между словами не больше k - 1 других слов; NEAR без k - NEAR_DISTANCE).
+    Слова выделяются так же, как при индексации (separate_words), поэтому союзы внутри фраз пропускаются.
+    :return: список Clause
+    """
+    clauses = []
+    pendingDistance = None
+    for match in QUERY_TOKEN_RE.finditer(queryString):
+        if match.group('near'):
+            if pendingDistance is not None or not clauses:
+                raise ValueError(f"Оператор NEAR без левого операнда в запросе: {queryString}")
+            pendingDistance = int(match.group('distance') or NEAR_DISTANCE)
+            continue
+
+        # Слово со знаками препинания внутри (например, web-сервер) становится фразой
+        words = separate_words(match.group('phrase') or match.group('word') or '')
+        if not words:
+            continue
+        if pendingDistance is not None:
+            clauses[-1].phrases.append(words)
+            clauses[-1].distances.append(pendingDistance)
+            pendingDistance = None
+        else:
+            clauses.append(Clause([words]))
+
+    if pendingDistance is not None:
+        raise ValueError(f"Оператор NEAR без правого операнда в запросе: {queryString}")
+    return clauses
+
+
+def clause_matches(clause, positions):
+    """
+    Проверка условия в документе слиянием позиций: вхождения фраз находятся phrase_positions,
+    условия NEAR/k проверяются слева направо near_positions - без соединений в SQL.
+    :param positions: словарь {слово: отсортированные позиции слова в документе}
+    """
+    occurrences = phrase_positions([positions[word] for word in clause.phrases[0]])
+    length = len(clause.phrases[0])
+    for distance, phrase in zip(clause.distances, clause.phrases[1:]):
+        if not occurrences:
+            return False
+        # Остаются вхождения фразы, рядом с которыми выполнена вся цепочка условий слева
+        occurrences = near_positions(occurrences, length,
+                                     phrase_positions([positions[word] for word in phrase]), len(phrase), distance)
+        length = len(phrase)
+    return bool(occurrences)
+
+
+def query_words(clauses):
+    """ Все слова условий запроса в порядке следования """
+    return [word for clause in clauses for phrase in clause.phrases for word in phrase]
+
+
+def has_operators(clauses):
+    """ True, если в запросе есть фразы или NEAR (иначе это список отдельных слов) """
+    return not all(clause.is_word() for clause in clauses)
@@ -1,25 +1,79 @@
-import sqlite3
-import requests
-from bs4 import BeautifulSoup
-from DAO import UrlListDAO, WordListDAO, WordLocationDAO, LinkDAO, LinkWordsDAO, PageRankDAO
-from DBcreate import create_db
-import matplotlib.pyplot as plt
+import heapq
+import math
+import threading
+from bisect import bisect_left
+from DAO import UrlListDAO, WordListDAO, WordLocationDAO, LinkDAO, LinkWordsDAO, PageRankDAO, MetaDAO, TermStatsDAO, \
+    ForwardIndexDAO
+from cache import IdCache, QueryCache
+from pagerank import LinkGraph, compute_page_rank, update_page_rank, page_rank_residual
+from postings import min_location_rows, intersect, min_window, best_window
+from query import parse_query, query_words, has_operators, clause_matches
+from inverted_index import InMemoryIndex
+from segments import SegmentIndex
 import numpy as np
 
+# Способы вычисления M1: 'location' - близость слов к началу страницы, 'bm25' и 'tfidf' - по статистике корпуса,
+# 'proximity' - по наименьшему окну текста со всеми словами запроса
+SCORING_MODES = ('location', 'bm25', 'tfidf', 'proximity')
+# Веса в M3: m1 - ранг по тексту (SCORING_MODES), m2 - PageRank, anchor - ранг по текстам входящих ссылок
+DEFAULT_WEIGHTS = {'m1': 1.0, 'm2': 1.0, 'anchor': 0.0}
+
+
+class UnknownWordError(LookupError):
+    """ Слова запроса нет в индексе (wordlist) - у запроса заведомо нет результатов """
+
+
+class EmptyCorpusStatsError(RuntimeError):
+    """ Статистика корпуса (TermStatsDAO) пуста - ранжирование 'bm25'/'tfidf' невозможно до ее построения """
+
+
 class Searcher:
-    def __init__(self, dbFileName):
-        """ Initialize the Searcher with DAOs and database connection """
+    # Параметры BM25: насыщение частоты слова и степень нормализации по длине документа
+    connectionOwner = 'searcher'  # владелец соединений DAO (DAO.ConnectionManager)
+    bm25K1 = 1.2
+    bm25B = 0.75
+    # Длина фрагмента текста результата (getSnippet) в словах и разметка слов запроса в нем
+    snippetWidth = 30
+    snippetMark = ('<b>', '</b>')
+
+    def __init__(self, dbFileName, idCache=None, matchEngine='postings', inMemoryIndex=False, queryCache=None):
+        """ Initialize the Searcher with DAOs and database connection.
+        idCache - shared word/url -> id cache (IdCache), a private one is created by default
+        matchEngine - 'postings' (posting-list intersection) or 'join' (N-way wordlocation self-join)
+        inMemoryIndex - load wordlocation into a compressed in-memory index and serve postings from it
+        queryCache - QueryCache for getSortedList results, invalidated by the index generation in meta """
         # Establish a shared connection to the database
         self.dbFileName = dbFileName
-        #self.connection = sqlite3.connect(dbFileName)
 
-        # Initialize DAO classes with the shared connection
-        self.url_dao = UrlListDAO(dbFileName)
-        self.word_dao = WordListDAO(dbFileName)
-        self.word_location_dao = WordLocationDAO(dbFileName)
-        self.page_rank_dao = PageRankDAO(dbFileName)
+        # Initialize DAO classes; they share one connection per thread and owner (DAO.connection_manager),
+        # so a Searcher can be used from several threads and never commits a crawler's open batch
+        self.url_dao = UrlListDAO(dbFileName, owner=self.connectionOwner)
+        self.word_dao = WordListDAO(dbFileName, owner=self.connectionOwner)
+        self.word_location_dao = WordLocationDAO(dbFileName, owner=self.connectionOwner)
+        self.page_rank_dao = PageRankDAO(dbFileName, owner=self.connectionOwner)
+        self.meta_dao = MetaDAO(dbFileName, owner=self.connectionOwner)
+        self.link_words_dao = LinkWordsDAO(dbFileName, owner=self.connectionOwner)
+        self.term_stats_dao = TermStatsDAO(dbFileName, owner=self.connectionOwner)
+        self.forward_index_dao = ForwardIndexDAO(dbFileName, owner=self.connectionOwner)
         # Add additional DAO initializations if necessary (e.g., WordLocationDAO)
 
+        self.matchEngine = matchEngine
+        self.verbose = True      # печать промежуточных результатов
+        self.pageRanks = None    # PageRank в памяти {urlid: score}, см. loadPageRank
+        self.pageRankGeneration = None  # поколение индекса, по которому загружен pageRanks
+        self.scoring = 'location'               # способ вычисления M1 по умолчанию, см. SCORING_MODES
+        self.weights = dict(DEFAULT_WEIGHTS)    # веса M1, M2 и ранга по текстам ссылок в M3 по умолчанию
+        self.queryCache = queryCache
+        # Источник списков вхождений: любой объект с методом get_postings(word_id)
+        self.postingSource = self.word_location_dao
+        self.indexLock = threading.Lock()  # перезагрузка устаревших данных в памяти, см. refreshStale
+        if inMemoryIndex:
+            self.loadInMemoryIndex()
+
+        self.idCache = idCache if idCache is not None else IdCache()
+        if not self.idCache.warmed:
+            self.idCache.warm(self.word_dao, self.url_dao)
+
     def getWordsIds(self, queryString):
         """
         Получение идентификаторов для каждого слова в queryString.
@@ -30,20 +84,25 @@ class Searcher:
         queryString = queryString.lower()
 
         # Разделить на отдельные слова
-        queryWordsList = queryString.split(" ")
+        queryWordsList = queryString.split()
 
         # Список для хранения результата
         rowidList = []
 
         # Для каждого слова получить его идентификатор из БД
         for word in queryWordsList:
-            word_id = self.word_dao.get_word_id(word)  # Получаем ID слова через DAO
+            word_id = self.idCache.words.get(word)
+            if word_id is None:
+                word_id = self.word_dao.get_word_id(word)  # Получаем ID слова через DAO
+                if word_id is not None:
+                    self.idCache.words.put(word, word_id)
 
             if word_id is not None:
                 rowidList.append(word_id)
-                print(f"Слово '{word}' найдено с идентификатором: {word_id}")
+                if self.verbose:
+                    print(f"Слово '{word}' найдено с идентификатором: {word_id}")
             else:
-                raise Exception(f"Слово '{word}' не найдено в базе данных!")
+                raise UnknownWordError(f"Слово '{word}' не найдено в базе данных!")
 
         return rowidList
 
@@ -55,10 +114,79 @@ class Searcher:
         """
 
         wordsidList = self.getWordsIds(queryString)
-        # Использовать DAO для поиска строк, соответствующих искомым словам
-        rows = self.word_location_dao.get_match_rows(wordsidList)
+        if self.matchEngine == 'join':
+            # Использовать DAO для поиска строк, соответствующих искомым словам
+            rows = self.word_location_dao.get_match_rows(wordsidList)
+        else:
+            # Одна строка на документ: первые позиции слов дают ту же минимальную сумму, что и полный перебор
+            rows = list(min_location_rows(self.getPostings(wordsidList)))
         return rows, wordsidList
 
+    def getPhraseMatches(self, clauses):
+        """
+        Документы, удовлетворяющие всем условиям запроса (фразы в кавычках, NEAR/k, см. query.parse_query).
+        Списки вхождений слов пересекаются по url_id, условия проверяются слиянием позиций внутри документа.
+        :param clauses: разобранный запрос (список query.Clause)
+        :return: ({urlId: [позиции каждого слова из wordids]}, wordids) - wordids без повторов, в порядке запроса
+        """
+        words = list(dict.fromkeys(query_words(clauses)))
+        wordids = self.getWordsIds(' '.join(words))
+        postings = self.getPostings(wordids)
+
+        matches = {}
+        for doc, indexes in intersect(postings):
+            positions = [posting.positions[j] for posting, j in zip(postings, indexes)]
+            wordPositions = dict(zip(words, positions))
+            if all(clause_matches(clause, wordPositions) for clause in clauses):
+                matches[doc] = positions
+        return matches, wordids
+
+    def loadInMemoryIndex(self):
+        """ Строит сжатый индекс в памяти (InMemoryIndex) и переключает на него поиск """
+        # Поколение читается до данных: изменения, записанные во время построения, сделают индекс устаревшим
+        generation = self.meta_dao.get_generation()
+        self.postingSource = InMemoryIndex.load(self.word_location_dao, generation)
+        report = self.postingSource.memory_report(limit=0)
+        print(f"Индекс в памяти: {report['term_count']} слов, {report['total'] / 1024 / 1024:.1f} МБ")
+        return self.postingSource
+
+    def refreshStale(self):
+        """
+        Данные в памяти, загруженные по более старому поколению индекса (MetaDAO.get_generation), загружаются
+        заново: индекс в памяти (запросы к нему не видели бы новых страниц) и PageRank (после пересчета
+        краулером или другим процессом). Пока один поток перезагружает данные, остальные ждут на self.indexLock.
+        """
+        inMemory = isinstance(self.postingSource, InMemoryIndex)
+        if not inMemory and self.pageRanks is None:
+            return
+        generation = self.meta_dao.get_generation()
+        if (inMemory and self.postingSource.generation < generation) or \
+                (self.pageRanks is not None and self.pageRankGeneration < generation):
+            with self.indexLock:
+                if isinstance(self.postingSource, InMemoryIndex) and self.postingSource.generation < generation:
+                    self.loadInMemoryIndex()
+                if self.pageRanks is not None and self.pageRankGeneration < generation:
+                    self.loadPageRank()
+
+    def getPostingSource(self):
+        """ Источник списков вхождений для очередного запроса (устаревший индекс в памяти строится заново) """
+        self.refreshStale()
+        return self.postingSource
+
+    def useSegments(self, directory):
+        """ Переключает поиск на сегментный индекс (SegmentIndex) в каталоге directory """
+        self.postingSource = SegmentIndex(directory)
+        return self.postingSource
+
+    def getPostings(self, wordsidList):
+        """ Списки вхождений для слов запроса (каждый список загружается один раз, все - из одного источника) """
+        source = self.getPostingSource()
+        loaded = {}
+        for word_id in wordsidList:
+            if word_id not in loaded:
+                loaded[word_id] = source.get_postings(word_id)
+        return [loaded[word_id] for word_id in wordsidList]
+
     def normalizeScores(self, scores, smallIsBetter=0):
 
         resultDict = dict()  # словарь с результатом
@@ -97,7 +225,8 @@ class Searcher:
         for row in rowsLoc:
             urlId = row[0]  # предполагаем, что первый элемент - это urlId
             # Инициализируем значение на случай, если для этого URLId еще не было записано расстояние
-            locationsDict[urlId] = 1000000
+            if urlId not in locationsDict:
+                locationsDict[urlId] = 1000000
 
             # Получаем все позиции искомых слов (все кроме первого элемента)
             positions = row[1:]  # loc_q1, loc_q2, ...
@@ -112,62 +241,203 @@ class Searcher:
         # Передать словарь дистанций в функцию нормализации, режим "чем больше, тем лучше"
         return self.normalizeScores(locationsDict, smallIsBetter=1)
 
-    def getSortedList(self, queryString):
+    def anchorScore(self, urlIds, wordids):
         """
-        На поисковый запрос формирует список URL, вычисляет ранги, выводит в отсортированном порядке.
-        :param queryString: поисковый запрос
-        :return: отсортированный список URL
+        Ранг по текстам входящих ссылок: число ссылок на страницу, в тексте которых есть слова запроса.
+        Берется из отдельного поля индекса (LinkWordsDAO.get_anchor_postings) - по одному запросу на слово.
+        :return: словарь {urlid: нормализованный ранг} для всех urlIds
         """
+        counts = dict.fromkeys(urlIds, 0)
+        for word_id in set(wordids):
+            for urlid, count in self.link_words_dao.get_anchor_postings(word_id).items():
+                if urlid in counts:
+                    counts[urlid] += count
+        if not counts or not max(counts.values()):
+            return counts
+        return self.normalizeScores(counts)
+
+    def proximityScore(self, matches):
+        """
+        Ранг по близости слов запроса друг к другу: длина наименьшего окна текста со всеми словами (min_window).
+        :param matches: {urlId: [позиции каждого слова запроса]} - результат getPhraseMatches
+        :return: словарь {urlid: нормализованный ранг}, чем меньше окно, тем выше
+        """
+        return self.normalizeScores({urlid: min_window(positions) for urlid, positions in matches.items()},
+                                    smallIsBetter=1)
 
-        # Получить rowsLoc и wordids от getMatchRows(queryString)
-        rowsLoc, wordids = self.getMatchRows(queryString)
-
-        # Получить m1Scores - словарь {id URL страниц где встретились искомые слова: вычисленный нормализованный РАНГ}
-        m1Scores = self.locationScore(rowsLoc)
-
-        m2Scores = {}
-        for row in rowsLoc:
-            urlId = row[0]
-            if urlId is not None:  # Проверяем, что urlid не None
-                m2Scores[urlId] = self.page_rank_dao.get_page_rank(urlId)[0]  # Получаем ранк для каждого URL
+    def relevanceScore(self, wordids, scoring='bm25', candidates=None):
+        """
+        Ранг BM25 или tf-idf страниц, содержащих все слова запроса, по статистике корпуса (TermStatsDAO):
+        частоты - по одному запросу к termfreq на слово, df и длины документов - пакетными запросами,
+        агрегирующих запросов к wordlocation нет.
+        :param candidates: если задано - ранжировать только эти страницы (например, совпавшие с фразой)
+        :return: словарь {urlid: нормализованный ранг}
+        """
+        docCount, avgLength = self.term_stats_dao.get_corpus_stats()
+        if not docCount:
+            raise EmptyCorpusStatsError("Статистика корпуса пуста: заполните ее через TermStatsDAO.rebuild()")
+
+        uniqueIds = list(dict.fromkeys(wordids))
+        postings = [self.term_stats_dao.get_term_postings(word_id) for word_id in uniqueIds]
+        # Кандидаты - страницы со всеми словами запроса, как в getMatchRows
+        restrict = candidates
+        candidates = set(min(postings, key=len))
+        for termPostings in postings:
+            candidates.intersection_update(termPostings)
+        if restrict is not None:
+            candidates.intersection_update(restrict)
+        if not candidates:
+            return {}
+
+        docFreqs = self.term_stats_dao.get_doc_freqs(uniqueIds)
+        lengths = self.term_stats_dao.get_doc_lengths(candidates) if scoring == 'bm25' else {}
+        scores = dict.fromkeys(candidates, 0.0)
+        for word_id, termPostings in zip(uniqueIds, postings):
+            df = docFreqs.get(word_id, len(termPostings))
+            if scoring == 'bm25':
+                idf = math.log(1 + (docCount - df + 0.5) / (df + 0.5))
+                for urlid in candidates:
+                    tf = termPostings[urlid]
+                    norm = self.bm25K1 * (1 - self.bm25B + self.bm25B * lengths.get(urlid, avgLength) / avgLength)
+                    scores[urlid] += idf * tf * (self.bm25K1 + 1) / (tf + norm)
             else:
-                m2Scores[urlId] = 0  # Если urlid None, задаем 0
-
-        # Создать список для последующей сортировки
-        rankedScoresList = []
-        for urlid in m1Scores.keys():
-            # Получаем M1 и M2
-            m1 = m1Scores.get(urlid, 0)  # Если нет M1, то 0
-            m2 = m2Scores.get(urlid, 0)  # Если нет M2, то 0
-
-            # Вычисляем M3
-            m3 = (m1 + m2) / 2  # Среднее значение M1 и M2
-
-            # Добавляем к списку кортеж с (M3, urlid, url_text)
-            url_text = self.url_dao.get_url(urlid)  # Получаем текст URL
-            rankedScoresList.append((m3, urlid, url_text))
-
-        # Сортировка по M3 по убыванию
-        rankedScoresList.sort(reverse=True, key=lambda pair: pair[0])
+                idf = math.log(1 + docCount / df)
+                for urlid in candidates:
+                    scores[urlid] += (1 + math.log(termPostings[urlid])) * idf
 
-        print("urlid, M1, M2, M3, URL_text")
-        for m3, urlid, url_text in rankedScoresList[:10]:  # Первые 10 результатов
-            m1 = m1Scores.get(urlid, 0)  # Получаем M1 для текущего urlid
-            m2 = m2Scores.get(urlid, 0)  # Получаем M2 для текущего urlid
+        return self.normalizeScores(scores)
 
-            # Печатаем результат в нужном формате
-            print("{:<5} {:.2f} {:.2f} {:.2f}  {}".format(urlid, m1, m2, m3, url_text))
-
-        # Передаем первые три URL и queryString в highlight_words_in_html
-        search_words = queryString.split()  # Разделяем строку запроса на слова
-        for i, (m3, urlid, url_text) in enumerate(rankedScoresList[:3]):
-            output_file = f"highlighted_words_{i + 1}.html"  # Название файла для сохранения
-            self.highlight_words_in_html(url_text, search_words, output_file)
+    def getSortedList(self, queryString, k=10, highlight=False, scoring=None, weights=None):
+        """
+        На поисковый запрос формирует список URL, вычисляет ранги, выводит в отсортированном порядке.
+        :param queryString: поисковый запрос
+        :param k: сколько лучших результатов вернуть
+        :param highlight: добавить к каждому результату фрагмент текста с выделенными словами запроса (getSnippet)
+        :param scoring: способ вычисления M1 (SCORING_MODES); по умолчанию self.scoring
+        :param weights: веса {'m1': ..., 'm2': ..., 'anchor': ...} в M3, заменяющие соответствующие из self.weights
+        :return: отсортированный список (M3, urlid, (urlid, url)) из не более чем k элементов;
+                 при highlight=True - (M3, urlid, (urlid, url), фрагмент)
+        """
+        scoring = scoring or self.scoring
+        if scoring not in SCORING_MODES:
+            raise ValueError(f"Неизвестный способ ранжирования: {scoring}")
+        weights = dict(self.weights, **(weights or {}))
+
+        if self.queryCache is not None:
+            key = (QueryCache.normalize(queryString), k, self.matchEngine, scoring, tuple(sorted(weights.items())))
+            generation = self.meta_dao.get_generation()
+            cached = self.queryCache.get(key, generation)
+            if cached is None:
+                cached = self.rankQuery(queryString, k, scoring, weights)
+                self.queryCache.put(key, cached, generation)
+            rankedScoresList, m1Scores, m2Scores = cached
+        else:
+            rankedScoresList, m1Scores, m2Scores = self.rankQuery(queryString, k, scoring, weights)
+
+        if self.verbose:
+            print("urlid, M1, M2, M3, URL_text")
+            for m3, urlid, url_text in rankedScoresList:
+                m1 = m1Scores.get(urlid, 0)  # Получаем M1 для текущего urlid
+                m2 = m2Scores.get(urlid, 0)  # Получаем M2 для текущего urlid
+
+                # Печатаем результат в нужном формате
+                print("{:<5} {:.2f} {:.2f} {:.2f}  {}".format(urlid, m1, m2, m3, url_text))
+
+        if highlight:
+            # Фрагменты строятся в памяти по прямому индексу, а не по всем словам страниц
+            rankedScoresList = [(m3, urlid, url_text, self.getSnippet(urlid, queryString))
+                                for m3, urlid, url_text in rankedScoresList]
+            if self.verbose:
+                for m3, urlid, url_text, snippet in rankedScoresList:
+                    print(f"{urlid}: {snippet['text'] if snippet else ''}")
 
         return rankedScoresList  # Возвращаем отсортированный список, если это необходимо
 
-
-    def calculatePageRank(self, iterations=5):
+    def rankQuery(self, queryString, k, scoring='location', weights=None):
+        """
+        Вычисление k лучших результатов запроса.
+        :return: (список (M3, urlid, (urlid, url)), {urlid: M1}, {urlid: M2}) - M1/M2 только для попавших в выдачу
+        """
+        weights = weights or self.weights
+        clauses = parse_query(queryString)
+        # Слова запроса выделяются так же, как при индексации: без кавычек, союзов и знаков препинания
+        words = ' '.join(query_words(clauses))
+        if not words:
+            return [], {}, {}
+        if scoring == 'proximity' or has_operators(clauses):
+            # Фразы и NEAR/k проверяются по позициям слов; они же дают ранг близости
+            matches, wordids = self.getPhraseMatches(clauses)
+            if not matches:
+                return [], {}, {}
+            if scoring == 'proximity':
+                m1Scores = self.proximityScore(matches)
+            elif scoring == 'location':
+                m1Scores = self.locationScore([(urlid,) + tuple(positions[0] for positions in wordPositions)
+                                               for urlid, wordPositions in matches.items()])
+            else:
+                m1Scores = self.relevanceScore(wordids, scoring, candidates=matches.keys())
+                if not m1Scores:
+                    return [], {}, {}
+        elif scoring == 'location':
+            # Получить rowsLoc и wordids от getMatchRows
+            rowsLoc, wordids = self.getMatchRows(words)
+            if not rowsLoc:
+                return [], {}, {}
+
+            # Получить m1Scores - словарь {id URL страниц где встретились искомые слова: вычисленный нормализованный РАНГ}
+            m1Scores = self.locationScore(rowsLoc)
+        else:
+            # BM25/tf-idf: позиции слов не нужны, только статистика корпуса
+            wordids = self.getWordsIds(words)
+            m1Scores = self.relevanceScore(wordids, scoring)
+            if not m1Scores:
+                return [], {}, {}
+
+        # PageRank для всех кандидатов одним запросом (или из памяти, см. loadPageRank)
+        m2Scores = self.getPageRankScores(m1Scores.keys())
+
+        # Оставляем в куче только k лучших по M3 = взвешенное среднее M1, M2 и ранга по текстам ссылок
+        w1, w2, wAnchor = weights.get('m1', 0), weights.get('m2', 0), weights.get('anchor', 0)
+        total = (w1 + w2 + wAnchor) or 1
+        anchorScores = self.anchorScore(m1Scores.keys(), wordids) if wAnchor else {}
+        top = heapq.nlargest(k, (((w1 * m1 + w2 * m2Scores.get(urlid, 0) + wAnchor * anchorScores.get(urlid, 0))
+                                  / total, urlid) for urlid, m1 in m1Scores.items()))
+
+        # Текст URL загружаем только для попавших в выдачу
+        urls = self.url_dao.get_urls([urlid for _, urlid in top])
+        rankedScoresList = [(m3, urlid, urls.get(urlid)) for m3, urlid in top]
+
+        return rankedScoresList, {urlid: m1Scores[urlid] for _, urlid, _ in rankedScoresList}, \
+            {urlid: m2Scores.get(urlid, 0) for _, urlid, _ in rankedScoresList}
+
+    def loadPageRank(self):
+        """
+        Загружает все значения PageRank в память; дальше getSortedList не обращается за ними к БД,
+        пока не изменится поколение индекса (refreshStale)
+        """
+        # Поколение читается до данных: пересчет, записанный во время загрузки, вызовет повторную загрузку
+        generation = self.meta_dao.get_generation()
+        self.pageRanks = dict(self.page_rank_dao.get_all_page_rank())
+        self.pageRankGeneration = generation
+        return self.pageRanks
+
+    def getPageRankScores(self, urlIds):
+        """ Словарь {urlid: PageRank} для набора URL; отсутствующие в pagerank URL не попадают в словарь """
+        if self.pageRanks is not None:
+            self.refreshStale()
+            pageRanks = self.pageRanks
+            return {urlid: pageRanks[urlid] for urlid in urlIds if urlid in pageRanks}
+        return self.page_rank_dao.get_page_ranks(urlIds)
+
+    def calculatePageRank(self, iterations=100, tolerance=1e-6, damping=0.85):
+        """
+        Расчет PageRank: граф ссылок один раз загружается из link в CSR-массивы,
+        итерации выполняются векторно в NumPy до сходимости (не более iterations),
+        нормализованные на максимум ранги записываются в pagerank одной транзакцией.
+        :param iterations: максимальное число итераций
+        :param tolerance: итерации прекращаются, когда максимальное изменение ранга меньше tolerance
+        :param damping: коэффициент затухания
+        """
         # Подготовка БД ------------------------------------------
         # стираем текущее содержимое таблицы PageRank
         self.page_rank_dao.clear_page_rank()
@@ -175,38 +445,126 @@ class Searcher:
         # Создаем индексы
         self.page_rank_dao.create_indexes()
 
-        # В начальный момент ранг для каждого URL равен 1
-        self.page_rank_dao.initialize_page_rank()
+        graph = LinkGraph(self.page_rank_dao.get_all_urlids(), self.page_rank_dao.get_all_links())
+        scores, iterationsDone, residual = compute_page_rank(graph, damping, tolerance, iterations)
+        print(f"PageRank: {iterationsDone} итераций, невязка {residual:.2e}")
 
-        # Цикл Вычисление PageRank в несколько итераций
-        for i in range(iterations):
-            print(f"Итерация {i + 1}")
+        # Нормализация (как в pagerankScore) и запись результата
+        scale = float(scores.max()) if graph.size else 1.0
+        self.page_rank_dao.ensure_link_change_log()
+        self.page_rank_dao.clear_link_changes()
+        self.page_rank_dao.replace_page_rank(zip(graph.url_ids.tolist(), (scores / scale).tolist()))
+        self.finishPageRank(scale, residual)
 
-            # Получаем все URL для обновления PageRank
-            urlids = self.page_rank_dao.get_all_urlids()
-            for urlid in urlids:
-                pr = 0.15  # коэффициент
-                linking_pr = 0  # начальный ранг для ссылающихся страниц
-
-                # Получаем все уникальные ссылки, которые ссылаются на текущий urlid
-                from_ids = self.page_rank_dao.get_linking_urls(urlid)
-
-                for fromid in from_ids:
-                    linking_score = self.page_rank_dao.get_page_rank(fromid)
-                    linking_count = self.page_rank_dao.get_link_count(fromid)
-
-                    if linking_count > 0:
-                        linking_pr += linking_score / linking_count
-
-                # Обновляем PR с учетом ссылающихся страниц
-                pr += linking_pr * 0.85
-
-                # Обновляем значение score в таблице pagerank БД
-                self.page_rank_dao.update_page_rank(urlid, pr)
-
-        # Вызов функции для нормализации всех значений PageRank
-        self.pagerankScore()
-        #self.commit()
+    def calculatePageRankIncremental(self, iterations=100, tolerance=1e-6, damping=0.85):
+        """
+        Инкрементальный PageRank после небольшого обхода: начальное приближение - сохраненные ранги,
+        пересчитываются только страницы, у которых изменились ссылки (журнал linkchanges), и страницы,
+        до которых дошло изменение их рангов. Если полного расчета еще не было, выполняется calculatePageRank.
+        :return: невязка полученного решения (макс. изменение ранга за одну полную итерацию)
+        """
+        scale = self.meta_dao.get_value('pagerank_scale')
+        if scale is None:
+            self.calculatePageRank(iterations, tolerance, damping)
+            return self.meta_dao.get_value('pagerank_residual')
+
+        graph = LinkGraph(self.page_rank_dao.get_all_urlids(), self.page_rank_dao.get_all_links())
+        stored = dict(self.page_rank_dao.get_all_page_rank())
+        # Ненормализованные ранги; новые страницы начинают с 1, как в полном расчете
+        scores = np.array([stored.get(url_id, 1.0 / scale) * scale for url_id in graph.url_ids.tolist()])
+        new_urls = [url_id for url_id in graph.url_ids.tolist() if url_id not in stored]
+        # Сумма рангов точного решения равна числу страниц
+        if graph.size:
+            scores *= graph.size / scores.sum()
+
+        changed = self.page_rank_dao.get_changed_link_urls() + new_urls
+        seeds = graph.index_of(changed) if changed else np.zeros(0, dtype=np.int64)
+        seeds = seeds[seeds < graph.size]
+        scores, touched, iterationsDone = update_page_rank(graph, scores, seeds, damping, tolerance, iterations)
+        residual = page_rank_residual(graph, scores, damping)
+        if residual >= tolerance:
+            # Изменение рангов висячих страниц сдвигает ранги всех страниц:
+            # догоняем полными векторными итерациями от уже близкого приближения
+            local = scores
+            scores, extra, residual = compute_page_rank(graph, damping, tolerance, iterations,
+                                                        initial=local * graph.size / local.sum())
+            touched |= np.abs(scores - local) >= tolerance
+            iterationsDone += extra
+        print(f"PageRank (инкрементально): пересчитано {int(touched.sum())} из {graph.size} страниц "
+              f"за {iterationsDone} итераций, невязка {residual:.2e}")
+
+        newScale = float(scores.max()) if graph.size else 1.0
+        url_ids = graph.url_ids.tolist()
+        if abs(newScale - scale) <= tolerance * scale:
+            # Максимум не изменился - достаточно переписать пересчитанные строки
+            newScale = scale
+            rows = [(url_ids[i], scores[i] / scale) for i in np.flatnonzero(touched).tolist()]
+        else:
+            rows = list(zip(url_ids, (scores / newScale).tolist()))
+        new_set = set(new_urls)
+        self.page_rank_dao.clear_link_changes()
+        self.page_rank_dao.update_page_ranks([row for row in rows if row[0] not in new_set],
+                                             [row for row in rows if row[0] in new_set])
+        self.finishPageRank(newScale, residual)
+        return residual
+
+    def finishPageRank(self, scale, residual):
+        """ Сохраняет масштаб рангов и невязку для следующего инкрементального расчета и сбрасывает кэши """
+        self.meta_dao.set_value('pagerank_scale', scale)
+        self.meta_dao.set_value('pagerank_residual', residual)
+
+        # Новое поколение индекса сбрасывает кэш результатов поиска и PageRank в памяти у других экземпляров
+        self.meta_dao.bump_generation()
+        self.meta_dao.commit()
+        if self.pageRanks is not None:
+            self.loadPageRank()
+
+    def getPositions(self, word_id, urlid):
+        """
+        Отсортированные позиции слова на странице из текущего источника вхождений (getPostingSource):
+        в режиме сегментов таблица wordlocation пуста. Из wordlocation - запросом по (word_id, url_id),
+        без загрузки всего списка вхождений слова.
+        """
+        source = self.getPostingSource()
+        if source is self.word_location_dao:
+            return source.get_positions(word_id, urlid)
+        postings = source.get_postings(word_id)
+        j = bisect_left(postings.doc_ids, urlid)
+        if j < len(postings) and postings.doc_ids[j] == urlid:
+            return [int(position) for position in postings.positions[j]]
+        return []
+
+    def getSnippet(self, urlid, queryString, width=None):
+        """
+        Фрагмент текста страницы вокруг слов запроса: окно из width слов с наибольшим числом разных слов запроса
+        (best_window), слова запроса выделены snippetMark. Позиции слов запроса берутся из источника вхождений
+        (getPositions), текст окна - из прямого индекса (ForwardIndexDAO), поэтому время пропорционально окну,
+        а не странице.
+        Текст фрагмента составлен из слов индекса (в нижнем регистре, без знаков препинания).
+        :return: {"start": позиция первого слова, "end": позиция за последним, "text": строка}
+                 или None, если страницы нет в прямом индексе
+        """
+        width = width or self.snippetWidth
+        length = self.forward_index_dao.get_length(urlid)
+        if length is None:
+            return None
+
+        wordIds = self.word_dao.get_word_ids(query_words(parse_query(queryString)))
+        queryIds = set(wordIds.values())
+        start = best_window([self.getPositions(word_id, urlid) for word_id in queryIds], width)
+        # Без слов запроса на странице - ее начало; окно не выходит за конец страницы
+        start = max(0, min(start or 0, length - width))
+        tokens = self.forward_index_dao.get_tokens(urlid, start, start + width)
+        words = self.word_dao.get_words(tokens)
+
+        opening, closing = self.snippetMark
+        parts = ['...'] if start > 0 else []
+        for word_id in tokens:
+            word = words.get(word_id, '')
+            parts.append(f"{opening}{word}{closing}" if word_id in queryIds else word)
+        if start + len(tokens) < length:
+            parts.append('...')
+        return {"start": start, "end": start + len(tokens), "text": ' '.join(parts)}
 
     def highlight_words_in_html(self, urlid, search_words, output_file='highlighted_words.html'):
         # Получаем url_id из url
@@ -230,12 +588,11 @@ class Searcher:
             <h1>Слова для URL: {url}</h1>
             <ul>
         """
-        # Создаем список слов с выделением искомых
-        for word in words:
-            if word in search_words:
-                html_content += f"<li class='highlight'>{word}</li>"  # Подсвечиваем искомое слово синим цветом
-            else:
-                html_content += f"<li>{word}</li>"
+        # Создаем список слов с выделением искомых (части собираются в список и соединяются один раз)
+        search_words = set(search_words)
+        items = [f"<li class='highlight'>{word}</li>" if word in search_words else f"<li>{word}</li>"
+                 for word in words]
+        html_content += ''.join(items)
 
         html_content += """
             </ul>
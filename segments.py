@@ -0,0 +1,293 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+
+import numpy as np
+
+from postings import PostingList, ArrayPositions
+
+# Формат файла сегмента (little-endian):
+#   заголовок HEADER: сигнатура, версия, число слов, число документов;
+#   словарь: записи TERM_DTYPE (word_id, смещение блока, длина блока в uint32), отсортированные по word_id;
+#   отсортированные url_id документов сегмента (uint64);
+#   блоки вхождений (uint32): число документов n, url_id[n], число позиций[n], позиции подряд по документам.
+MAGIC = b'SEG1'
+VERSION = 1
+HEADER = struct.Struct('<4sIQQ')
+TERM_DTYPE = np.dtype([('word_id', '<u8'), ('offset', '<u8'), ('length', '<u8')])
+DOC_DTYPE = np.dtype('<u8')
+BLOCK_DTYPE = np.dtype('<u4')
+MANIFEST = 'segments.json'
+
+
+def write_segment(path, terms, doc_ids):
+    """
+    Записывает неизменяемый сегмент. Файл сначала пишется во временный и затем атомарно переименовывается.
+    :param terms: {word_id: [(url_id, [позиции]), ...]}
+    :param doc_ids: url_id всех документов сегмента
+    """
+    word_ids = sorted(terms)
+    docs = np.unique(np.asarray(list(doc_ids), dtype=DOC_DTYPE))
+    entries = np.zeros(len(word_ids), dtype=TERM_DTYPE)
+    offset = HEADER.size + entries.nbytes + docs.nbytes
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(word_ids), len(docs)))
+        file.seek(offset)
+        for i, word_id in enumerate(word_ids):
+            postings = sorted(terms[word_id])
+            block = np.array([len(postings)]
+                             + [url_id for url_id, _ in postings]
+                             + [len(positions) for _, positions in postings]
+                             + [location for _, positions in postings for location in positions],
+                             dtype=BLOCK_DTYPE)
+            entries[i] = (word_id, offset, len(block))
+            file.write(block.tobytes())
+            offset += block.nbytes
+        file.seek(HEADER.size)
+        file.write(entries.tobytes())
+        file.write(docs.tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+class Segment:
+    """ Читатель сегмента: файл отображается в память (mmap), массивы NumPy ссылаются на него без копирования """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(path, 'rb') as file:
+            self.mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self.mm)
+        magic, version, term_count, doc_count = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: неизвестный формат сегмента")
+        self.terms = np.frombuffer(self.mm, dtype=TERM_DTYPE, count=term_count, offset=HEADER.size)
+        self.word_ids = self.terms['word_id']
+        self.doc_ids = np.frombuffer(self.mm, dtype=DOC_DTYPE, count=doc_count,
+                                     offset=HEADER.size + self.terms.nbytes)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def get_block(self, word_id):
+        """ Блок вхождений слова (массив uint32 поверх mmap) или None """
+        i = int(np.searchsorted(self.word_ids, word_id))
+        if i == len(self.word_ids) or self.word_ids[i] != word_id:
+            return None
+        _, offset, length = self.terms[i]
+        return np.frombuffer(self.mm, dtype=BLOCK_DTYPE, count=int(length), offset=int(offset))
+
+    def get_postings(self, word_id):
+        """
+        Вхождения слова в этом сегменте без копирования: (url_id, число позиций, позиции) -
+        срезы блока поверх mmap; url_id по возрастанию. None, если слова в сегменте нет.
+        """
+        block = self.get_block(word_id)
+        if block is None:
+            return None
+        n = int(block[0])
+        return block[1:n + 1], block[n + 1:2 * n + 1], block[2 * n + 1:]
+
+    def iter_postings(self, word_id):
+        """ Пары (url_id, [позиции]) слова в этом сегменте, по возрастанию url_id (для слияния сегментов) """
+        postings = self.get_postings(word_id)
+        if postings is None:
+            return []
+        doc_ids, counts, positions = postings
+        ends = np.cumsum(counts, dtype=np.int64)
+        lists = ArrayPositions(positions, ends - counts, ends)
+        return [(doc, lists[j]) for j, doc in enumerate(doc_ids.tolist())]
+
+    def iter_terms(self):
+        """ Все (word_id, [(url_id, [позиции]), ...]) сегмента - для слияния """
+        for word_id in self.word_ids.tolist():
+            yield word_id, self.iter_postings(word_id)
+
+    def has_doc(self, url_id):
+        i = int(np.searchsorted(self.doc_ids, url_id))
+        return i < len(self.doc_ids) and self.doc_ids[i] == url_id
+
+
+class SegmentIndex:
+    """
+    Индекс из неизменяемых сегментов в каталоге directory. Список живых сегментов хранится в segments.json.
+    Новые сегменты добавляет один писатель (краулер); читатели (Searcher) подхватывают их через refresh().
+    Мелкие сегменты объединяются maybe_merge() - вручную или в фоновом потоке (start_background_merge).
+    Реализует get_postings(word_id) и может использоваться как Searcher.postingSource.
+    """
+
+    def __init__(self, directory, mergeFactor=4, maxMergeBytes=64 * 1024 * 1024):
+        """
+        :param mergeFactor: сколько мелких сегментов объединять за раз
+        :param maxMergeBytes: сегменты больше этого размера в слиянии не участвуют
+        """
+        self.directory = directory
+        self.mergeFactor = mergeFactor
+        self.maxMergeBytes = maxMergeBytes
+        self.lock = threading.Lock()
+        self.segments = []
+        self.nextId = 1
+        self.manifestMtime = None
+        self.mergeThread = None
+        self.mergeStop = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+        self.refresh()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def refresh(self):
+        """ Перечитывает segments.json, если он изменился """
+        path = self._path(MANIFEST)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self.manifestMtime:
+            return
+        with self.lock:
+            with open(path, encoding='utf-8') as file:
+                manifest = json.load(file)
+            opened = {segment.name: segment for segment in self.segments}
+            self.segments = [opened.get(name) or Segment(self._path(name)) for name in manifest['segments']]
+            self.nextId = manifest['next_id']
+            self.manifestMtime = mtime
+
+    def _writeManifest(self):
+        """ Атомарно сохраняет список сегментов (вызывается под self.lock) """
+        path = self._path(MANIFEST)
+        with open(path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump({"next_id": self.nextId, "segments": [segment.name for segment in self.segments]}, file)
+        os.replace(path + '.tmp', path)
+        self.manifestMtime = os.stat(path).st_mtime_ns
+
+    def _newSegmentName(self):
+        with self.lock:
+            name = f"seg_{self.nextId:06d}.seg"
+            self.nextId += 1
+        return name
+
+    def add_segment(self, terms, doc_ids):
+        """ Записывает новый сегмент из {word_id: [(url_id, [позиции]), ...]} и делает его видимым """
+        name = self._newSegmentName()
+        write_segment(self._path(name), terms, doc_ids)
+        with self.lock:
+            self.segments.append(Segment(self._path(name)))
+            self._writeManifest()
+
+    def get_postings(self, word_id):
+        """
+        Список вхождений слова по всем сегментам. url_id и позиции остаются массивами NumPy:
+        из одного сегмента - срезами mmap без копирования, из нескольких - объединенными np.concatenate.
+        """
+        self.refresh()
+        parts = [postings for postings in (segment.get_postings(word_id) for segment in list(self.segments))
+                 if postings is not None]
+        if not parts:
+            return PostingList([], [])
+        if len(parts) == 1:
+            doc_ids, counts, positions = parts[0]
+        else:
+            doc_ids, counts, positions = (np.concatenate(arrays) for arrays in zip(*parts))
+        ends = np.cumsum(counts, dtype=np.int64)
+        starts = ends - counts
+        if len(parts) > 1 and np.any(doc_ids[1:] < doc_ids[:-1]):
+            # Документы разных сегментов не пересекаются, достаточно упорядочить по url_id
+            order = np.argsort(doc_ids, kind='stable')
+            doc_ids, starts, ends = doc_ids[order], starts[order], ends[order]
+        return PostingList(doc_ids, ArrayPositions(positions, starts, ends))
+
+    def has_doc(self, url_id):
+        return any(segment.has_doc(url_id) for segment in list(self.segments))
+
+    def stats(self):
+        segments = list(self.segments)
+        return {"segments": len(segments), "docs": sum(len(s) for s in segments),
+                "bytes": sum(s.size for s in segments)}
+
+    def maybe_merge(self):
+        """
+        Объединяет mergeFactor самых маленьких сегментов (не больше maxMergeBytes каждый) в один.
+        Старые сегменты удаляются после замены списка; уже открытые отображения у читателей остаются валидными.
+        :return: True, если слияние выполнено
+        """
+        with self.lock:
+            small = sorted((s for s in self.segments if s.size <= self.maxMergeBytes), key=lambda s: s.size)
+            victims = small[:self.mergeFactor]
+        if len(victims) < self.mergeFactor:
+            return False
+
+        terms = {}
+        doc_ids = []
+        for segment in victims:
+            doc_ids.extend(segment.doc_ids.tolist())
+            for word_id, postings in segment.iter_terms():
+                terms.setdefault(word_id, []).extend(postings)
+
+        name = self._newSegmentName()
+        write_segment(self._path(name), terms, doc_ids)
+        merged = Segment(self._path(name))
+        with self.lock:
+            names = {segment.name for segment in victims}
+            self.segments = [s for s in self.segments if s.name not in names] + [merged]
+            self._writeManifest()
+        for segment in victims:
+            os.remove(segment.path)
+        return True
+
+    def start_background_merge(self, interval=5.0):
+        """ Запускает поток, который раз в interval секунд проверяет и выполняет слияния (если он еще не запущен) """
+        if self.mergeThread is not None:
+            return
+
+        def run():
+            while not self.mergeStop.wait(interval):
+                while self.maybe_merge():
+                    pass
+
+        self.mergeStop.clear()
+        self.mergeThread = threading.Thread(target=run, daemon=True)
+        self.mergeThread.start()
+
+    def stop_background_merge(self):
+        if self.mergeThread is not None:
+            self.mergeStop.set()
+            self.mergeThread.join()
+            self.mergeThread = None
+
+    @classmethod
+    def from_database(cls, word_location_dao, directory, docsPerSegment=1000):
+        """ Конвертер: строит сегменты по существующей таблице wordlocation """
+        index = cls(directory)
+        terms = {}
+        doc_ids = []
+        for url_id, word_id, location in word_location_dao.iter_locations_by_url():
+            if not doc_ids or doc_ids[-1] != url_id:
+                if len(doc_ids) == docsPerSegment:
+                    index.add_segment(terms, doc_ids)
+                    terms, doc_ids = {}, []
+                doc_ids.append(url_id)
+            postings = terms.setdefault(word_id, [])
+            if not postings or postings[-1][0] != url_id:
+                postings.append((url_id, []))
+            postings[-1][1].append(location)
+        if doc_ids:
+            index.add_segment(terms, doc_ids)
+        return index
+
+
+if __name__ == '__main__':
+    # python segments.py search_engine.db segments/ [docsPerSegment]
+    from DAO import WordLocationDAO
+
+    db_path, directory = sys.argv[1], sys.argv[2]
+    per_segment = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    result = SegmentIndex.from_database(WordLocationDAO(db_path), directory, per_segment)
+    print(result.stats())
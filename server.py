@@ -0,0 +1,312 @@
+import argparse
+import asyncio
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+from DAO import connection_manager
+from cache import QueryCache
+from metrics import Metrics
+from searcher import Searcher, SCORING_MODES, UnknownWordError, EmptyCorpusStatsError
+
+# Наибольшее число результатов на странице и наибольшая глубина выдачи (page * size)
+MAX_PAGE_SIZE = 100
+MAX_RESULTS = 1000
+# Глубина ранжирования округляется вверх до кратной RESULT_WINDOW: соседние страницы выдачи
+# ранжируются одним вызовом getSortedList и берутся из одной записи QueryCache
+RESULT_WINDOW = 50
+# Ограничения HTTP-запроса: длина строки запроса и заголовка, число заголовков
+MAX_LINE_BYTES = 8192
+MAX_HEADERS = 100
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class SearchService:
+    """
+    Поисковый сервис поверх Searcher для долгоживущего процесса.
+    При запуске один раз загружаются словарь слов и URL (IdCache), PageRank и, по желанию, индекс в памяти
+    (PageRank и индекс в памяти загружаются заново при смене поколения индекса, Searcher.refreshStale);
+    результаты запросов кэшируются в QueryCache. Поиск выполняется в пуле потоков executor
+    (у каждого потока свое соединение с БД, DAO.connection_manager), цикл asyncio только принимает
+    запросы и отдает ответы. Готовые страницы выдачи с фрагментами кэшируются отдельно (pageCache):
+    повтор популярного запроса не строит фрагменты заново. Время очереди, ранжирования и построения
+    фрагментов каждого запроса возвращается в ответе и накапливается в metrics.
+    """
+
+    def __init__(self, dbFileName, workers=4, maxPending=256, scoring='bm25', inMemoryIndex=False,
+                 queryCacheSize=10000, queryCacheTtl=300):
+        """
+        :param workers: число потоков поиска
+        :param maxPending: наибольшее число запросов в обработке и в очереди; сверх него - ответ 503
+        :param scoring: способ ранжирования по умолчанию (SCORING_MODES); 'bm25' и 'tfidf' заменяются на 'location',
+                        если статистика корпуса пуста (БД проиндексирована без нее)
+        :param inMemoryIndex: загрузить списки вхождений в память (Searcher.loadInMemoryIndex)
+        """
+        if scoring not in SCORING_MODES:
+            raise ValueError(f"Неизвестный способ ранжирования: {scoring}")
+        start = time.perf_counter()
+        self.searcher = Searcher(dbFileName, inMemoryIndex=inMemoryIndex,
+                                 queryCache=QueryCache(queryCacheSize, queryCacheTtl))
+        self.searcher.verbose = False
+        if scoring in ('bm25', 'tfidf') and not self.searcher.term_stats_dao.get_corpus_stats()[0]:
+            print(f"Статистика корпуса пуста, ранжирование '{scoring}' заменено на 'location' "
+                  "(постройте ее через TermStatsDAO.rebuild() или migrate.py)")
+            scoring = 'location'
+        self.searcher.scoring = scoring
+        self.searcher.loadPageRank()
+        self.pageCache = QueryCache(queryCacheSize, queryCacheTtl)
+        self.startupSeconds = time.perf_counter() - start
+
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='search')
+        self.workers = workers
+        self.maxPending = maxPending
+        self.pending = 0
+        self.metrics = Metrics()
+
+    def search(self, queryString, page=1, size=10, scoring=None, snippets=True):
+        """
+        Одна страница выдачи (выполняется в потоке executor).
+        :param page: номер страницы, с 1
+        :param size: число результатов на странице
+        :return: словарь ответа; timing - время ранжирования и построения фрагментов, мс
+        """
+        scoring = scoring or self.searcher.scoring
+        key = (QueryCache.normalize(queryString), scoring, page, size, snippets)
+        start = time.perf_counter()
+        generation = self.searcher.meta_dao.get_generation()
+        cached = self.pageCache.get(key, generation)
+        if cached is not None:
+            self.metrics.incr('page_cache_hits')
+            results, hasMore = cached
+            return self.response(queryString, scoring, page, size, results, hasMore,
+                                 {"cache_ms": (time.perf_counter() - start) * 1000})
+
+        depth = page * size
+        # На один результат больше запрошенных - чтобы знать, есть ли следующая страница
+        k = min(math.ceil((depth + 1) / RESULT_WINDOW) * RESULT_WINDOW, MAX_RESULTS + 1)
+        try:
+            ranked = self.searcher.getSortedList(queryString, k=k, scoring=scoring)
+        except UnknownWordError:
+            ranked = []
+        ranked_at = time.perf_counter()
+
+        results = []
+        for rank, (score, urlid, url) in enumerate(ranked[depth - size:depth], start=depth - size + 1):
+            result = {"rank": rank, "url_id": urlid, "url": url[1] if url else None, "score": score}
+            if snippets:
+                snippet = self.searcher.getSnippet(urlid, queryString)
+                result["snippet"] = snippet["text"] if snippet else None
+            results.append(result)
+        finished = time.perf_counter()
+
+        self.metrics.observe('rank', ranked_at - start)
+        if snippets:
+            self.metrics.observe('snippets', finished - ranked_at)
+        self.pageCache.put(key, (results, len(ranked) > depth), generation)
+        return self.response(queryString, scoring, page, size, results, len(ranked) > depth,
+                             {"rank_ms": (ranked_at - start) * 1000, "snippets_ms": (finished - ranked_at) * 1000})
+
+    @staticmethod
+    def response(queryString, scoring, page, size, results, hasMore, timing):
+        return {"query": queryString, "scoring": scoring, "page": page, "size": size, "has_more": hasMore,
+                "results": results, "timing": timing}
+
+    async def handleSearch(self, params):
+        """ Разбор параметров /search и выполнение поиска в executor с замером времени ожидания в очереди """
+        queryString = params.get('q', '').strip()
+        if not queryString:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Не задан параметр q")
+        try:
+            page = int(params.get('page', 1))
+            size = int(params.get('size', params.get('k', 10)))
+        except ValueError:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "page и size должны быть целыми числами")
+        if page < 1 or not 1 <= size <= MAX_PAGE_SIZE:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"page >= 1, size от 1 до {MAX_PAGE_SIZE}")
+        if page * size > MAX_RESULTS:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"Выдача ограничена {MAX_RESULTS} результатами")
+        scoring = params.get('scoring') or None
+        if scoring is not None and scoring not in SCORING_MODES:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"scoring - один из {', '.join(SCORING_MODES)}")
+        snippets = params.get('snippets', '1') not in ('0', 'false', 'no')
+
+        if self.pending >= self.maxPending:
+            self.metrics.incr('rejected')
+            raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, "Сервер перегружен")
+        self.pending += 1
+        submitted = time.perf_counter()
+
+        def run():
+            queued = time.perf_counter() - submitted
+            response = self.search(queryString, page, size, scoring, snippets)
+            response["timing"]["queue_ms"] = queued * 1000
+            self.metrics.observe('queue', queued)
+            return response
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, run)
+        except ValueError as error:
+            # Ошибка разбора запроса (например, NEAR без операнда)
+            raise HttpError(HTTPStatus.BAD_REQUEST, str(error))
+        except EmptyCorpusStatsError as error:
+            # Явно запрошенное ранжирование 'bm25'/'tfidf' по БД без статистики корпуса
+            raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, str(error))
+        finally:
+            self.pending -= 1
+
+    def stats(self):
+        """ Счетчики и гистограммы времени, состояние кэшей """
+        snapshot = self.metrics.snapshot()
+        snapshot.update(startup_seconds=self.startupSeconds, workers=self.workers, pending=self.pending,
+                        query_cache=self.searcher.queryCache.stats(), page_cache=self.pageCache.stats(),
+                        id_cache=self.searcher.idCache.stats())
+        return snapshot
+
+    async def dispatch(self, method, target):
+        """ :return: (HTTPStatus, тело ответа - словарь) """
+        if method not in ('GET', 'HEAD'):
+            raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, "Поддерживаются только GET и HEAD")
+        parts = urlsplit(target)
+        params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        if parts.path == '/search':
+            return HTTPStatus.OK, await self.handleSearch(params)
+        if parts.path == '/stats':
+            return HTTPStatus.OK, self.stats()
+        if parts.path == '/health':
+            return HTTPStatus.OK, {"status": "ok"}
+        raise HttpError(HTTPStatus.NOT_FOUND, f"Неизвестный путь: {parts.path}")
+
+    async def handleConnection(self, reader, writer, idleTimeout=30):
+        """ Обработка соединения HTTP/1.1 с поддержкой keep-alive: запросы читаются и обслуживаются по очереди """
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader), idleTimeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except HttpError as error:
+                    writer.write(build_response(error.status, {"error": str(error)}, keepAlive=False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, version, headers = request
+
+                start = time.perf_counter()
+                try:
+                    status, body = await self.dispatch(method, target)
+                except HttpError as error:
+                    status, body = error.status, {"error": str(error)}
+                except Exception as error:
+                    status, body = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(error).__name__}: {error}"}
+                elapsed = time.perf_counter() - start
+
+                self.metrics.incr(f"status_{status.value}")
+                self.metrics.observe('request', elapsed)
+                timing = body.get("timing")
+                if timing is not None:
+                    timing["total_ms"] = elapsed * 1000
+
+                connection = headers.get('connection', '').lower()
+                keepAlive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+                writer.write(build_response(status, body, keepAlive, timing, head=method == 'HEAD'))
+                await writer.drain()
+                if not keepAlive:
+                    break
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        server = await asyncio.start_server(self.handleConnection, host, port)
+        address = server.sockets[0].getsockname()
+        print(f"Поиск на http://{address[0]}:{address[1]}/search?q=... "
+              f"(запуск {self.startupSeconds:.2f} с, потоков {self.workers})")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        connection_manager.close_all()
+
+
+async def read_request(reader):
+    """
+    Чтение строки запроса и заголовков HTTP; тело запроса (если есть) пропускается.
+    :return: (метод, цель, версия, {заголовок в нижнем регистре: значение}) или None, если соединение закрыто
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    if len(line) > MAX_LINE_BYTES:
+        raise HttpError(HTTPStatus.REQUEST_URI_TOO_LONG, "Слишком длинная строка запроса")
+    try:
+        method, target, version = line.decode('latin-1').split()
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Неверная строка запроса")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        if len(line) > MAX_LINE_BYTES or len(headers) >= MAX_HEADERS:
+            raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Слишком большие заголовки")
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length', 0) or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Неверный заголовок Content-Length")
+    if length:
+        await reader.readexactly(length)
+    return method, target, version, headers
+
+
+def build_response(status, body, keepAlive=True, timing=None, head=False):
+    """ Ответ HTTP/1.1 с телом JSON; время стадий запроса дублируется в заголовке Server-Timing """
+    payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+    lines = [f"HTTP/1.1 {status.value} {status.phrase}",
+             "Content-Type: application/json; charset=utf-8",
+             f"Content-Length: {len(payload)}",
+             f"Connection: {'keep-alive' if keepAlive else 'close'}"]
+    if timing:
+        lines.append("Server-Timing: " + ', '.join(f"{name[:-3]};dur={value:.3f}"
+                                                    for name, value in timing.items() if name.endswith('_ms')))
+    head_bytes = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+    return head_bytes if head else head_bytes + payload
+
+
+if __name__ == '__main__':
+    # python server.py search_engine.db --port 8080
+    # curl 'http://127.0.0.1:8080/search?q=список+новостей&page=2&size=10'
+    parser = argparse.ArgumentParser(description='HTTP/JSON-сервис поиска по проиндексированной БД')
+    parser.add_argument('db', nargs='?', default='search_engine.db')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=4, help='потоков поиска')
+    parser.add_argument('--max-pending', type=int, default=256, help='запросов в очереди, сверх - ответ 503')
+    parser.add_argument('--scoring', choices=SCORING_MODES, default='bm25')
+    parser.add_argument('--in-memory-index', action='store_true', help='держать списки вхождений в памяти')
+    parser.add_argument('--cache-size', type=int, default=10000, help='записей в кэше результатов')
+    parser.add_argument('--cache-ttl', type=float, default=300, help='время жизни записи кэша, с')
+    args = parser.parse_args()
+
+    service = SearchService(args.db, args.workers, args.max_pending, args.scoring, args.in_memory_index,
+                            args.cache_size, args.cache_ttl)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
@@ -0,0 +1,105 @@
+import hashlib
+
+import numpy as np
+
+FINGERPRINT_BITS = 64
+# Длина шингла: признаками отпечатка служат последовательности из SHINGLE_SIZE слов
+SHINGLE_SIZE = 3
+
+
+def feature_hash(feature):
+    """ Стабильный 64-битный хэш строки (hash() в Python различается между процессами) """
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def simhash(words, shingleSize=SHINGLE_SIZE):
+    """
+    SimHash-отпечаток текста: каждый бит - знак суммы соответствующих битов хэшей шинглов
+    (с учетом числа повторов). У близких текстов отпечатки отличаются в немногих битах.
+    :param words: слова страницы в порядке следования (результат separate_words)
+    :return: целое число 0..2^64-1
+    """
+    if len(words) < shingleSize:
+        shingles = [' '.join(words)] if words else []
+    else:
+        shingles = [' '.join(words[i:i + shingleSize]) for i in range(len(words) - shingleSize + 1)]
+    if not shingles:
+        return 0
+
+    features, counts = np.unique(shingles, return_counts=True)
+    hashes = np.array([feature_hash(feature) for feature in features.tolist()], dtype=np.uint64)
+    # Матрица битов: строка - шингл, столбец - бит хэша
+    bits = ((hashes[:, None] >> np.arange(FINGERPRINT_BITS, dtype=np.uint64)) & np.uint64(1)).astype(np.int64)
+    votes = (2 * bits - 1).T @ counts
+    return int(np.sum((votes > 0).astype(np.uint64) << np.arange(FINGERPRINT_BITS, dtype=np.uint64)))
+
+
+def hamming(a, b):
+    """ Число различающихся битов двух отпечатков """
+    return bin(a ^ b).count('1')
+
+
+def to_signed(fingerprint):
+    """ Отпечаток в диапазоне INTEGER SQLite (знаковое 64-битное) """
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+
+def from_signed(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class SimHashIndex:
+    """
+    Поиск почти-дубликатов по отпечаткам SimHash.
+    Отпечаток делится на bands полос; если два отпечатка отличаются не больше чем в maxDistance < bands битах,
+    хотя бы одна полоса у них совпадает (принцип Дирихле). Поэтому кандидаты ищутся только среди отпечатков
+    с совпадающей полосой, без перебора всех страниц.
+    """
+
+    def __init__(self, bands=None, maxDistance=3):
+        """
+        :param bands: число полос; по умолчанию - наименьшее из 4, 8, 16, 32, 64, большее maxDistance.
+                      Чем больше полос, тем короче полоса и тем больше кандидатов приходится проверять
+        """
+        if bands is None:
+            bands = next((b for b in (4, 8, 16, 32, 64) if b > maxDistance), 64)
+        if maxDistance >= bands or FINGERPRINT_BITS % bands:
+            raise ValueError("число полос должно делить 64 и быть больше maxDistance")
+        self.bands = bands
+        self.maxDistance = maxDistance
+        self.bandBits = FINGERPRINT_BITS // bands
+        self.tables = [{} for _ in range(bands)]  # {значение полосы: [(отпечаток, url_id), ...]}
+        self.size = 0
+
+    def _bandValues(self, fingerprint):
+        mask = (1 << self.bandBits) - 1
+        return [(fingerprint >> (i * self.bandBits)) & mask for i in range(self.bands)]
+
+    def add(self, fingerprint, url_id):
+        for table, value in zip(self.tables, self._bandValues(fingerprint)):
+            table.setdefault(value, []).append((fingerprint, url_id))
+        self.size += 1
+
+    def find(self, fingerprint):
+        """
+        Ближайшая ранее добавленная страница на расстоянии не больше maxDistance.
+        :return: (url_id, расстояние) или None
+        """
+        best = None
+        for table, value in zip(self.tables, self._bandValues(fingerprint)):
+            for candidate, url_id in table.get(value, ()):
+                distance = hamming(fingerprint, candidate)
+                if distance <= self.maxDistance and (best is None or distance < best[1]):
+                    best = (url_id, distance)
+        return best
+
+    @classmethod
+    def load(cls, fingerprint_dao, bands=None, maxDistance=3):
+        """ Строит индекс по сохраненным отпечаткам (FingerprintDAO) """
+        index = cls(bands, maxDistance)
+        for url_id, value in fingerprint_dao.get_all_fingerprints():
+            index.add(from_signed(value), url_id)
+        return index
+
+    def __len__(self):
+        return self.size
@@ -0,0 +1,95 @@
+import http.server
+import os
+import sys
+import tempfile
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# DBcreate при импорте создает search_engine.db в текущем каталоге - пусть это будет временный каталог
+os.chdir(tempfile.mkdtemp())
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    from DBcreate import create_db
+    path = str(tmp_path / 'test.db')
+    create_db(path)
+    return path
+
+
+@pytest.fixture
+def http_site():
+    """
+    Запуск локального HTTP-сервера: http_site(pages) раздает словарь {путь: html},
+    http_site(handlerClass) - произвольный обработчик. Возвращает базовый URL.
+    """
+    servers = []
+
+    def start(pages):
+        if isinstance(pages, dict):
+            content = {path: html.encode('utf-8') for path, html in pages.items()}
+
+            class Handler(http.server.BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = content.get(self.path)
+                    if body is None:
+                        self.send_error(404)
+                        return
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/html; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+        else:
+            Handler = pages
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+# Небольшой сайт для тестов поиска: страница i ссылается на 2i+1 и 2i+2
+SITE_TEXTS = [
+    'город погода и спорт новости города',
+    'погода в городе завтра солнечно',
+    'спорт футбол город погода',
+    'наука и техника новости',
+    'город на реке погода меняется спорт',
+    'рынок акций наука экономика',
+    'погода спорт город',
+]
+
+
+def site_pages(texts=SITE_TEXTS):
+    pages = {}
+    for i, text in enumerate(texts):
+        links = ''.join(f'<a href="/p{child}.html">ссылка {child}</a> '
+                        for child in (2 * i + 1, 2 * i + 2) if child < len(texts))
+        pages[f'/p{i}.html'] = f'<html><body><p>{text}</p><div>{links}</div></body></html>'
+    return pages
+
+
+@pytest.fixture
+def site_url(http_site):
+    """ Базовый URL запущенного сайта SITE_TEXTS """
+    return http_site(site_pages())
+
+
+@pytest.fixture
+def indexed_db(db_path, site_url):
+    """ БД с проиндексированным сайтом SITE_TEXTS; возвращает (путь к БД, базовый URL) """
+    from crawler import Crawler
+    base = site_url
+    Crawler(db_path).crawl([base + '/p0.html'], 4, maxUrls=len(SITE_TEXTS))
+    return db_path, base
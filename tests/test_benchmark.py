@@ -0,0 +1,60 @@
+import re
+
+import numpy as np
+import pytest
+
+import benchmark
+
+
+def test_generate_corpus_is_reproducible_and_connected():
+    corpus, words = benchmark.generate_corpus(pages=30, vocabulary=200, seed=4)
+    assert benchmark.generate_corpus(pages=30, vocabulary=200, seed=4) == (corpus, words)
+    assert len(corpus) == 30 and words[:2] == ['w1', 'w2']
+    # Дерево 2i+1, 2i+2 делает все страницы достижимыми от корня
+    for i in range(30):
+        targets = set(re.findall(r'href="([^"]+)"', corpus[f'/p{i}.html']))
+        assert {f'/p{child}.html' for child in (2 * i + 1, 2 * i + 2) if child < 30} <= targets
+        assert targets <= set(corpus)
+
+
+def test_percentiles():
+    assert benchmark.percentiles([]) == {"count": 0}
+    stats = benchmark.percentiles([0.001 * i for i in range(1, 101)])
+    assert stats["count"] == 100 and stats["max_ms"] == pytest.approx(100)
+    assert stats["p50_ms"] == pytest.approx(50.5) and stats["mean_ms"] == pytest.approx(50.5)
+
+
+def test_make_queries_with_few_known_words():
+    rng = np.random.default_rng(1)
+    words = ['w1', 'w2', 'w3', 'w4']
+    queries = benchmark.make_queries(words, {'w2', 'w4'}, 5, 3, 1.1, rng)
+    assert len(queries) == 5
+    assert all(sorted(query.split()) == ['w2', 'w4'] for query in queries)
+    assert benchmark.make_queries(words, set(), 5, 2, 1.1, rng) == []
+    assert all(len(set(query.split())) == 2 for query in benchmark.make_queries(words, set(words), 10, 2, 1.1, rng))
+
+
+def test_compare_reports_only_regressions():
+    baseline = {"config": {"pages": 10}, "crawl": {"wall_seconds": 1.0, "pages_per_sec": 100.0, "pages": 10},
+                "queries": {"1_words": {"getSortedList": {"p50_ms": 2.0, "count": 5}}}}
+    current = {"config": {"pages": 20}, "crawl": {"wall_seconds": 1.05, "pages_per_sec": 80.0, "pages": 20},
+               "queries": {"1_words": {"getSortedList": {"p50_ms": 3.0, "count": 9}}}}
+    regressions = benchmark.compare(baseline, current)
+    assert [name for name, *_ in regressions] == ['crawl.pages_per_sec', 'queries.1_words.getSortedList.p50_ms']
+    assert regressions[0][3] == pytest.approx(-0.2)
+
+
+def test_queries_longer_than_vocabulary(db_path):
+    corpus, words = benchmark.generate_corpus(pages=10, vocabulary=4, wordsPerPage=(5, 10), seed=2)
+    server, base = benchmark.serve_corpus(corpus)
+    try:
+        crawl = benchmark.bench_crawl(db_path, base, 10, mode='sequential')
+    finally:
+        server.shutdown()
+    assert crawl["pages"] == 10
+
+    # Запросов из 6 слов больше, чем слов в словаре: запрос состоит из всех слов
+    results = benchmark.bench_queries(db_path, words, queries=3, maxWords=6)
+    assert set(results) == {f"{n}_words" for n in range(1, 7)}
+    assert all(stats["getSortedList"]["count"] == 3 for stats in results.values())
+    assert results["6_words"]["queries_with_results"] == 3
@@ -0,0 +1,64 @@
+import sqlite3
+
+from crawler import Crawler
+
+TEXTS = [
+    'город погода и спорт новости города',
+    'погода в городе завтра солнечно',
+    'спорт футбол город погода',
+    'наука и техника новости',
+    'город на реке погода меняется спорт',
+    'рынок акций наука экономика',
+    'погода спорт город',
+]
+PAGES = [(f'http://example.com/p{i}.html', text.split()) for i, text in enumerate(TEXTS)]
+
+
+def index_rows(db_path):
+    """ Содержимое wordlocation по словам и адресам (id в разных режимах могут различаться) """
+    conn = sqlite3.connect(db_path)
+    try:
+        return sorted(conn.execute('''
+            SELECT wordlist.word, urllist.url, wordlocation.location FROM wordlocation
+            JOIN wordlist ON wordlist.id = wordlocation.word_id JOIN urllist ON urllist.id = wordlocation.url_id
+        '''))
+    finally:
+        conn.close()
+
+
+def test_bulk_index_commits_once_per_batch(db_path):
+    crawler = Crawler(db_path, bulkIndex=True, commitEvery=3)
+    statements = []
+    crawler.meta_dao.conn.set_trace_callback(statements.append)
+    for url, words in PAGES:
+        crawler.addIndexWords(url, words)
+        crawler.addLinkRefs(url, [('http://example.com/other.html', 'ссылка на страницу')])
+    assert statements.count('COMMIT') == len(PAGES) // 3
+
+    crawler.flushIndex()
+    crawler.meta_dao.conn.set_trace_callback(None)
+    assert statements.count('COMMIT') == len(PAGES) // 3 + 1
+
+    stats = crawler.getIndexStats()
+    assert stats["pages"] == len(PAGES)
+    assert stats["rows"] == sum(len(words) for _, words in PAGES)
+    assert stats["pages_per_sec"] > 0 and stats["rows_per_sec"] > 0
+
+
+def test_bulk_index_matches_per_page_index(tmp_path, db_path):
+    from DBcreate import create_db
+    single_path = str(tmp_path / 'single.db')
+    create_db(single_path)
+
+    single = Crawler(single_path)
+    bulk = Crawler(db_path, bulkIndex=True, commitEvery=4)
+    for url, words in PAGES:
+        single.addIndexWords(url, words)
+        bulk.addIndexWords(url, words)
+    bulk.flushIndex()
+
+    assert index_rows(db_path) == index_rows(single_path)
+    # Повторная индексация уже проиндексированной страницы пропускается
+    bulk.addIndexWords(*PAGES[0])
+    bulk.flushIndex()
+    assert index_rows(db_path) == index_rows(single_path)
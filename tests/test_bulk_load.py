@@ -0,0 +1,57 @@
+import sqlite3
+
+from crawler import Crawler
+from DAO import SECONDARY_INDEXES, is_without_rowid
+from DBcreate import create_db
+from migrate import migrate
+
+
+def index_names(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    finally:
+        conn.close()
+
+
+def test_bulk_load_rebuilds_indexes(db_path):
+    crawler = Crawler(db_path)
+    crawler.beginBulkLoad(batchPages=2)
+    assert not set(SECONDARY_INDEXES) & index_names(db_path)
+    for i in range(5):
+        crawler.addIndexWords(f'http://example.com/p{i}.html', ['город', 'погода', f'слово{i}'])
+    crawler.endBulkLoad()
+    assert set(SECONDARY_INDEXES) <= index_names(db_path)
+    assert crawler.getIndexStats()['pages'] == 5
+
+
+def test_create_db_after_migration_keeps_clustered_schema(tmp_path):
+    path = str(tmp_path / 'search.db')
+    create_db(path)
+    migrate(path)
+    # Повторный create_db с версией по умолчанию не должен возвращать индекс, лишний для WITHOUT ROWID
+    create_db(path)
+    assert 'wordlocidx' not in index_names(path)
+    assert set(SECONDARY_INDEXES) - {'wordlocidx'} <= index_names(path)
+    conn = sqlite3.connect(path)
+    try:
+        assert is_without_rowid(conn, 'wordlocation')
+    finally:
+        conn.close()
+
+
+def test_is_indexed_does_not_scan_wordlocation(db_path):
+    crawler = Crawler(db_path, bulkIndex=True, commitEvery=100)
+    crawler.addIndexWords('http://example.com/a.html', ['город', 'погода'])
+    statements = []
+    crawler.meta_dao.conn.set_trace_callback(statements.append)
+    # Страница еще в буфере массовой загрузки, но уже считается проиндексированной
+    assert crawler.isIndexed('http://example.com/a.html')
+    assert not crawler.isIndexed('http://example.com/b.html')
+    crawler.meta_dao.conn.set_trace_callback(None)
+    assert not [sql for sql in statements if 'wordlocation' in sql]
+
+    crawler.flushIndex()
+    crawler.addIndexWords('http://example.com/a.html', ['спорт'])
+    crawler.flushIndex()
+    assert crawler.getIndexStats()['pages'] == 1
@@ -0,0 +1,71 @@
+from cache import IdCache, QueryCache
+from crawler import Crawler
+from searcher import Searcher
+
+
+def test_crawler_on_fresh_database(tmp_path, site_url):
+    path = str(tmp_path / 'fresh.db')
+    idCache = IdCache()
+    crawler = Crawler(path, idCache=idCache)
+    assert not idCache.warmed
+    crawler.initDB()
+    assert idCache.warmed
+
+    crawler.crawl([site_url + '/p0.html'], 2)
+    assert crawler.metrics.get('urls') > 0
+
+    searcher = Searcher(path)
+    searcher.verbose = False
+    assert searcher.idCache.words.get('погода') is not None
+    assert searcher.getSortedList('погода')
+
+
+def test_searcher_on_fresh_database(tmp_path):
+    searcher = Searcher(str(tmp_path / 'fresh.db'))
+    assert not searcher.idCache.warmed
+
+
+def test_query_cache_lru_and_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('cache.time.monotonic', lambda: now[0])
+    cache = QueryCache(maxsize=2, ttl=10)
+    cache.put('a', 1, 0)
+    cache.put('b', 2, 0)
+    assert cache.get('a', 0) == 1
+    cache.put('c', 3, 0)  # вытесняется давно не использованная 'b'
+    assert cache.get('b', 0) is None
+    assert cache.get('c', 0) == 3
+
+    now[0] += 11
+    assert cache.get('a', 0) is None
+    stats = cache.stats()
+    assert stats['expired'] == 1
+    assert (stats['hits'], stats['misses']) == (2, 2)
+    assert stats['hit_ratio'] == 0.5
+    assert QueryCache.normalize('  Список   Новостей ') == 'список новостей'
+
+
+def test_searcher_query_cache_invalidated_by_crawl_and_page_rank(indexed_db, http_site):
+    db_path, _ = indexed_db
+    cache = QueryCache()
+    searcher = Searcher(db_path, queryCache=cache)
+    searcher.verbose = False
+    ranked = []
+    rankQuery = searcher.rankQuery
+    searcher.rankQuery = lambda *args: ranked.append(args[0]) or rankQuery(*args)
+
+    first = searcher.getSortedList('Погода  город')
+    assert searcher.getSortedList('погода город') == first
+    assert ranked == ['Погода  город']
+    assert cache.stats()['hits'] == 1
+
+    # Новые страницы увеличивают поколение индекса - результат пересчитывается
+    base = http_site({'/new.html': '<html><body><p>погода город погода</p></body></html>'})
+    Crawler(db_path).crawl([base + '/new.html'], 1)
+    assert len(searcher.getSortedList('погода город')) == len(first) + 1
+    assert len(ranked) == 2
+
+    searcher.calculatePageRank()
+    searcher.getSortedList('погода город')
+    assert len(ranked) == 3
+    assert cache.stats()['invalidations'] == 2
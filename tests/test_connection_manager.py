@@ -0,0 +1,98 @@
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from benchmark import generate_corpus, percentiles
+from crawler import Crawler
+from DAO import ConnectionManager, UrlListDAO, WordListDAO, connection_manager
+from searcher import Searcher, UnknownWordError
+
+
+def committed_rows(db_path, table):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_connection_shared_per_thread_and_owner(tmp_path):
+    manager = ConnectionManager()
+    path = str(tmp_path / 'shared.db')
+    urls = UrlListDAO(path, manager=manager, owner='crawler')
+    words = WordListDAO(path, manager=manager, owner='crawler')
+    assert urls.conn is words.conn
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(manager.connection(path, 'crawler')))
+    thread.start()
+    thread.join()
+    assert other[0] is not urls.conn
+
+
+def test_pragmas_applied_and_configurable(tmp_path):
+    manager = ConnectionManager(cache_size=-2000)
+    conn = manager.connection(str(tmp_path / 'pragmas.db'))
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    assert conn.execute('PRAGMA cache_size').fetchone()[0] == -2000
+    assert conn.execute('PRAGMA temp_store').fetchone()[0] == 2  # MEMORY
+    assert conn.execute('PRAGMA mmap_size').fetchone()[0] == ConnectionManager.DEFAULT_PRAGMAS['mmap_size']
+
+    manager.configure(synchronous='FULL', mmap_size=0)
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 2
+    assert manager.connection(str(tmp_path / 'other.db')).execute('PRAGMA mmap_size').fetchone()[0] == 0
+
+
+def test_crawler_and_searcher_share_default_manager(db_path):
+    crawler = Crawler(db_path)
+    searcher = Searcher(db_path)
+    assert crawler.url_dao.conn is crawler.word_location_dao.conn
+    assert searcher.url_dao.conn is searcher.word_location_dao.conn
+    assert crawler.url_dao.conn is not searcher.url_dao.conn
+    assert crawler.url_dao.manager is connection_manager is searcher.url_dao.manager
+
+
+def test_search_latency_during_crawl(db_path, http_site):
+    """ Поиск во время записи (WAL, отдельные соединения) не ждет фиксации пакетов краулера """
+    first, words = generate_corpus(40, vocabulary=500, wordsPerPage=(50, 150), prefix='/a', seed=1)
+    second, _ = generate_corpus(120, vocabulary=500, wordsPerPage=(50, 150), prefix='/b', seed=2)
+    base = http_site(dict(first, **second))
+    Crawler(db_path).crawl([base + '/a/p0.html'], 7, maxUrls=40)
+
+    searcher = Searcher(db_path)
+    searcher.verbose = False
+    queries = [' '.join(pair) for pair in np.array(words[:40]).reshape(-1, 2)]
+    times, errors = [], []
+    done = threading.Event()
+
+    def crawl():
+        try:
+            # Большие пакеты: транзакция записи открыта почти все время обхода
+            Crawler(db_path, bulkIndex=True, commitEvery=40).crawlConcurrent([base + '/b/p0.html'], 8, maxUrls=120)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            done.set()
+
+    thread = threading.Thread(target=crawl)
+    thread.start()
+    i = 0
+    while not done.is_set():
+        start = time.perf_counter()
+        try:
+            searcher.getSortedList(queries[i % len(queries)], scoring='location')
+        except UnknownWordError:
+            pass
+        times.append(time.perf_counter() - start)
+        i += 1
+    thread.join()
+
+    assert not errors
+    assert committed_rows(db_path, 'urllist') >= 160
+    summary = percentiles(times)
+    # Поиск, заблокированный записью, ждал бы busy_timeout (5 с)
+    assert summary['count'] > 10
+    assert summary['max_ms'] < 1000, summary
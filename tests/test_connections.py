@@ -0,0 +1,60 @@
+import sqlite3
+
+import pytest
+
+from crawler import Crawler
+from DAO import ConnectionManager, WordListDAO, UrlListDAO
+from searcher import Searcher, UnknownWordError
+
+
+def committed_rows(db_path, table):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_searcher_does_not_commit_crawler_batch(db_path, site_url):
+    crawler = Crawler(db_path, bulkIndex=True, commitEvery=1000)
+    crawler.crawl([site_url + '/p0.html'], 1)
+    committed = committed_rows(db_path, 'wordlocation')
+    # Пакет еще открыт: страница записана только в транзакции краулера
+    crawler.addIndexWords(site_url + '/extra.html', ['незафиксированное', 'слово'])
+    assert crawler.pendingPages
+
+    # Конструкторы Searcher и DAO без владельца выполняют CREATE TABLE и commit в своих соединениях
+    searcher = Searcher(db_path)
+    searcher.verbose = False
+    WordListDAO(db_path).commit()
+    assert committed_rows(db_path, 'wordlocation') == committed
+    with pytest.raises(UnknownWordError):
+        searcher.getSortedList('незафиксированное')
+
+    crawler.flushIndex()
+    assert committed_rows(db_path, 'wordlocation') == committed + 2
+    assert searcher.getSortedList('незафиксированное')
+
+
+def test_close_releases_reference(tmp_path):
+    manager = ConnectionManager()
+    path = str(tmp_path / 'refs.db')
+    first = UrlListDAO(path, manager=manager, owner='crawler')
+    second = WordListDAO(path, manager=manager, owner='crawler')
+    other = WordListDAO(path, manager=manager, owner='searcher')
+    conn = first.conn
+    assert second.conn is conn and other.conn is not conn
+
+    first.close()
+    first.close()  # повторное закрытие не освобождает чужую ссылку
+    assert second.conn.execute('SELECT 1').fetchone() == (1,)
+
+    second.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')
+    assert other.conn.execute('SELECT 1').fetchone() == (1,)
+
+    # Новый DAO того же владельца получает новое соединение
+    third = UrlListDAO(path, manager=manager, owner='crawler')
+    assert third.conn is not conn
+    assert third.conn.execute('SELECT 1').fetchone() == (1,)
@@ -0,0 +1,84 @@
+import http.server
+import queue
+import threading
+import time
+
+import requests
+
+import fetcher as fetcher_module
+from fetcher import AsyncFetcher
+
+
+def fetch_all(fetcher, urls):
+    pages = queue.Queue()
+    fetcher.submit(urls, pages).result(timeout=30)
+    return dict(pages.get_nowait() for _ in urls)
+
+
+def test_fetch_statuses(http_site):
+    base = http_site({'/a.html': '<html>a</html>'})
+    fetcher = AsyncFetcher(retries=0)
+    fetcher.start()
+    try:
+        results = fetch_all(fetcher, [base + '/a.html', base + '/missing.html', 'http://127.0.0.1:1/'])
+    finally:
+        fetcher.close()
+    assert results[base + '/a.html'].status_code == 200
+    assert results[base + '/a.html'].text == '<html>a</html>'
+    assert results[base + '/missing.html'].status_code == 404
+    assert results['http://127.0.0.1:1/'] is None
+
+
+def test_unexpected_error_reported_as_failed_fetch(http_site, monkeypatch):
+    base = http_site({'/a.html': 'a', '/b.html': 'b'})
+    get = requests.get
+
+    def failing_get(url, **kwargs):
+        if url.endswith('/b.html'):
+            raise RuntimeError("сбой")
+        return get(url, **kwargs)
+
+    monkeypatch.setattr(fetcher_module.requests, 'get', failing_get)
+    fetcher = AsyncFetcher(retries=0)
+    fetcher.start()
+    try:
+        results = fetch_all(fetcher, [base + '/a.html', base + '/b.html'])
+    finally:
+        fetcher.close()
+    assert results[base + '/a.html'].text == 'a'
+    assert results[base + '/b.html'] is None
+
+
+def test_busy_host_does_not_hold_global_slots(http_site):
+    finished = {}
+    lock = threading.Lock()
+
+    def make_handler(host):
+        class SlowHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(0.3)
+                with lock:
+                    finished[host] = time.monotonic()
+                self.send_response(200)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'ok')
+
+            def log_message(self, format, *args):
+                pass
+
+        return SlowHandler
+
+    busy, other = http_site(make_handler('busy')), http_site(make_handler('other'))
+    # Запросы к занятому хосту идут первыми; perHost=2 пропускает к нему только два,
+    # остальные два общих места должны сразу достаться второму хосту: его 4 запроса
+    # завершаются за 2 раунда, пока занятый хост выполняет 4 раунда
+    urls = [f"{busy}/{i}" for i in range(8)] + [f"{other}/{i}" for i in range(4)]
+    fetcher = AsyncFetcher(concurrency=4, perHost=2, retries=0)
+    fetcher.start()
+    try:
+        results = fetch_all(fetcher, urls)
+    finally:
+        fetcher.close()
+    assert all(response.status_code == 200 for response in results.values())
+    assert finished['other'] < finished['busy'] - 0.4
@@ -0,0 +1,65 @@
+import pytest
+
+from frontier import Frontier, canonicalize, canonicalize_links
+
+
+@pytest.mark.parametrize('url', ['http://h:80a/x', 'http://[::1/', 'http://example.com:99999/'])
+def test_canonicalize_malformed(url):
+    assert canonicalize(url) is None
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('http://[::1]:8080/a', 'http://[::1]:8080/a'),
+    ('http://[::1]:80/a', 'http://[::1]/a'),
+    ('http://[2001:DB8::1]/', 'http://[2001:db8::1]/'),
+])
+def test_canonicalize_ipv6(url, expected):
+    assert canonicalize(url) == expected
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('HTTP://Example.COM:80', 'http://example.com/'),
+    ('https://example.com:443/a', 'https://example.com/a'),
+    ('https://example.com:8443/a', 'https://example.com:8443/a'),
+    ('http://example.com:443/a', 'http://example.com:443/a'),
+])
+def test_canonicalize_default_port(url, expected):
+    assert canonicalize(url) == expected
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('http://e.com/p?b=2&a=1#top', 'http://e.com/p?a=1&b=2'),
+    ('http://e.com/p?a=1%202&utm_source=x&fbclid=y', 'http://e.com/p?a=1+2'),
+    ('http://e.com/?q=%D0%BF%D0%BE', 'http://e.com/?q=%D0%BF%D0%BE'),
+    ('http://e.com/?flag', 'http://e.com/?flag='),
+])
+def test_canonicalize_query(url, expected):
+    assert canonicalize(url) == expected
+
+
+def test_canonicalize_links_skips_malformed():
+    links = [('http://h:80a/x', 'bad'), ('http://E.com/a#f', 'good'), ('http://[::1/', 'bad')]
+    assert canonicalize_links(links) == [('http://e.com/a', 'good')]
+
+
+def test_frontier_skips_malformed(db_path):
+    frontier = Frontier(db_path, capacity=1000)
+    assert frontier.add(['http://h:80a/x', 'http://e.com/a', 'http://e.com/a#b'], depth=0) == ['http://e.com/a']
+
+
+@pytest.mark.parametrize('extractor', ['soup', 'stream'])
+@pytest.mark.parametrize('mode', ['crawl', 'crawlConcurrent', 'crawlFrontier'])
+def test_crawl_survives_malformed_link(db_path, http_site, mode, extractor):
+    from crawler import Crawler
+    from DAO import UrlListDAO
+    base = http_site({
+        '/p0.html': '<html><body>start <a href="http://h:80a/x">bad</a> <a href="http://[::1/">v6</a>'
+                    ' <a href="/p1.html">next</a></body></html>',
+        '/p1.html': '<html><body>finish</body></html>',
+    })
+    crawler = Crawler(db_path, extractor=extractor)
+    getattr(crawler, mode)([base + '/p0.html'], 2)
+
+    url_ids = UrlListDAO(db_path).get_url_ids([base + '/p0.html', base + '/p1.html'])
+    assert len(url_ids) == 2
+    assert crawler.isIndexed(base + '/p1.html')
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from crawler import Crawler
+from inverted_index import InMemoryIndex, SHARED_TERM_POSITIONS
+from postings import PostingList, intersect, min_location_rows
+from searcher import Searcher
+
+
+@pytest.fixture(scope='module')
+def rows():
+    """ Строки (word_id, url_id, location): частые слова с малыми word_id и длинный хвост редких """
+    rng = np.random.default_rng(3)
+    words = np.minimum(rng.zipf(1.3, 20000), 5000)
+    urls = rng.integers(1, 3000, len(words))
+    locations = rng.integers(0, 500, len(words))
+    return sorted(set(zip(words.tolist(), urls.tolist(), locations.tolist())))
+
+
+@pytest.fixture(scope='module')
+def index(rows):
+    index = InMemoryIndex()
+    index.build(*(np.array(column, dtype=np.int64) for column in zip(*rows)))
+    return index
+
+
+def expected_postings(rows, word_id):
+    return PostingList.from_rows((url_id, location) for word, url_id, location in rows if word == word_id)
+
+
+def test_postings_match_table(rows, index):
+    counts = {}
+    for word_id, _, _ in rows:
+        counts[word_id] = counts.get(word_id, 0) + 1
+    frequent = [word_id for word_id, count in counts.items() if count > SHARED_TERM_POSITIONS]
+    rare = [word_id for word_id, count in counts.items() if count <= SHARED_TERM_POSITIONS]
+    assert frequent and rare
+    assert index.term_count() == len(counts)
+
+    for word_id in frequent[:20] + rare[:200] + rare[-50:]:
+        postings = index.get_postings(word_id)
+        expected = expected_postings(rows, word_id)
+        assert postings.doc_ids.tolist() == expected.doc_ids
+        assert [postings.positions[j] for j in range(len(postings))] == expected.positions
+    assert len(index.get_postings(10 ** 6)) == 0
+
+
+def test_rare_terms_share_buffers(rows, index, monkeypatch):
+    report = index.memory_report(limit=0)
+    assert report["shared_terms"] > len(index.terms)
+    assert report["shared_terms"] + len(index.terms) == report["term_count"]
+
+    # Тот же индекс, в котором у каждого слова свои массивы
+    monkeypatch.setattr('inverted_index.SHARED_TERM_POSITIONS', 0)
+    separate = InMemoryIndex()
+    separate.build(*(np.array(column, dtype=np.int64) for column in zip(*rows)))
+    assert len(separate.terms) == report["term_count"]
+    assert report["total"] * 3 < separate.memory_usage()
+
+
+def test_array_intersection_matches_lists(rows, index):
+    for wordids in ([1, 2], [1, 2, 3], [2, 7, 1], [1, 40], [5, 5]):
+        postings = [index.get_postings(word_id) for word_id in wordids]
+        listed = [expected_postings(rows, word_id) for word_id in wordids]
+        assert list(intersect(postings)) == list(intersect(listed))
+        assert list(min_location_rows(postings)) == list(min_location_rows(listed))
+
+
+def test_index_reloaded_after_crawl(indexed_db, http_site):
+    db_path, _ = indexed_db
+    searcher = Searcher(db_path, inMemoryIndex=True)
+    searcher.verbose = False
+    before = searcher.postingSource
+
+    base = http_site({'/new.html': '<html><body><p>погода метель</p></body></html>'})
+    Crawler(db_path).crawl([base + '/new.html'], 1)
+
+    rows, _ = searcher.getMatchRows('погода метель')
+    assert len(rows) == 1
+    assert searcher.postingSource is not before
+    assert searcher.postingSource.generation == searcher.meta_dao.get_generation()
+
+    disk = Searcher(db_path)
+    disk.verbose = False
+    assert sorted(searcher.getMatchRows('погода')[0]) == sorted(disk.getMatchRows('погода')[0])
@@ -0,0 +1,71 @@
+import sqlite3
+
+import pytest
+
+from crawler import Crawler
+from searcher import Searcher
+
+A, B, C = 'http://example.com/a.html', 'http://example.com/b.html', 'http://example.com/c.html'
+
+
+def anchor_words(db_path):
+    """ {(откуда, куда): слова текстов ссылок} по адресам """
+    conn = sqlite3.connect(db_path)
+    try:
+        words = {}
+        for url_from, url_to, word in conn.execute('''
+            SELECT f.url, t.url, wordlist.word FROM link
+            JOIN urllist f ON f.id = link.from_url_id JOIN urllist t ON t.id = link.to_url_id
+            LEFT JOIN linkwords ON linkwords.link_id = link.id LEFT JOIN wordlist ON wordlist.id = linkwords.word_id
+        '''):
+            words.setdefault((url_from, url_to), set()).update([word] if word else [])
+        return words
+    finally:
+        conn.close()
+
+
+def test_repeated_links_merged(db_path):
+    crawler = Crawler(db_path)
+    statements = []
+    crawler.link_dao.conn.set_trace_callback(statements.append)
+    assert crawler.addLinkRefs(A, [(B, 'город погода'), (B, 'спорт'), (C, 'наука'), (B, 'город'), (A, '')]) == 3
+    crawler.link_dao.conn.set_trace_callback(None)
+    assert statements.count('COMMIT') == 1
+    assert anchor_words(db_path) == {(A, B): {'город', 'погода', 'спорт'}, (A, C): {'наука'}, (A, A): set()}
+    assert crawler.metrics.get('links') == 3
+
+    # Существующие связи не дублируются, их слова не дописываются
+    assert crawler.addLinkRefs(A, [(B, 'новости'), (C, 'наука')]) == 0
+    assert crawler.addLinkRefs(A, []) == 0
+    assert anchor_words(db_path)[(A, B)] == {'город', 'погода', 'спорт'}
+
+
+def test_bulk_mode_commits_with_index_batch(db_path):
+    crawler = Crawler(db_path, bulkIndex=True, commitEvery=10)
+    statements = []
+    crawler.link_dao.conn.set_trace_callback(statements.append)
+    crawler.addLinkRefs(A, [(B, 'город'), (C, 'погода')])
+    assert 'COMMIT' not in statements
+    crawler.flushIndex()
+    crawler.link_dao.conn.set_trace_callback(None)
+    assert statements.count('COMMIT') == 1
+    assert set(anchor_words(db_path)) == {(A, B), (A, C)}
+
+
+def test_anchor_postings_and_score(db_path):
+    crawler = Crawler(db_path)
+    for url in (A, B, C):
+        crawler.addIndexWords(url, ['погода', 'новости'])
+    crawler.addLinkRefs(A, [(B, 'погода'), (C, 'погода завтра')])
+    crawler.addLinkRefs(C, [(B, 'прогноз погода')])
+    url_ids = {url: crawler.getUrlId(url) for url in (A, B, C)}
+
+    searcher = Searcher(db_path)
+    searcher.verbose = False
+    word_id = searcher.word_dao.get_word_id('погода')
+    assert searcher.link_words_dao.get_anchor_postings(word_id) == {url_ids[B]: 2, url_ids[C]: 1}
+
+    scores = searcher.anchorScore(url_ids.values(), [word_id])
+    assert scores == pytest.approx({url_ids[A]: 0, url_ids[B]: 1.0, url_ids[C]: 0.5}, abs=1e-4)
+    result = searcher.getSortedList('погода', weights={'m1': 0, 'm2': 0, 'anchor': 1})
+    assert [url for _, _, (_, url) in result] == [B, C, A]
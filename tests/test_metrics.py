@@ -0,0 +1,93 @@
+import csv
+import json
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from crawler import Crawler
+from metrics import BUCKET_BOUNDS, Histogram, Metrics
+
+
+def test_histogram_percentiles_are_bucket_bounds():
+    histogram = Histogram()
+    assert histogram.percentile(50) is None
+    for value in [0.001] * 90 + [0.5] * 9 + [20.0]:
+        histogram.observe(value)
+    summary = histogram.summary()
+    assert summary["count"] == 100 and summary["min"] == 0.001 and summary["max"] == 20.0
+    assert summary["mean"] == pytest.approx((0.09 + 4.5 + 20) / 100)
+    # Оценка - верхняя граница корзины: не меньше значения и меньше следующей границы
+    assert 0.001 <= summary["p50"] < 0.001 * 1.8 and summary["p90"] == summary["p50"]
+    assert 0.5 <= summary["p99"] < 0.5 * 1.8
+    assert histogram.percentile(100) == 20.0
+    histogram.observe(BUCKET_BOUNDS[-1] * 10)
+    assert histogram.percentile(100) == BUCKET_BOUNDS[-1] * 10
+
+
+def test_counters_are_thread_safe():
+    metrics = Metrics()
+
+    def work():
+        for _ in range(2000):
+            metrics.incr('pages')
+            metrics.observe('parse', 0.001)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert metrics.get('pages') == 8000
+    assert metrics.snapshot()["timers"]["parse"]["count"] == 8000
+    assert metrics.get('missing') == 0
+
+
+def test_samples_limited_by_interval(tmp_path):
+    metrics = Metrics(sampleInterval=0.05, maxSamples=3)
+    metrics.incr('urls', 2)
+    assert metrics.maybe_sample() is not None
+    metrics.incr('urls')
+    assert metrics.maybe_sample() is None
+    time.sleep(0.06)
+    metrics.incr('words', 5)
+    assert metrics.maybe_sample()["urls"] == 3
+    assert metrics.series('urls') == [2, 3] and metrics.series('words') == [0, 5]
+    for _ in range(3):
+        metrics.maybe_sample(force=True)
+    assert len(metrics.samples) == 3
+
+    with metrics.timer('commit'):
+        pass
+    metrics.to_json(str(tmp_path / 'metrics.json'))
+    metrics.to_csv(str(tmp_path / 'samples.csv'))
+    metrics.timers_to_csv(str(tmp_path / 'timers.csv'))
+    data = json.loads((tmp_path / 'metrics.json').read_text(encoding='utf-8'))
+    assert data["counters"] == {"urls": 3, "words": 5} and len(data["samples"]) == 3
+    with open(tmp_path / 'samples.csv', encoding='utf-8') as file:
+        rows = list(csv.DictReader(file))
+    assert list(rows[0]) == ['time', 'urls', 'words'] and rows[-1]['words'] == '5'
+    with open(tmp_path / 'timers.csv', encoding='utf-8') as file:
+        assert [row['stage'] for row in csv.DictReader(file)] == ['commit']
+
+
+def test_crawler_counters_match_tables(db_path, site_url):
+    crawler = Crawler(db_path)
+    crawler.metrics.sampleInterval = 0
+    statements = []
+    crawler.url_dao.conn.set_trace_callback(statements.append)
+    crawler.crawl([site_url + '/p0.html'], 4, maxUrls=7)
+    crawler.url_dao.conn.set_trace_callback(None)
+    # Счетчики ведутся при вставке, без COUNT(*) по таблицам на каждой странице
+    assert not [sql for sql in statements if 'COUNT(' in sql.upper()]
+
+    conn = sqlite3.connect(db_path)
+    try:
+        for name, table in (('urls', 'urllist'), ('words', 'wordlist'), ('links', 'link')):
+            assert crawler.metrics.get(name) == conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    finally:
+        conn.close()
+    assert crawler.metrics.get('pages_indexed') == 7
+    assert {'fetch', 'parse', 'db_write'} <= set(crawler.metrics.snapshot()["timers"])
+    assert crawler.metrics.series('pages_seen')[-1] == crawler.metrics.get('pages_seen')
@@ -0,0 +1,87 @@
+import sqlite3
+
+import pytest
+
+from DAO import FetchStateDAO, FingerprintDAO, SECONDARY_INDEXES, is_without_rowid
+from migrate import migrate
+from searcher import Searcher
+
+QUERIES = ('погода', 'город погода', 'спорт город погода', 'новости наука', '"погода спорт"')
+
+
+def index_names(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    finally:
+        conn.close()
+
+
+def search_results(db_path):
+    searcher = Searcher(db_path)
+    searcher.verbose = False
+    searcher.calculatePageRank()
+    return {query: searcher.getSortedList(query, k=10) for query in QUERIES}
+
+
+def test_migrated_database_gives_same_results(indexed_db):
+    db_path, _ = indexed_db
+    before = search_results(db_path)
+    assert any(before.values())
+
+    assert migrate(db_path) is not None
+    conn = sqlite3.connect(db_path)
+    try:
+        assert is_without_rowid(conn, 'wordlocation') and is_without_rowid(conn, 'linkwords')
+    finally:
+        conn.close()
+    names = index_names(db_path)
+    assert set(SECONDARY_INDEXES) - {'wordlocidx'} <= names
+    assert 'wordlocidx' not in names
+
+    after = search_results(db_path)
+    for query in QUERIES:
+        assert [url for _, _, url in after[query]] == [url for _, _, url in before[query]]
+        assert [m3 for m3, _, _ in after[query]] == pytest.approx([m3 for m3, _, _ in before[query]])
+    assert migrate(db_path) is None
+
+
+def test_side_tables_follow_merged_urls(db_path):
+    conn = sqlite3.connect(db_path)
+    # Схема v1 допускает повторяющиеся URL: id 3 - дубликат id 1
+    conn.executemany('INSERT INTO urllist (id, url) VALUES (?, ?)',
+                     [(1, 'http://a.example/'), (2, 'http://b.example/'), (3, 'http://a.example/'),
+                      (4, 'http://c.example/')])
+    conn.commit()
+    conn.close()
+
+    fingerprints = FingerprintDAO(db_path)
+    fingerprints.add_fingerprint(2, 20)
+    fingerprints.add_fingerprint(3, 30)
+    fingerprints.add_alias(2, 3, 1)  # b - почти-дубликат страницы, сохраненной под id дубликата
+    fingerprints.add_alias(3, 1, 0)  # дубликат указывает на собственный оставляемый id
+    fingerprints.commit()
+    fetch = FetchStateDAO(db_path)
+    fetch.record_fetch(1, 'etag-1', None, 'h1', 100.0, 60.0)
+    fetch.record_fetch(3, 'etag-3', None, 'h3', 200.0, 60.0)
+    fetch.record_fetch(4, 'etag-4', None, 'h4', 300.0, 60.0)
+    fetch.commit()
+    fingerprints.close()
+    fetch.close()
+
+    migrate(db_path)
+
+    fingerprints = FingerprintDAO(db_path)
+    fetch = FetchStateDAO(db_path)
+    try:
+        assert dict(fingerprints.get_all_fingerprints()) == {2: 20, 1: 30}
+        assert fingerprints.get_aliases() == {2: 1}
+        # У оставляемого id уже было состояние - строка дубликата удаляется
+        assert fetch.get_state(1)['etag'] == 'etag-1'
+        assert fetch.get_state(3) is None
+        assert fetch.get_state(4)['etag'] == 'etag-4'
+        # Журнал связей для инкрементального PageRank тоже ссылается на оставляемые id
+        assert sorted(fetch.conn.execute('SELECT from_url_id, to_url_id FROM linkchanges')) == [(1, 1), (2, 1)]
+    finally:
+        fingerprints.close()
+        fetch.close()
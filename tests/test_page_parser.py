@@ -0,0 +1,40 @@
+import pytest
+
+from page_parser import extract_stream, parse_page, separate_words
+
+DOCUMENTS = [
+    '<html><head><title>Заголовок</title><style>p { color: red }</style></head>'
+    '<body><p>Погода в городе&nbsp;и спорт</p><script>var город = 1;</script>'
+    '<a href="/a.html">Новости <b>спорта</b></a> <a href="#top">наверх</a> <a href="mailto:x@y.z">почта</a>'
+    '<a href="app.apk">файл</a> <a href="http://[::1">сломанная</a> <a href="b.html">Наука</a></body></html>',
+    '<html><body><div>Текст&#33; с&amp;сущностями</div><a href="/c.html"><img src="x.png"/></a>'
+    '<p>хвост страницы <a href="/d.html">незакрытая ссылка до конца</p></body></html>',
+    '<html><body><p>да или нет</p><p>слово</p><p>раздельные</p>абзацы</body></html>',
+]
+
+
+@pytest.mark.parametrize('html', DOCUMENTS)
+def test_stream_matches_soup(html):
+    assert parse_page('http://example.com/dir/p.html', html, 'stream') == \
+        parse_page('http://example.com/dir/p.html', html, 'soup')
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64])
+def test_words_split_by_chunks(size):
+    html = DOCUMENTS[0] + DOCUMENTS[1]
+    expected = extract_stream('http://example.com/', [html])
+    chunks = [html[i:i + size] for i in range(0, len(html), size)]
+    assert extract_stream('http://example.com/', chunks) == expected
+
+
+def test_script_style_and_links():
+    url, words, links = parse_page('http://example.com/dir/p.html', DOCUMENTS[0], 'stream')
+    assert 'var' not in words and 'color' not in words
+    # Соседние текстовые узлы склеиваются без пробела, как в BeautifulSoup.get_text()
+    assert words == separate_words('ЗаголовокПогода в городе и спортНовости спорта наверх почтафайл сломанная Наука')
+    assert links == [('http://example.com/a.html', 'Новости спорта'), ('http://example.com/dir/b.html', 'Наука')]
+
+
+def test_unknown_extractor():
+    with pytest.raises(ValueError):
+        parse_page('http://example.com/', '<p>текст</p>', 'lxml')
@@ -0,0 +1,138 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from DBcreate import create_db
+from DAO import LOOKUP_INDEXES, SECONDARY_INDEXES
+from pagerank import LinkGraph, compute_page_rank
+from searcher import Searcher
+
+
+def index_names(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    finally:
+        conn.close()
+
+
+def test_new_database_has_indexes(tmp_path):
+    create_db(str(tmp_path / 'v1.db'))
+    assert set(LOOKUP_INDEXES) | set(SECONDARY_INDEXES) <= index_names(str(tmp_path / 'v1.db'))
+    create_db(str(tmp_path / 'v2.db'), version=2)
+    assert set(LOOKUP_INDEXES) | set(SECONDARY_INDEXES) - {'wordlocidx'} <= index_names(str(tmp_path / 'v2.db'))
+
+
+def test_page_rank_rebuilds_only_its_index(indexed_db):
+    db_path, _ = indexed_db
+    before = index_names(db_path)
+    searcher = Searcher(db_path)
+    searcher.verbose = False
+    statements = []
+    searcher.page_rank_dao.conn.set_trace_callback(statements.append)
+    searcher.calculatePageRank()
+    searcher.page_rank_dao.conn.set_trace_callback(None)
+
+    index_statements = [sql for sql in statements if sql.upper().startswith(('CREATE INDEX', 'DROP INDEX'))]
+    assert index_statements == [SECONDARY_INDEXES['rankurlididx']]
+    assert index_names(db_path) == before
+    assert searcher.page_rank_dao.get_all_page_rank()
+
+
+def reference_page_rank(n, edges, damping=0.85, iterations=500):
+    """ PageRank по определению: ранг висячих страниц делится поровну между всеми страницами """
+    edges = set(edges)
+    out_degree = [0] * n
+    for src, _ in edges:
+        out_degree[src] += 1
+    scores = [1.0] * n
+    for _ in range(iterations):
+        dangling = sum(score for score, degree in zip(scores, out_degree) if degree == 0) / n
+        incoming = [0.0] * n
+        for src, dst in edges:
+            incoming[dst] += scores[src] / out_degree[src]
+        scores = [(1 - damping) + damping * (value + dangling) for value in incoming]
+    return scores
+
+
+def random_edges(n, count, seed):
+    """ Случайные ребра без петель (ссылки страницы на себя в граф не попадают, см. get_all_links) """
+    rng = np.random.default_rng(seed)
+    pairs = zip(rng.integers(0, n, count).tolist(), rng.integers(0, n, count).tolist())
+    return [(src, dst) for src, dst in pairs if src != dst]
+
+
+def fill_graph(db_path, n, edges):
+    """ urllist с id 1..n и связи между ними (номер вершины + 1 = url_id) """
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany('INSERT INTO urllist (id, url) VALUES (?, ?)',
+                         [(i + 1, f'http://example.com/{i}') for i in range(n)])
+        conn.executemany('INSERT INTO link (from_url_id, to_url_id) VALUES (?, ?)',
+                         [(src + 1, dst + 1) for src, dst in edges])
+    conn.close()
+
+
+def test_compute_page_rank_matches_definition():
+    n = 40
+    # Повторяющиеся ребра, висячие вершины (30..39 без исходящих) и ребро на неизвестный url_id
+    edges = [(src % 30, dst) for src, dst in random_edges(n, 150, seed=1)]
+    graph = LinkGraph(range(1, n + 1), [(src + 1, dst + 1) for src, dst in edges + edges[:10]] + [(1, 999)])
+    scores, iterations, residual = compute_page_rank(graph, tolerance=1e-10, max_iterations=500)
+
+    assert residual < 1e-10 and iterations < 500
+    assert np.allclose(scores, reference_page_rank(n, edges), atol=1e-8)
+    assert scores.sum() == pytest.approx(n)
+
+
+def test_calculate_page_rank_writes_normalized_scores(db_path):
+    n = 50
+    edges = random_edges(n, 200, seed=2)
+    fill_graph(db_path, n, edges)
+    searcher = Searcher(db_path)
+    searcher.verbose = False
+    searcher.calculatePageRank(tolerance=1e-10)
+
+    stored = dict(searcher.page_rank_dao.get_all_page_rank())
+    expected = np.array(reference_page_rank(n, edges))
+    assert sorted(stored) == list(range(1, n + 1))
+    assert max(stored.values()) == pytest.approx(1.0)
+    assert np.allclose([stored[i + 1] for i in range(n)], expected / expected.max(), atol=1e-8)
+
+
+def test_incremental_page_rank_matches_full(db_path):
+    rng = np.random.default_rng(4)
+    # Большая компонента (в ней максимум ранга) и отдельное кольцо 200..219; у всех страниц есть исходящие ссылки
+    edges = [(i, (i + 1) % 200) for i in range(200)] + \
+        [(src, dst) for src, dst in zip(rng.integers(0, 200, 600).tolist(), rng.integers(0, 50, 600).tolist())
+         if src != dst]
+    edges += [(i, 200 + (i - 199) % 20) for i in range(200, 220)]
+    fill_graph(db_path, 220, edges)
+
+    searcher = Searcher(db_path)
+    searcher.verbose = False
+    searcher.calculatePageRank(tolerance=1e-10)
+
+    # Небольшой обход добавил хорды в кольцо - меняются только ранги кольца
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany('INSERT INTO link (from_url_id, to_url_id) VALUES (?, ?)', [(206, 211), (213, 202)])
+    conn.close()
+
+    written = []
+    update_page_ranks = searcher.page_rank_dao.update_page_ranks
+    searcher.page_rank_dao.update_page_ranks = \
+        lambda updates, inserts: written.append(len(updates) + len(inserts)) or update_page_ranks(updates, inserts)
+    residual = searcher.calculatePageRankIncremental(tolerance=1e-10)
+    incremental = dict(searcher.page_rank_dao.get_all_page_rank())
+
+    # Переписаны только строки пересчитанных страниц кольца
+    assert residual < 1e-10
+    assert 0 < written[0] <= 20
+    assert searcher.page_rank_dao.get_changed_link_urls() == []
+
+    searcher.calculatePageRank(tolerance=1e-10)
+    full = dict(searcher.page_rank_dao.get_all_page_rank())
+    assert sorted(incremental) == sorted(full)
+    assert np.allclose([incremental[i] for i in sorted(full)], [full[i] for i in sorted(full)], atol=1e-8)
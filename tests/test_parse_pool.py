@@ -0,0 +1,80 @@
+import pickle
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import crawler as crawler_module
+from crawler import Crawler
+from page_parser import parse_page, parse_page_timed
+
+Response = namedtuple('Response', 'status_code headers text')
+
+
+def index_contents(db_path):
+    """ Вхождения слов и ссылки по текстам слов и адресов (id в разных БД могут различаться) """
+    conn = sqlite3.connect(db_path)
+    try:
+        words = sorted(conn.execute('''
+            SELECT wordlist.word, urllist.url, wordlocation.location FROM wordlocation
+            JOIN wordlist ON wordlist.id = wordlocation.word_id JOIN urllist ON urllist.id = wordlocation.url_id
+        '''))
+        links = sorted(conn.execute('''
+            SELECT f.url, t.url FROM link JOIN urllist f ON f.id = link.from_url_id JOIN urllist t ON t.id = link.to_url_id
+        '''))
+        return words, links
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('extractor', ['soup', 'stream'])
+def test_parse_payload_is_compact(extractor):
+    html = '<html><body><p>Погода и город</p><script>var x;</script> <a href="/a.html">Новости спорта</a></body></html>'
+    url, words, links = parse_page('http://example.com/p.html', html, extractor)
+    assert words == ['погода', 'город', 'новости', 'спорта']
+    assert links == [('http://example.com/a.html', 'Новости спорта')]
+    # Из процесса возвращаются только слова и ссылки - без дерева разбора
+    assert len(pickle.dumps((url, words, links))) < len(html) * 2
+
+
+def test_pool_crawl_matches_single_process(tmp_path, db_path, site_url):
+    from DBcreate import create_db
+    pooled_path = str(tmp_path / 'pooled.db')
+    create_db(pooled_path)
+
+    Crawler(db_path).crawlConcurrent([site_url + '/p0.html'], 4, maxUrls=7)
+    Crawler(pooled_path).crawlConcurrent([site_url + '/p0.html'], 4, maxUrls=7, parseWorkers=2, parseQueueSize=1)
+    assert index_contents(pooled_path) == index_contents(db_path)
+    assert index_contents(db_path)[0]
+
+
+def test_parse_queue_depth_limited(db_path, monkeypatch):
+    active = [0, 0]  # сейчас в разборе, максимум
+    lock = threading.Lock()
+
+    def slow_parse(url, html_doc, extractor):
+        with lock:
+            active[0] += 1
+            active[1] = max(active)
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        return parse_page_timed(url, html_doc, extractor)
+
+    monkeypatch.setattr(crawler_module, 'parse_page_timed', slow_parse)
+    pages = queue.Queue()
+    for i in range(12):
+        pages.put((f'http://example.com/{i}.html',
+                   Response(200, {}, f'<html><body>страница номер {i}</body></html>')))
+
+    crawler = Crawler(db_path, bulkIndex=True, commitEvery=100)
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        crawler.parseLevel(pool, 2, pages, 12, set(), {})
+    crawler.flushIndex()
+
+    assert active[1] == 2
+    assert crawler.metrics.get('pages_indexed') == 12
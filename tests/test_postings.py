@@ -0,0 +1,55 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from postings import PostingList, gallop, intersect, min_location_rows
+from searcher import Searcher
+
+
+def random_postings(rng, docs, density):
+    doc_ids = sorted(rng.choice(docs, size=max(1, int(docs * density)), replace=False).tolist())
+    return PostingList(doc_ids, [sorted(rng.choice(50, size=rng.integers(1, 6), replace=False).tolist())
+                                 for _ in doc_ids])
+
+
+def test_gallop_finds_lower_bound():
+    values = [1, 3, 3, 7, 10, 20, 40]
+    for target in range(0, 45):
+        for lo in range(len(values)):
+            expected = next((i for i in range(lo, len(values)) if values[i] >= target), len(values))
+            assert gallop(values, target, lo) == expected
+
+
+def test_min_location_rows_matches_all_combinations():
+    rng = np.random.default_rng(5)
+    for density in ([0.9, 0.5], [0.05, 0.8, 0.6], [0.3, 0.3, 0.3, 0.9]):
+        postings = [random_postings(rng, 200, d) for d in density]
+        expected = {}
+        for doc in set.intersection(*(set(posting.doc_ids) for posting in postings)):
+            # Все комбинации позиций, как в N-кратном самосоединении wordlocation
+            lists = [posting.positions[posting.doc_ids.index(doc)] for posting in postings]
+            expected[doc] = min(sum(combination) for combination in itertools.product(*lists))
+
+        rows = list(min_location_rows(postings))
+        assert [row[0] for row in rows] == sorted(expected)
+        assert {row[0]: sum(row[1:]) for row in rows} == expected
+        assert [doc for doc, _ in intersect(postings)] == sorted(expected)
+
+
+def test_intersect_with_empty_list():
+    assert list(intersect([PostingList([1, 2], [[0], [1]]), PostingList([], [])])) == []
+    assert list(intersect([])) == []
+
+
+@pytest.mark.parametrize('query', ['погода', 'город погода', 'спорт город погода', 'новости наука'])
+def test_postings_engine_matches_join(indexed_db, query):
+    joined = Searcher(indexed_db[0], matchEngine='join')
+    merged = Searcher(indexed_db[0], matchEngine='postings')
+    joined.verbose = merged.verbose = False
+
+    joinRows, wordids = joined.getMatchRows(query)
+    mergeRows, _ = merged.getMatchRows(query)
+    assert len(mergeRows) == len({row[0] for row in joinRows})
+    assert merged.locationScore(mergeRows) == joined.locationScore(joinRows)
+    assert merged.getSortedList(query, k=10) == joined.getSortedList(query, k=10)
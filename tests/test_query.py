@@ -0,0 +1,46 @@
+import pytest
+
+from query import parse_query, query_words, has_operators
+from searcher import Searcher, SCORING_MODES
+
+
+def test_parse_query_words():
+    assert query_words(parse_query('"город" "погода"')) == ['город', 'погода']
+    assert query_words(parse_query('"город погода')) == ['город', 'погода']
+    assert query_words(parse_query('город и погода')) == ['город', 'погода']
+    assert not has_operators(parse_query('"город" погода'))
+    assert has_operators(parse_query('"город погода"'))
+
+
+def test_parse_query_near_without_operand():
+    with pytest.raises(ValueError):
+        parse_query('город NEAR')
+
+
+@pytest.fixture
+def searcher(indexed_db):
+    searcher = Searcher(indexed_db[0])
+    searcher.verbose = False
+    return searcher
+
+
+def urlids(searcher, query, scoring):
+    return sorted(urlid for _, urlid, _ in searcher.getSortedList(query, k=100, scoring=scoring))
+
+
+@pytest.mark.parametrize('scoring', SCORING_MODES)
+@pytest.mark.parametrize('query, plain', [
+    ('"город"', 'город'),
+    ('"город" "погода"', 'город погода'),
+    ('"город', 'город'),
+    ('город и погода', 'город погода'),
+    ('Город, погода!', 'город погода'),
+])
+def test_plain_queries_tokenized_like_index(searcher, scoring, query, plain):
+    expected = urlids(searcher, plain, scoring)
+    assert expected
+    assert urlids(searcher, query, scoring) == expected
+
+
+def test_query_without_words(searcher):
+    assert searcher.getSortedList('и', k=10) == []
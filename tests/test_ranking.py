@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from searcher import Searcher
+
+
+@pytest.fixture
+def searcher(indexed_db):
+    searcher = Searcher(indexed_db[0])
+    searcher.verbose = False
+    searcher.calculatePageRank()
+    return searcher
+
+
+def full_ranking(searcher, query):
+    """ M3 по всем кандидатам с полной сортировкой - как до перехода на кучу """
+    rows, _ = searcher.getMatchRows(query)
+    m1Scores = searcher.locationScore(rows)
+    ranks = dict(searcher.page_rank_dao.get_all_page_rank())
+    return sorted((((m1 + ranks.get(urlid, 0)) / 2, urlid) for urlid, m1 in m1Scores.items()), reverse=True)
+
+
+@pytest.mark.parametrize('k', [1, 2, 3, 100])
+def test_top_k_matches_full_sort(searcher, k):
+    expected = full_ranking(searcher, 'город погода')[:k]
+    result = searcher.getSortedList('город погода', k=k)
+    assert [(m3, urlid) for m3, urlid, _ in result] == pytest.approx(expected)
+    assert [url_text[0] for _, _, url_text in result] == [urlid for _, urlid in expected]
+    assert all(url_text[1].startswith('http://') for _, _, url_text in result)
+
+
+def test_scores_and_urls_fetched_in_bulk(searcher):
+    statements = []
+    searcher.url_dao.conn.set_trace_callback(statements.append)
+    result = searcher.getSortedList('погода', k=3)
+    searcher.url_dao.conn.set_trace_callback(None)
+
+    assert len(result) == 3
+    # Один запрос к pagerank на всех кандидатов и один к urllist на k результатов
+    assert len([sql for sql in statements if 'FROM pagerank' in sql]) == 1
+    assert len([sql for sql in statements if 'FROM urllist' in sql]) == 1
+
+
+def test_page_ranks_in_memory_give_same_result(searcher):
+    fromDb = searcher.getSortedList('спорт город', k=5)
+    searcher.loadPageRank()
+    statements = []
+    searcher.url_dao.conn.set_trace_callback(statements.append)
+    assert searcher.getSortedList('спорт город', k=5) == fromDb
+    searcher.url_dao.conn.set_trace_callback(None)
+    assert not [sql for sql in statements if 'FROM pagerank' in sql]
+
+
+def test_no_highlight_files_written(searcher, tmp_path, monkeypatch):
+    workdir = tmp_path / 'cwd'
+    workdir.mkdir()
+    monkeypatch.chdir(workdir)
+    searcher.getSortedList('погода', k=3)
+    highlighted = searcher.getSortedList('погода', k=3, highlight=True)
+    assert os.listdir(workdir) == []
+    assert all('погода' in snippet['text'] for _, _, _, snippet in highlighted)
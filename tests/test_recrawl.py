@@ -0,0 +1,138 @@
+import hashlib
+import http.server
+
+import pytest
+
+from crawler import Crawler
+from DAO import FetchStateDAO, FingerprintDAO, UrlListDAO
+from searcher import Searcher
+
+DAY = 24 * 3600
+
+
+def make_handler(pages, log):
+    """ Обработчик с ETag по содержимому страницы; на совпадающий If-None-Match отвечает 304 """
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            html = pages.get(self.path)
+            log.append((self.path, self.headers.get('If-None-Match')))
+            if html is None:
+                self.send_error(404)
+                return
+            body = html.encode('utf-8')
+            etag = '"' + hashlib.md5(body).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+@pytest.fixture
+def site(http_site):
+    pages = {
+        '/p0.html': '<html><body>первая страница <a href="/p1.html">вторая</a> <a href="/missing.html">нет</a>'
+                    '</body></html>',
+        '/p1.html': '<html><body>вторая страница</body></html>',
+    }
+    log = []
+    return pages, log, http_site(make_handler(pages, log))
+
+
+@pytest.mark.parametrize('mode', ['crawl', 'crawlConcurrent', 'crawlFrontier'])
+def test_recrawl_conditional_get(db_path, site, mode):
+    pages, log, base = site
+    crawler = Crawler(db_path)
+    getattr(crawler, mode)([base + '/p0.html'], 2)
+
+    url_ids = UrlListDAO(db_path).get_url_ids([base + '/p0.html', base + '/p1.html', base + '/missing.html'])
+    fetch_state_dao = FetchStateDAO(db_path)
+    # Валидаторы сохраняются во всех режимах обхода, ответ 404 не сохраняется
+    assert fetch_state_dao.get_state(url_ids[base + '/p0.html'])['etag']
+    assert fetch_state_dao.get_state(url_ids[base + '/p1.html'])['etag']
+    missing = url_ids.get(base + '/missing.html')
+    assert missing is None or fetch_state_dao.get_state(missing) is None
+
+    log.clear()
+    assert crawler.recrawl(now=crawler.recrawlInterval * 2 + 1e10) == \
+        {"not_modified": 2, "unchanged": 0, "changed": 0, "errors": 0}
+    assert all(etag for _, etag in log)
+
+    pages['/p1.html'] = '<html><body>обновленная страница</body></html>'
+    result = crawler.recrawl(now=crawler.recrawlInterval * 10 + 1e10)
+    assert result == {"not_modified": 1, "unchanged": 0, "changed": 1, "errors": 0}
+    searcher = Searcher(db_path)
+    searcher.verbose = False
+    assert [urlid for _, urlid, _ in searcher.getSortedList('обновленная')] == [url_ids[base + '/p1.html']]
+
+
+def page_urls(searcher, query):
+    return [url for _, _, (_, url) in searcher.getSortedList(query, k=10)]
+
+
+def test_recrawl_replaces_content_and_adapts_interval(db_path, site):
+    pages, log, base = site
+    crawler = Crawler(db_path)
+    crawler.crawl([base + '/p0.html'], 2)
+    url_ids = UrlListDAO(db_path).get_url_ids([base + '/p0.html', base + '/p1.html'])
+
+    pages['/p0.html'] = '<html><body>новый текст <a href="/p2.html">третья</a></body></html>'
+    now = 1e10
+    assert crawler.recrawl(now=now) == {"not_modified": 1, "unchanged": 0, "changed": 1, "errors": 0}
+
+    fetch_state_dao = FetchStateDAO(db_path)
+    changed = fetch_state_dao.get_state(url_ids[base + '/p0.html'])
+    assert changed['interval'] == crawler.recrawlInterval / crawler.recrawlBackoff
+    assert changed['next_due'] == now + changed['interval'] and changed['changes'] == 1
+    assert fetch_state_dao.get_state(url_ids[base + '/p1.html'])['interval'] == \
+        crawler.recrawlInterval * crawler.recrawlBackoff
+
+    searcher = Searcher(db_path)
+    searcher.verbose = False
+    assert page_urls(searcher, 'первая') == []
+    assert page_urls(searcher, 'новый текст') == [base + '/p0.html']
+    # Исходящие ссылки страницы заменены вместе со словами ссылок
+    assert [url for url, _ in crawler.link_dao.conn.execute('''
+        SELECT t.url, f.url FROM link JOIN urllist f ON f.id = link.from_url_id JOIN urllist t ON t.id = link.to_url_id
+        WHERE f.url = ?''', (base + '/p0.html',))] == [base + '/p2.html']
+    assert crawler.recrawl(now=now) == {"not_modified": 0, "unchanged": 0, "changed": 0, "errors": 0}
+
+
+def test_recrawl_rechecks_duplicates(db_path, site):
+    pages, log, base = site
+    text = ' '.join(f'слово{i}' for i in range(60))
+    pages['/p0.html'] = f'<html><body><p>{text}</p> <a href="/p1.html">вторая</a></body></html>'
+    pages['/p1.html'] = f'<html><body><p>{text}</p> вторая</body></html>'
+    crawler = Crawler(db_path, dedupe=True)
+    crawler.crawl([base + '/p0.html'], 2)
+    url_ids = UrlListDAO(db_path).get_url_ids([base + '/p0.html', base + '/p1.html'])
+    p0, p1 = url_ids[base + '/p0.html'], url_ids[base + '/p1.html']
+    assert crawler.aliases == {p1: p0}
+
+    # Псевдоним перестал быть дубликатом - страница индексируется, пометка снимается
+    pages['/p1.html'] = '<html><body>отдельная страница про космос и звезды</body></html>'
+    assert crawler.recrawl(now=1e10)["changed"] == 1
+    assert crawler.aliases == {} and FingerprintDAO(db_path).get_aliases() == {}
+    searcher = Searcher(db_path)
+    searcher.verbose = False
+    assert page_urls(searcher, 'космос') == [base + '/p1.html']
+
+    # Снова стал дубликатом - содержимое убирается из индекса
+    pages['/p1.html'] = f'<html><body><p>{text}</p> вторая</body></html>'
+    assert crawler.recrawl(now=1e11)["changed"] == 1
+    assert crawler.aliases == {p1: p0} and FingerprintDAO(db_path).get_aliases() == {p1: p0}
+    assert page_urls(searcher, 'космос') == []
+    assert page_urls(searcher, 'слово1') == [base + '/p0.html']
+    assert crawler.isIndexed(base + '/p1.html')
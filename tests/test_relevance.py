@@ -0,0 +1,92 @@
+import math
+import sqlite3
+
+import pytest
+
+from crawler import Crawler
+from DAO import TermStatsDAO
+from searcher import EmptyCorpusStatsError, Searcher
+
+TEXTS = [
+    'погода погода город спорт новости',
+    'погода город',
+    'спорт футбол город погода погода погода длинная страница про спорт и погоду в городе',
+    'наука техника',
+]
+PAGES = [(f'http://example.com/p{i}.html', text.split()) for i, text in enumerate(TEXTS)]
+
+
+def stats_tables(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        tables = ('doclength', 'termstats', 'termfreq')
+        return {table: sorted(conn.execute(f'SELECT * FROM {table}')) for table in tables} | \
+            {'meta': sorted(conn.execute("SELECT key, value FROM meta WHERE key IN ('doc_count', 'total_length')"))}
+    finally:
+        conn.close()
+
+
+def reference_scores(searcher, query, scoring):
+    """ BM25 / tf-idf по определению: частоты считаются по wordlocation, без таблиц статистики """
+    conn = searcher.url_dao.conn
+    word_ids = searcher.getWordsIds(query)
+    docs = dict(conn.execute('SELECT url_id, COUNT(*) FROM wordlocation GROUP BY url_id'))
+    avg = sum(docs.values()) / len(docs)
+    tfs = [dict(conn.execute('SELECT url_id, COUNT(*) FROM wordlocation WHERE word_id = ? GROUP BY url_id',
+                             (word_id,))) for word_id in word_ids]
+    candidates = set.intersection(*(set(tf) for tf in tfs))
+    scores = dict.fromkeys(candidates, 0.0)
+    for tf in tfs:
+        for url_id in candidates:
+            if scoring == 'bm25':
+                idf = math.log(1 + (len(docs) - len(tf) + 0.5) / (len(tf) + 0.5))
+                norm = searcher.bm25K1 * (1 - searcher.bm25B + searcher.bm25B * docs[url_id] / avg)
+                scores[url_id] += idf * tf[url_id] * (searcher.bm25K1 + 1) / (tf[url_id] + norm)
+            else:
+                scores[url_id] += (1 + math.log(tf[url_id])) * math.log(1 + len(docs) / len(tf))
+    top = max(scores.values())
+    return {url_id: score / top for url_id, score in scores.items()}
+
+
+@pytest.fixture
+def searcher(db_path):
+    crawler = Crawler(db_path)
+    for url, words in PAGES:
+        crawler.addIndexWords(url, words)
+    searcher = Searcher(db_path)
+    searcher.verbose = False
+    return searcher
+
+
+def test_incremental_stats_match_rebuild(db_path, searcher):
+    crawler = Crawler(db_path)
+    crawler.reindexPage(crawler.getUrlId(PAGES[1][0]), PAGES[1][0], '<html><body>город футбол футбол</body></html>')
+    incremental = stats_tables(db_path)
+    assert incremental['meta'] == [('doc_count', 4), ('total_length', 5 + 3 + 14 + 2)]
+
+    TermStatsDAO(db_path).rebuild()
+    assert stats_tables(db_path) == incremental
+
+
+@pytest.mark.parametrize('scoring', ['bm25', 'tfidf'])
+@pytest.mark.parametrize('query', ['погода', 'город погода', 'спорт погода'])
+def test_scores_match_definition(searcher, scoring, query):
+    statements = []
+    searcher.url_dao.conn.set_trace_callback(statements.append)
+    scores = searcher.relevanceScore(searcher.getWordsIds(query), scoring)
+    searcher.url_dao.conn.set_trace_callback(None)
+    assert not [sql for sql in statements if 'wordlocation' in sql]
+    assert scores == pytest.approx(reference_scores(searcher, query, scoring))
+
+
+def test_bm25_prefers_short_documents(searcher):
+    # Одинаковая доля слова в документе: у короткого документа ранг выше
+    result = searcher.getSortedList('город', scoring='bm25', weights={'m2': 0})
+    assert [url for _, _, (_, url) in result][0] == PAGES[1][0]
+
+
+def test_empty_stats(db_path):
+    searcher = Searcher(db_path)
+    searcher.verbose = False
+    with pytest.raises(EmptyCorpusStatsError):
+        searcher.relevanceScore([1], 'bm25')
@@ -0,0 +1,140 @@
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from crawler import Crawler
+from DAO import WordLocationDAO, WordListDAO
+from searcher import Searcher
+from segments import Segment, SegmentIndex, write_segment
+
+
+def as_lists(postings):
+    return [int(doc) for doc in postings.doc_ids], [postings.positions[j] for j in range(len(postings))]
+
+
+def random_terms(rng, doc_ids, vocabulary=30):
+    """ {word_id: [(url_id, [позиции]), ...]} для документов doc_ids """
+    terms = {}
+    for doc in doc_ids:
+        words = rng.integers(1, vocabulary, rng.integers(5, 40))
+        for location, word_id in enumerate(words.tolist()):
+            postings = terms.setdefault(word_id, [])
+            if not postings or postings[-1][0] != doc:
+                postings.append((doc, []))
+            postings[-1][1].append(location)
+    return terms
+
+
+def merged_terms(*parts):
+    terms = {}
+    for part in parts:
+        for word_id, postings in part.items():
+            terms.setdefault(word_id, []).extend(postings)
+    return {word_id: sorted(postings) for word_id, postings in terms.items()}
+
+
+def test_segment_round_trip_without_copy(tmp_path):
+    terms = random_terms(np.random.default_rng(1), [3, 9, 4, 20])
+    path = str(tmp_path / 'a.seg')
+    write_segment(path, terms, [3, 9, 4, 20])
+    segment = Segment(path)
+
+    assert segment.doc_ids.tolist() == [3, 4, 9, 20]
+    assert segment.has_doc(9) and not segment.has_doc(5)
+    for word_id, postings in terms.items():
+        assert segment.iter_postings(word_id) == sorted(postings)
+        doc_ids, counts, positions = segment.get_postings(word_id)
+        # Массивы ссылаются на отображение файла, а не на копию
+        for array in (doc_ids, counts, positions):
+            assert not array.flags.owndata and not array.flags.writeable
+    assert segment.get_postings(10 ** 6) is None
+
+
+def test_index_merges_postings_of_all_segments(tmp_path):
+    rng = np.random.default_rng(2)
+    # Документы сегментов идут не по порядку url_id
+    parts = [random_terms(rng, docs) for docs in ([10, 11, 12], [1, 2], [30, 5])]
+    index = SegmentIndex(str(tmp_path / 'idx'))
+    for part, docs in zip(parts, ([10, 11, 12], [1, 2], [30, 5])):
+        index.add_segment(part, docs)
+
+    reader = SegmentIndex(str(tmp_path / 'idx'))
+    for word_id, postings in merged_terms(*parts).items():
+        result = reader.get_postings(word_id)
+        assert isinstance(result.doc_ids, np.ndarray)
+        assert as_lists(result) == ([doc for doc, _ in postings], [positions for _, positions in postings])
+    assert len(reader.get_postings(10 ** 6)) == 0
+    assert reader.stats()['segments'] == 3 and reader.stats()['docs'] == 7
+
+
+def test_maybe_merge(tmp_path):
+    rng = np.random.default_rng(3)
+    directory = str(tmp_path / 'idx')
+    index = SegmentIndex(directory, mergeFactor=3)
+    parts = []
+    for first in range(0, 50, 10):
+        docs = list(range(first + 1, first + 11))
+        parts.append(random_terms(rng, docs))
+        index.add_segment(parts[-1], docs)
+    reader = SegmentIndex(directory)
+    before = {word_id: as_lists(reader.get_postings(word_id)) for word_id in merged_terms(*parts)}
+
+    assert index.maybe_merge()
+    assert index.stats()['segments'] == 3
+    assert index.maybe_merge()
+    assert index.stats()['segments'] == 1
+    assert not index.maybe_merge()
+    assert sorted(name for name in os.listdir(directory) if name.endswith('.seg')) == \
+        sorted(segment.name for segment in index.segments)
+    # Читатель подхватывает новый список сегментов
+    assert {word_id: as_lists(reader.get_postings(word_id)) for word_id in before} == before
+    assert reader.stats() == index.stats()
+
+
+def test_from_database_matches_wordlocation(indexed_db, tmp_path):
+    dao = WordLocationDAO(indexed_db[0])
+    index = SegmentIndex.from_database(dao, str(tmp_path / 'idx'), docsPerSegment=2)
+    assert index.stats()['segments'] == 4
+    for _, word_id in WordListDAO(indexed_db[0]).get_words_with_ids(-1):
+        expected = dao.get_postings(word_id)
+        assert as_lists(index.get_postings(word_id)) == (expected.doc_ids, expected.positions)
+
+
+def test_crawl_into_segments(indexed_db, tmp_path, site_url):
+    path = str(tmp_path / 'segments.db')
+    directory = str(tmp_path / 'idx')
+    index = SegmentIndex(directory, mergeFactor=2)
+    crawler = Crawler(path, segmentIndex=index, commitEvery=1, mergeInterval=0.05)
+    crawler.initDB()
+
+    # Поколение индекса фиксируется только после того, как сегмент стал виден читателям
+    generations = []
+    addSegment = index.add_segment
+
+    def add_segment(terms, doc_ids):
+        conn = sqlite3.connect(path)
+        generations.append(conn.execute("SELECT value FROM meta WHERE key = 'index_generation'").fetchone())
+        conn.close()
+        addSegment(terms, doc_ids)
+
+    index.add_segment = add_segment
+    crawler.crawl([site_url + '/p0.html'], 4, maxUrls=7)
+    assert generations == [None] + [(i,) for i in range(1, len(generations))]
+
+    deadline = time.monotonic() + 5
+    while index.stats()['segments'] > 1 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    crawler.close()
+    assert index.mergeThread is None
+    assert index.stats()['segments'] < len(generations)
+
+    searcher = Searcher(path)
+    searcher.verbose = False
+    searcher.useSegments(directory)
+    reference = Searcher(indexed_db[0])
+    reference.verbose = False
+    for query in ('погода', 'город погода', '"погода спорт"'):
+        urls = sorted(url for _, _, (_, url) in searcher.getSortedList(query, k=100))
+        assert urls == sorted(url for _, _, (_, url) in reference.getSortedList(query, k=100))
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import random
+import socket
+import sqlite3
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from cache import QueryCache
+from searcher import Searcher
+from server import SearchService, MAX_PAGE_SIZE
+
+
+def test_query_cache_ignores_stale_generation():
+    cache = QueryCache()
+    cache.put('a', 1, generation=2)
+    # Поток, прочитавший поколение до фиксации новых данных, не сбрасывает кэш и не пишет в него
+    assert cache.get('a', 1) is None
+    cache.put('b', 'old', generation=1)
+    assert cache.get('a', 2) == 1
+    assert cache.get('b', 2) is None
+    assert cache.stats()['stale'] == 2
+
+    cache.put('c', 3, generation=3)
+    assert cache.get('a', 3) is None
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_query_cache_concurrent_access():
+    cache = QueryCache(maxsize=50)
+    generation = [0]
+    gets = [0] * 8
+
+    def worker(n):
+        rng = random.Random(n)
+        for _ in range(3000):
+            if rng.random() < 0.01:
+                generation[0] += 1
+            current = generation[0]
+            key = rng.randrange(100)
+            value = cache.get(key, current)
+            gets[n] += 1
+            if value is None:
+                cache.put(key, (key, current), current)
+            else:
+                # Кэш отдает только значения, вычисленные в поколении, прочитанном потоком
+                assert value == (key, current)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert stats['hits'] + stats['misses'] == sum(gets)
+    assert stats['size'] <= 50
+
+
+class ServiceThread:
+    """ SearchService в фоновом цикле asyncio на свободном порту """
+
+    def __init__(self, service):
+        self.service = service
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(service.handleConnection, '127.0.0.1', 0))
+        self.base = f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def get(self, path):
+        try:
+            with urllib.request.urlopen(self.base + path, timeout=10) as response:
+                return response.status, json.loads(response.read()), response.headers
+        except urllib.error.HTTPError as error:
+            return error.code, json.loads(error.read()), error.headers
+
+    def close(self):
+        self.server.close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.service.executor.shutdown()
+
+
+@pytest.fixture
+def service(indexed_db):
+    service = ServiceThread(SearchService(indexed_db[0], workers=2))
+    yield service
+    service.close()
+
+
+def test_search_pagination(service):
+    status, first, headers = service.get('/search?q=%D0%B3%D0%BE%D1%80%D0%BE%D0%B4&size=2')
+    assert status == 200
+    assert len(first['results']) == 2 and first['has_more']
+    assert 'rank;dur=' in headers['Server-Timing']
+    status, second, _ = service.get('/search?q=%D0%B3%D0%BE%D1%80%D0%BE%D0%B4&size=2&page=2')
+    assert [result['rank'] for result in second['results']] == [3, 4]
+    assert not {r['url_id'] for r in first['results']} & {r['url_id'] for r in second['results']}
+    assert all('<b>город</b>' in result['snippet'] for result in first['results'])
+
+
+@pytest.mark.parametrize('query', ['', '?q=a&page=0', f'?q=a&size={MAX_PAGE_SIZE + 1}', '?q=a&scoring=x',
+                                   '?q=a+NEAR'])
+def test_search_bad_request(service, query):
+    status, body, _ = service.get('/search' + query)
+    assert status == 400 and body['error']
+
+
+def test_unknown_word_is_empty_result(service):
+    status, body, _ = service.get('/search?q=zzzz')
+    assert status == 200 and body['results'] == []
+
+
+def test_service_without_corpus_stats(indexed_db, capsys):
+    db_path = indexed_db[0]
+    conn = sqlite3.connect(db_path)
+    conn.execute("DELETE FROM meta WHERE key IN ('doc_count', 'total_length')")
+    conn.commit()
+    conn.close()
+
+    service = ServiceThread(SearchService(db_path, scoring='bm25'))
+    try:
+        assert service.service.searcher.scoring == 'location'
+        status, body, _ = service.get('/search?q=%D0%B3%D0%BE%D1%80%D0%BE%D0%B4')
+        assert status == 200 and body['results']
+        status, body, _ = service.get('/search?q=%D0%B3%D0%BE%D1%80%D0%BE%D0%B4&scoring=bm25')
+        assert status == 503 and 'TermStatsDAO.rebuild' in body['error']
+    finally:
+        service.close()
+
+
+def raw_status(service, request):
+    """ Код ответа на произвольные байты запроса """
+    host, port = service.base[len('http://'):].split(':')
+    with socket.create_connection((host, int(port)), timeout=10) as sock:
+        sock.sendall(request)
+        return int(sock.makefile('rb').readline().split()[1])
+
+
+@pytest.mark.parametrize('length', [b'abc', b'-5', b'1.5'])
+def test_bad_content_length(service, length):
+    assert raw_status(service, b'GET /health HTTP/1.1\r\nContent-Length: ' + length + b'\r\n\r\n') == 400
+    assert raw_status(service, b'GET /health HTTP/1.1\r\nContent-Length: 2\r\n\r\n{}') == 200
+
+
+def test_page_rank_reloaded_after_recompute(service, indexed_db):
+    query = '/search?q=%D0%B3%D0%BE%D1%80%D0%BE%D0%B4&size=10&snippets=0'
+    _, before, _ = service.get(query)
+    assert service.service.searcher.pageRanks == {}
+
+    # Пересчет PageRank другим экземпляром (как краулер или отдельный процесс) при работающем сервисе
+    writer = Searcher(indexed_db[0])
+    writer.verbose = False
+    writer.calculatePageRank()
+
+    _, after, _ = service.get(query)
+    assert service.service.searcher.pageRanks == dict(writer.page_rank_dao.get_all_page_rank())
+    reference = writer.getSortedList('город', k=10, scoring='bm25')
+    assert [(result['url_id'], result['score']) for result in after['results']] == \
+        [(urlid, pytest.approx(score)) for score, urlid, _ in reference]
+    assert [result['score'] for result in after['results']] != [result['score'] for result in before['results']]
@@ -0,0 +1,57 @@
+import pytest
+
+from crawler import Crawler
+from segments import SegmentIndex
+from searcher import Searcher
+
+
+def snippets(searcher, query):
+    """ {url: текст фрагмента} для всех результатов запроса (id страниц в разных БД могут различаться) """
+    return {url: snippet['text'] for _, _, (_, url), snippet in searcher.getSortedList(query, k=100, highlight=True)}
+
+
+@pytest.fixture
+def segment_searcher(tmp_path, site_url):
+    path = str(tmp_path / 'segments.db')
+    directory = str(tmp_path / 'idx')
+    crawler = Crawler(path, segmentIndex=SegmentIndex(directory), commitEvery=2, mergeInterval=None)
+    crawler.initDB()
+    crawler.crawl([site_url + '/p0.html'], 4, maxUrls=7)
+    crawler.close()
+    searcher = Searcher(path)
+    searcher.verbose = False
+    searcher.useSegments(directory)
+    return searcher
+
+
+@pytest.mark.parametrize('query', ['погода', 'город спорт', 'наука'])
+def test_snippets_from_every_posting_source(indexed_db, segment_searcher, query):
+    reference = Searcher(indexed_db[0])
+    reference.verbose = False
+    reference.snippetWidth = segment_searcher.snippetWidth = 3
+    expected = snippets(reference, query)
+    assert expected and all('<b>' in text for text in expected.values())
+
+    assert snippets(segment_searcher, query) == expected
+    # В режиме сегментов wordlocation пуста: позиции берутся из сегментов
+    statements = []
+    segment_searcher.word_location_dao.conn.set_trace_callback(statements.append)
+    snippets(segment_searcher, query)
+    segment_searcher.word_location_dao.conn.set_trace_callback(None)
+    assert not [sql for sql in statements if 'wordlocation' in sql]
+
+    reference.loadInMemoryIndex()
+    assert snippets(reference, query) == expected
+
+
+def test_snippet_window(indexed_db):
+    searcher = Searcher(indexed_db[0])
+    searcher.verbose = False
+    urlid = searcher.url_dao.get_url_by_value(indexed_db[1] + '/p4.html')
+    # Текст p4 - 'город на реке погода меняется спорт', ссылок на странице нет
+    snippet = searcher.getSnippet(urlid, 'спорт', width=2)
+    assert snippet['end'] - snippet['start'] == 2
+    assert snippet['text'].startswith('...') and 'спорт' in snippet['text']
+    assert searcher.getPositions(searcher.word_dao.get_word_id('спорт'), urlid) == [snippet['end'] - 1]
+    assert searcher.getSnippet(urlid, 'наука', width=2)['start'] == 0
+    assert searcher.getSnippet(10 ** 6, 'спорт') is None